@@ -14,6 +14,7 @@
 
 """Initialization functions for FeynmanCraft ADK Agent."""
 
+import importlib
 import logging
 import os
 
@@ -28,14 +29,22 @@ MODEL = os.getenv("ADK_MODEL_NAME")
 if not MODEL:
     MODEL = "gemini-2.5-flash"
 
-# MODEL needs to be defined before this import
-try:
-    from . import agent  # pylint: disable=wrong-import-position
-    from .agent import root_agent  # Export root_agent for ADK
-except ImportError as e:
-    # Allow package to be imported even without google dependencies
-    logger.warning(f"Could not import agent module: {e}")
-    agent = None
-    root_agent = None
+# MODEL needs to be defined before the agent module is imported. The agent
+# (and through it every sub-agent, tool and SDK) is imported on first access
+# of ``agent`` or ``root_agent``, so importing the package for its tools or
+# CLIs stays cheap.
+def __getattr__(name: str):
+    if name not in ("agent", "root_agent"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        agent = importlib.import_module(f"{__name__}.agent")
+        root_agent = agent.root_agent  # Export root_agent for ADK
+    except ImportError as e:
+        # Allow package to be imported even without google dependencies
+        logger.warning(f"Could not import agent module: {e}")
+        agent = None
+        root_agent = None
+    globals().update(agent=agent, root_agent=root_agent)
+    return globals()[name]
 
 # ADK Application Package 
\ No newline at end of file
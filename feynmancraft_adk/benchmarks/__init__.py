@@ -0,0 +1,23 @@
+"""
+Benchmarks for FeynmanCraft ADK.
+
+Run ``python -m feynmancraft_adk.benchmarks.search --help`` for the search
+latency/recall benchmark over synthetic knowledge bases; run_benchmark and
+compare_reports live in benchmarks.search. ``python -m
+feynmancraft_adk.benchmarks.importtime`` checks package import times
+against their budgets (see benchmarks.importtime).
+"""
+
+from .synthetic import (
+    RandomProjectionEmbeddingProvider,
+    generate_dataset,
+    synthetic_record,
+    synthetic_rule,
+)
+
+__all__ = [
+    "RandomProjectionEmbeddingProvider",
+    "generate_dataset",
+    "synthetic_record",
+    "synthetic_rule",
+]
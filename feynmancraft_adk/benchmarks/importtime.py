@@ -0,0 +1,247 @@
+"""
+Import-time benchmark.
+
+Each module is imported in fresh interpreters run with ``-X importtime``;
+the per-module timings written to stderr are parsed and the median
+cumulative import time over the runs is reported, together with the
+slowest imports it pulled in. Every module has a budget:
+
+- max_ms: median cumulative import time, in milliseconds
+- forbidden: modules that must not be imported as a side effect (heavy
+  dependencies such as the Gemini SDK that are deferred to first use)
+
+The command exits with status 1 if a budget is exceeded or, given a
+previous report as --baseline, if an import got more than --tolerance
+(relative) slower.
+
+Usage:
+    python -m feynmancraft_adk.benchmarks.importtime --output imports.json
+    python -m feynmancraft_adk.benchmarks.importtime --baseline imports.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+_HEAVY = ["google.generativeai", "google.adk", "annoy", "numpy"]
+
+# Budgets of the import paths used by CLIs, batch workers and the server
+DEFAULT_BUDGETS: Dict[str, Dict[str, Any]] = {
+    "feynmancraft_adk": {"max_ms": 100, "forbidden": _HEAVY + ["feynmancraft_adk.agent"]},
+    "feynmancraft_adk.tools": {"max_ms": 100, "forbidden": _HEAVY},
+    "feynmancraft_adk.tools.kb": {"max_ms": 100, "forbidden": _HEAVY},
+    "feynmancraft_adk.shared_libraries.config": {"max_ms": 150, "forbidden": _HEAVY},
+    "feynmancraft_adk.tools.kb.records": {"max_ms": 400, "forbidden": ["google.generativeai", "annoy"]},
+    "feynmancraft_adk.tools.kb.local": {"max_ms": 600, "forbidden": ["google.generativeai", "annoy"]},
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, float]]:
+    """
+    Parse ``-X importtime`` output.
+
+    Args:
+        stderr: Standard error of the interpreter
+
+    Returns:
+        Mapping of module name to its self and cumulative import time in
+        milliseconds and its nesting depth
+    """
+    modules: Dict[str, Dict[str, float]] = {}
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2,
+            }
+    return modules
+
+
+def measure_import(module: str, runs: int = 5, python: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Measure the import time of a module in fresh interpreters.
+
+    Args:
+        module: Dotted module name
+        runs: Interpreters to start; the median is reported
+        python: Interpreter to run (defaults to the current one)
+
+    Returns:
+        Median and per-run cumulative milliseconds, the modules imported
+        and the slowest imports of the median run
+    """
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # Make the package importable from a source checkout
+    package_root = str(Path(__file__).resolve().parents[2])
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+
+    samples = []
+    for _ in range(max(1, runs)):
+        result = subprocess.run(
+            [python or sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+        timings = parse_importtime(result.stderr)
+        if module not in timings:
+            raise RuntimeError(f"No import timing for {module}")
+        samples.append(timings)
+
+    samples.sort(key=lambda timings: timings[module]["cumulative_ms"])
+    median = samples[len(samples) // 2]
+    slowest = sorted(
+        (name for name in median if name != module),
+        key=lambda name: median[name]["self_ms"],
+        reverse=True,
+    )[:10]
+    return {
+        "module": module,
+        "cumulative_ms": statistics.median(timings[module]["cumulative_ms"] for timings in samples),
+        "runs_ms": [timings[module]["cumulative_ms"] for timings in samples],
+        "imported": sorted(median),
+        "slowest": {name: median[name]["self_ms"] for name in slowest},
+    }
+
+
+def check_budget(measurement: Dict[str, Any], budget: Dict[str, Any]) -> List[str]:
+    """
+    Check a measurement against a module's budget.
+
+    Returns:
+        Human-readable violations (empty if none)
+    """
+    module = measurement["module"]
+    violations = []
+    max_ms = budget.get("max_ms")
+    if max_ms is not None and measurement["cumulative_ms"] > max_ms:
+        violations.append(f"{module}: import took {measurement['cumulative_ms']:.1f}ms (budget {max_ms}ms)")
+    imported = set(measurement["imported"])
+    for name in budget.get("forbidden", []):
+        if name in imported:
+            violations.append(f"{module}: imports {name}")
+    return violations
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float = 0.25,
+    min_delta_ms: float = 5.0
+) -> List[str]:
+    """
+    Find import-time regressions of a report against a baseline.
+
+    An import more than tolerance (relative) and min_delta_ms (absolute)
+    slower than in the baseline is a regression; the absolute floor keeps
+    small imports from failing on timer noise.
+
+    Args:
+        baseline: Earlier report
+        current: New report
+        tolerance: Allowed relative slowdown
+        min_delta_ms: Slowdowns below this many milliseconds are ignored
+
+    Returns:
+        Human-readable regression descriptions (empty if none)
+    """
+    before_by_module = {m["module"]: m for m in baseline.get("modules", [])}
+    regressions = []
+    for measurement in current.get("modules", []):
+        old = before_by_module.get(measurement["module"])
+        if old is None:
+            continue
+        before, after = old["cumulative_ms"], measurement["cumulative_ms"]
+        if after > before * (1 + tolerance) and after - before > min_delta_ms:
+            new_imports = sorted(set(measurement["imported"]) - set(old["imported"]))
+            regressions.append(
+                f"{measurement['module']}: {before:.1f}ms -> {after:.1f}ms"
+                + (f" (new imports: {', '.join(new_imports[:5])})" if new_imports else "")
+            )
+    return regressions
+
+
+def run_benchmark(
+    budgets: Optional[Dict[str, Dict[str, Any]]] = None,
+    runs: int = 5
+) -> Dict[str, Any]:
+    """
+    Measure every budgeted module.
+
+    Args:
+        budgets: Module budgets (defaults to DEFAULT_BUDGETS)
+        runs: Interpreters per module
+
+    Returns:
+        Report with the measurements and budget violations
+    """
+    budgets = DEFAULT_BUDGETS if budgets is None else budgets
+    measurements, violations = [], []
+    for module, budget in budgets.items():
+        measurement = measure_import(module, runs)
+        measurement["budget"] = budget
+        measurements.append(measurement)
+        violations += check_budget(measurement, budget)
+        logger.info(f"{module}: {measurement['cumulative_ms']:.1f}ms")
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "modules": measurements,
+        "violations": violations,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark package import times with -X importtime.")
+    parser.add_argument("--modules", nargs="+", default=None,
+                        help="Modules to measure (default: every module with a budget)")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreters per module")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Earlier report; exit with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    budgets = DEFAULT_BUDGETS
+    if args.modules:
+        budgets = {module: DEFAULT_BUDGETS.get(module, {}) for module in args.modules}
+    report = run_benchmark(budgets, args.runs)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+        logger.info(f"Wrote report to {args.output}")
+    else:
+        print(text)
+
+    failures = list(report["violations"])
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures += compare_reports(json.load(f), report, args.tolerance)
+    for failure in failures:
+        logger.warning(f"Regression: {failure}")
+    if failures:
+        return 1
+    logger.info("Import times within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
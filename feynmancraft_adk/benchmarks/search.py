@@ -0,0 +1,553 @@
+"""
+Search benchmark over synthetic knowledge bases.
+
+For every KB size and vector index engine, a fresh worker process is pointed
+at a generated data directory (FEYNMAN_DATA_DIR) and measures:
+
+- build: KB load, embedding, index build and index load times
+- size: KB file, vector index and embedding store bytes on disk
+- memory: resident set size after each phase and the peak
+- queries: p50/p95/p99 latency and recall@k of LocalKBTool.vector_search,
+  keyword_search and hybrid_search, search_local_tikz_examples and
+  search_physics_rules; vector_search also reports ANN recall against an
+  exact scan, and with --quantization search_local_tikz_examples reports the
+  quantized store index's recall against an exact scan and its code size
+
+Each run uses its own process, so memory figures and module-level caches
+are not shared between runs. The report is JSON; pass a previous report as
+--baseline to flag latency, recall and build-time regressions.
+
+Usage:
+    python -m feynmancraft_adk.benchmarks.search --sizes 1000 10000 100000 \\
+        --engines exact annoy --output bench.json
+    python -m feynmancraft_adk.benchmarks.search --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+from .synthetic import RANDOM_PROJECTION_MODEL, generate_dataset
+
+logger = logging.getLogger(__name__)
+
+REPORT_SCHEMA_VERSION = 1
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size, where /proc is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _files_size(paths: Sequence[Path]) -> int:
+    return sum(path.stat().st_size for path in paths if path.is_file())
+
+
+def _stem_size(stem: Path) -> int:
+    """Total size of the files written under a stem (<stem>.*)."""
+    return _files_size(list(stem.parent.glob(stem.name + ".*")))
+
+
+def latency_summary(latencies: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize per-query latencies.
+
+    Args:
+        latencies: Latencies in seconds
+
+    Returns:
+        Dictionary with p50/p95/p99/mean/max in milliseconds and queries per second
+    """
+    if not latencies:
+        return {}
+    ms = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    total = float(np.sum(latencies))
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+        "qps": len(latencies) / total if total > 0 else 0.0,
+    }
+
+
+def recall_at_k(retrieved: Sequence[int], relevant: Sequence[int], k: int) -> float:
+    """
+    Fraction of the relevant items found in the top k.
+
+    The denominator is capped at k, so a query with more than k relevant
+    items scores 1.0 when all k results are relevant.
+    """
+    if not relevant:
+        return 1.0
+    hits = len(set(retrieved[:k]) & set(relevant))
+    return hits / min(k, len(relevant))
+
+
+def _kb_position(result: Dict[str, Any]) -> Optional[int]:
+    source = result.get("source", "")
+    if not source.startswith("synthetic://kb/"):
+        return None
+    return int(source.rsplit("/", 1)[1])
+
+
+def _rule_position(result: Dict[str, Any]) -> Optional[int]:
+    number = result.get("rule_number")
+    return number - 1 if isinstance(number, int) else None
+
+
+def _measure(
+    run: Callable[[str], List[Dict[str, Any]]],
+    queries: List[Dict[str, Any]],
+    k: int,
+    warmup: int,
+    position_of: Callable[[Dict[str, Any]], Optional[int]]
+) -> Dict[str, Any]:
+    """Time a search callable over the query set and score its recall."""
+    for query in queries[:warmup]:
+        run(query["query"])
+
+    latencies, recalls, errors = [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        results = run(query["query"])
+        latencies.append(time.perf_counter() - start)
+
+        if any("error" in r for r in results):
+            errors += 1
+        positions = [p for p in map(position_of, results) if p is not None]
+        recalls.append(recall_at_k(positions, query["relevant"], k))
+
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        **latency_summary(latencies),
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+    }
+
+
+def _run_worker(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Benchmark one (dataset, engine) combination in this process.
+
+    The environment (FEYNMAN_DATA_DIR, EMBEDDING_MODEL, VECTOR_INDEX_ENGINE,
+    EMBEDDING_QUANTIZATION, ...)
+    is set by the parent before the package configuration is imported.
+    """
+    memory = {"baseline_rss": _rss_bytes()}
+    timings: Dict[str, float] = {}
+
+    from ..shared_libraries.config import config
+    from ..tools.kb import local
+    from ..tools.kb.embedding_manager import get_kb_manager
+    from ..tools.kb.embedding_providers import register_embedding_provider
+    from ..tools.kb.search import search_local_tikz_examples
+    from ..tools.kb.vector_index import ExactIndex
+    from ..tools.physics.embedding_manager import get_rules_manager
+    from ..tools.physics.search import search_physics_rules
+    from .synthetic import RandomProjectionEmbeddingProvider
+
+    register_embedding_provider(
+        RANDOM_PROJECTION_MODEL,
+        lambda name: RandomProjectionEmbeddingProvider(name, dim=config.models.embedding_dim),
+    )
+    manager = get_kb_manager()
+    rules_manager = get_rules_manager()
+
+    k, warmup = spec["k"], spec["warmup"]
+    with open(Path(spec["data_dir"]) / "queries.json", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    start = time.perf_counter()
+    tool = local.LocalKBTool()
+    timings["load_seconds"] = time.perf_counter() - start
+    memory["after_load_rss"] = _rss_bytes()
+
+    start = time.perf_counter()
+    manager.refresh_embeddings(list(tool.snapshot().records))
+    timings["embed_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tool.build_index(force_rebuild=True)
+    timings["index_build_seconds"] = time.perf_counter() - start
+    build_state = local.get_index_build_state()
+    if build_state["status"] != "ready":
+        raise RuntimeError(f"Index build failed: {build_state.get('error')}")
+
+    # Drop the freshly built index to time a cold load from disk
+    local._snapshot = replace(local._snapshot, index=None, id_map=None)
+    start = time.perf_counter()
+    tool._load_index()
+    timings["index_load_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    asyncio.run(rules_manager.initialize())
+    timings["rules_embed_seconds"] = time.perf_counter() - start
+    memory["after_build_rss"] = _rss_bytes()
+
+    def run_async(search):
+        loop = asyncio.new_event_loop()
+        return lambda query: loop.run_until_complete(search(query, k))
+
+    kb_runs = {
+        "vector_search": lambda query: tool.vector_search(query, k),
+        "keyword_search": lambda query: tool.keyword_search(query, k),
+        "hybrid_search": lambda query: tool.hybrid_search(query, k),
+        "search_local_tikz_examples": run_async(search_local_tikz_examples),
+    }
+    operations = {
+        name: _measure(run, queries["kb"], k, warmup, _kb_position)
+        for name, run in kb_runs.items()
+    }
+    operations["search_physics_rules"] = _measure(
+        run_async(search_physics_rules), queries["rules"], k, warmup, _rule_position
+    )
+
+    # ANN recall: the configured engine (and the quantized store index, if
+    # any) against an exact scan of the same vectors
+    index, _ = tool._load_index()
+    exact = ExactIndex.from_matrix(manager.embedding_matrix, manager.matrix_rows)
+    store_index = manager.vector_index
+    ann_recalls, store_recalls = [], []
+    for query in queries["kb"]:
+        embedding = tool.get_embedding(query["query"])
+        if embedding is None:
+            continue
+        exact_ids, _ = exact.search(embedding, k)
+        ann_ids, _ = index.search(embedding, k)
+        ann_recalls.append(recall_at_k(list(ann_ids), list(exact_ids), k))
+        store_ids, _ = store_index.search(embedding, k)
+        store_recalls.append(recall_at_k(list(store_ids), list(exact_ids), k))
+    del exact
+    operations["vector_search"]["ann_recall_at_k"] = float(np.mean(ann_recalls)) if ann_recalls else 0.0
+    if store_index.engine != "exact":
+        operations["search_local_tikz_examples"]["ann_recall_at_k"] = (
+            float(np.mean(store_recalls)) if store_recalls else 0.0
+        )
+
+    memory["after_queries_rss"] = _rss_bytes()
+    memory["peak_rss"] = _peak_rss_bytes()
+
+    kb_config = config.knowledge_base
+    return {
+        "records": len(tool.snapshot().records),
+        "rules": len(rules_manager.physics_rules),
+        "engine": kb_config.vector_index_engine,
+        "index_params": index.params,
+        "quantization": kb_config.embedding_quantization,
+        "quantized_code_bytes": getattr(store_index, "code_bytes", None),
+        "full_matrix_bytes": int(np.prod(manager.embedding_matrix.shape)) * 4,
+        "embedding_model": manager.model_name,
+        "dim": config.models.embedding_dim,
+        "k": k,
+        "build": timings,
+        "size_bytes": {
+            "kb_json": _files_size([kb_config.local_kb_path]),
+            "vector_index": _stem_size(kb_config.index_stem(manager.model_name)),
+            "kb_embeddings": _stem_size(manager.store_path),
+            "rules_embeddings": _stem_size(rules_manager.store_path),
+        },
+        "memory_bytes": memory,
+        "operations": operations,
+    }
+
+
+def _spawn_worker(spec: Dict[str, Any], env: Dict[str, str], timeout: Optional[float]) -> Dict[str, Any]:
+    """Run one benchmark in a fresh interpreter and return its result."""
+    spec_path = Path(spec["data_dir"]) / "bench_spec.json"
+    result_path = Path(spec["data_dir"]) / "bench_result.json"
+    spec = {**spec, "result_path": str(result_path)}
+    with open(spec_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    result_path.unlink(missing_ok=True)
+
+    completed = subprocess.run(
+        [sys.executable, "-m", f"{__package__}.search", "--worker", str(spec_path)],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    if completed.returncode != 0 or not result_path.exists():
+        tail = "\n".join(completed.stderr.strip().splitlines()[-10:])
+        raise RuntimeError(f"Benchmark worker failed (exit {completed.returncode}):\n{tail}")
+    with open(result_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _package_version() -> Optional[str]:
+    version_file = Path(__file__).resolve().parents[2] / "VERSION"
+    try:
+        return version_file.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def run_benchmark(
+    sizes: Sequence[int],
+    engines: Sequence[str],
+    embedding_model: str = RANDOM_PROJECTION_MODEL,
+    dim: int = 128,
+    rules_size: Optional[int] = None,
+    num_queries: int = 200,
+    k: int = 10,
+    warmup: int = 10,
+    seed: int = 0,
+    work_dir: Optional[Path] = None,
+    keep_data: bool = False,
+    timeout: Optional[float] = None,
+    quantization: str = "none"
+) -> Dict[str, Any]:
+    """
+    Benchmark every size x engine combination.
+
+    Args:
+        sizes: KB record counts to generate
+        engines: Vector index engines (see tools.kb.vector_index)
+        embedding_model: "bench-random" (fast random projections) or a
+            registered provider such as "local-hashing"
+        dim: Embedding dimension
+        rules_size: Physics rule count (defaults to each KB size)
+        num_queries: Queries per operation
+        k: Results per query, also the recall cutoff
+        warmup: Untimed queries run before each operation
+        seed: Dataset seed
+        work_dir: Directory for generated data (a temporary one by default)
+        keep_data: Keep the generated data and indexes
+        timeout: Per-run timeout in seconds
+        quantization: Embedding store quantization for the KB and rules
+            managers: "none", "int8" or "pq"
+
+    Returns:
+        Report dictionary (see REPORT_SCHEMA_VERSION)
+    """
+    root = Path(work_dir) if work_dir else Path(tempfile.mkdtemp(prefix="feynman-bench-"))
+    runs: List[Dict[str, Any]] = []
+
+    try:
+        for size in sizes:
+            data_dir = root / f"kb-{size}"
+            start = time.perf_counter()
+            dataset = generate_dataset(data_dir, size, rules_size, num_queries, seed)
+            dataset["generate_seconds"] = time.perf_counter() - start
+            logger.info(f"Generated {size} records in {dataset['generate_seconds']:.1f}s")
+
+            for engine in engines:
+                # Every run embeds and indexes from scratch
+                shutil.rmtree(data_dir / "embeddings", ignore_errors=True)
+                env = {
+                    "FEYNMAN_DATA_DIR": str(data_dir),
+                    "EMBEDDING_MODEL": embedding_model,
+                    "EMBEDDING_DIM": str(dim),
+                    "EMBEDDING_CACHE_ENABLED": "false",
+                    "VECTOR_INDEX_ENGINE": engine,
+                    "EMBEDDING_QUANTIZATION": quantization,
+                }
+                spec = {"data_dir": str(data_dir), "k": k, "warmup": warmup}
+                logger.info(f"Benchmarking {size} records with the {engine} engine")
+                try:
+                    result = _spawn_worker(spec, env, timeout)
+                except Exception as e:
+                    logger.error(f"Run {size}/{engine} failed: {e}")
+                    result = {
+                        "records": size,
+                        "engine": engine,
+                        "quantization": quantization,
+                        "error": str(e),
+                    }
+                result["dataset"] = dataset
+                runs.append(result)
+    finally:
+        if not keep_data and not work_dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "schema_version": REPORT_SCHEMA_VERSION,
+        "package_version": _package_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "settings": {
+            "sizes": list(sizes),
+            "engines": list(engines),
+            "quantization": quantization,
+            "embedding_model": embedding_model,
+            "dim": dim,
+            "rules_size": rules_size,
+            "queries": num_queries,
+            "k": k,
+            "warmup": warmup,
+            "seed": seed,
+        },
+        "runs": runs,
+    }
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    latency_tolerance: float = 0.25,
+    recall_tolerance: float = 0.02
+) -> List[str]:
+    """
+    Find regressions of a report against a baseline.
+
+    Runs are matched by record count, engine, quantization and embedding
+    model. A p95 latency or build time more than latency_tolerance
+    (relative) above the baseline, or a recall more than recall_tolerance
+    (absolute) below it, is a regression.
+
+    Args:
+        baseline: Earlier report
+        current: New report
+        latency_tolerance: Allowed relative slowdown
+        recall_tolerance: Allowed absolute recall drop
+
+    Returns:
+        Human-readable regression descriptions (empty if none)
+    """
+    def key(run):
+        return (
+            run.get("records"),
+            run.get("engine"),
+            run.get("quantization", "none"),
+            run.get("embedding_model"),
+        )
+
+    baseline_runs = {key(run): run for run in baseline.get("runs", []) if "error" not in run}
+    regressions = []
+
+    for run in current.get("runs", []):
+        name = f"{run.get('records')} records/{run.get('engine')}"
+        if "error" in run:
+            regressions.append(f"{name}: run failed ({run['error'].splitlines()[0]})")
+            continue
+        old = baseline_runs.get(key(run))
+        if old is None:
+            continue
+
+        for metric in ("index_build_seconds", "embed_seconds"):
+            before, after = old["build"].get(metric), run["build"].get(metric)
+            if before and after and after > before * (1 + latency_tolerance):
+                regressions.append(f"{name}: {metric} {before:.3f}s -> {after:.3f}s")
+
+        for operation, stats in run["operations"].items():
+            old_stats = old["operations"].get(operation)
+            if not old_stats:
+                continue
+            before, after = old_stats.get("p95_ms"), stats.get("p95_ms")
+            if before and after and after > before * (1 + latency_tolerance):
+                regressions.append(f"{name}: {operation} p95 {before:.2f}ms -> {after:.2f}ms")
+            for metric in ("recall_at_k", "ann_recall_at_k"):
+                before, after = old_stats.get(metric), stats.get(metric)
+                if before is not None and after is not None and after < before - recall_tolerance:
+                    regressions.append(f"{name}: {operation} {metric} {before:.3f} -> {after:.3f}")
+
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark KB and physics rule search on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="KB record counts (up to 1000000)")
+    parser.add_argument("--engines", nargs="+", default=["exact", "annoy"],
+                        help="Vector index engines: exact, annoy, hnsw, int8, pq")
+    parser.add_argument("--quantization", default="none", choices=["none", "int8", "pq"],
+                        help="Quantized search over the KB and rules embedding stores")
+    parser.add_argument("--embedding-model", default=RANDOM_PROJECTION_MODEL,
+                        help="bench-random (fast) or local-hashing (realistic, slower)")
+    parser.add_argument("--dim", type=int, default=128, help="Embedding dimension")
+    parser.add_argument("--rules-size", type=int, default=None,
+                        help="Physics rule count (defaults to each KB size)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per operation")
+    parser.add_argument("--k", type=int, default=10, help="Results per query and recall cutoff")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed warmup queries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, default=None,
+                        help="Keep generated data and indexes here")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-run timeout in seconds")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Earlier report; exit with status 1 on regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25)
+    parser.add_argument("--recall-tolerance", type=float, default=0.02)
+    parser.add_argument("--worker", type=Path, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        with open(args.worker, encoding="utf-8") as f:
+            spec = json.load(f)
+        result = _run_worker(spec)
+        with open(spec["result_path"], "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    report = run_benchmark(
+        sizes=args.sizes,
+        engines=args.engines,
+        embedding_model=args.embedding_model,
+        dim=args.dim,
+        rules_size=args.rules_size,
+        num_queries=args.queries,
+        k=args.k,
+        warmup=args.warmup,
+        seed=args.seed,
+        work_dir=args.work_dir,
+        timeout=args.timeout,
+        quantization=args.quantization,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+        logger.info(f"Wrote report to {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_reports(
+                json.load(f), report, args.latency_tolerance, args.recall_tolerance
+            )
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logger.info("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+Synthetic knowledge bases and rule sets for benchmarks.
+
+Records follow the feynman_kb.json and pprules.json schemas and are generated
+deterministically from (seed, position), so any record can be regenerated
+without materializing the whole set. Every record has a relevance key (its
+reaction plus context phrase); benchmark queries are paraphrases of one
+record, and every record sharing its key counts as relevant.
+
+RandomProjectionEmbeddingProvider gives cheap, deterministic embeddings for
+records at 1M scale: each word maps to a fixed random vector and a text is the
+normalized sum of its word vectors, so overlapping texts land close together.
+"""
+
+import json
+import random
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..tools.kb.embedding_providers import EmbeddingProvider
+
+RANDOM_PROJECTION_MODEL = "bench-random"
+
+# (LaTeX, English name) of the particles records are built from
+PARTICLES: Sequence[Tuple[str, str]] = (
+    ("e^-", "electron"), ("e^+", "positron"), ("\\mu^-", "muon"), ("\\mu^+", "antimuon"),
+    ("\\tau^-", "tau"), ("\\tau^+", "antitau"), ("\\nu_e", "electron neutrino"),
+    ("\\bar{\\nu}_e", "electron antineutrino"), ("\\nu_\\mu", "muon neutrino"),
+    ("\\bar{\\nu}_\\mu", "muon antineutrino"), ("u", "up quark"), ("\\bar{u}", "anti-up quark"),
+    ("d", "down quark"), ("\\bar{d}", "anti-down quark"), ("s", "strange quark"),
+    ("c", "charm quark"), ("b", "bottom quark"), ("\\bar{b}", "anti-bottom quark"),
+    ("t", "top quark"), ("\\bar{t}", "anti-top quark"), ("\\gamma", "photon"), ("g", "gluon"),
+    ("Z^0", "Z boson"), ("W^+", "W plus boson"), ("W^-", "W minus boson"), ("H", "Higgs boson"),
+    ("\\pi^0", "neutral pion"), ("\\pi^+", "charged pion"), ("K^0", "neutral kaon"),
+    ("p", "proton"), ("n", "neutron"), ("\\Lambda^0", "lambda baryon"),
+)
+
+PROCESS_TYPES: Sequence[str] = ("decay", "scattering", "annihilation", "vertex")
+
+CONTEXTS: Sequence[str] = (
+    "at tree level", "at one loop", "in the s-channel", "in the t-channel",
+    "with initial state radiation", "with final state radiation", "via a virtual boson",
+    "in the Standard Model", "at high energy", "near threshold", "with a box diagram",
+    "with a penguin diagram",
+)
+
+RULE_CATEGORIES: Sequence[str] = (
+    "Standard Model", "QED", "QCD", "Weak Interactions", "Electroweak Theory",
+    "Higgs Physics", "Neutrino Physics", "Flavor Physics", "Conservation Laws",
+    "Symmetries", "CP Violation", "Kinematics",
+)
+
+RULE_QUANTITIES: Sequence[str] = (
+    "electric charge", "lepton number", "baryon number", "strangeness", "isospin",
+    "parity", "charge conjugation", "angular momentum", "energy", "momentum",
+    "colour charge", "weak hypercharge", "flavour",
+)
+
+RULE_STATEMENTS: Sequence[str] = (
+    "is conserved in every {interaction} interaction involving {particle}",
+    "may be violated by the {interaction} interaction when {particle} is produced",
+    "restricts which final states are allowed for {particle} in {interaction} processes",
+    "must be checked at each vertex where {particle} couples through the {interaction} force",
+)
+
+INTERACTIONS: Sequence[str] = ("strong", "electromagnetic", "weak", "electroweak")
+
+
+def _rng(seed: int, position: int, salt: int = 0) -> random.Random:
+    return random.Random((seed * 1_000_003 + position) * 31 + salt)
+
+
+def synthetic_record(position: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Generate one KB record in the feynman_kb.json schema.
+
+    Args:
+        position: Record position (also used to make the source unique)
+        seed: Dataset seed
+
+    Returns:
+        KB record dictionary
+    """
+    rng = _rng(seed, position)
+    process_type = rng.choice(PROCESS_TYPES)
+    incoming = rng.sample(PARTICLES, 1 if process_type in ("decay", "vertex") else 2)
+    outgoing = rng.sample(PARTICLES, 2)
+    context = rng.choice(CONTEXTS)
+
+    reaction = " ".join(p[0] for p in incoming) + " \\to " + " ".join(p[0] for p in outgoing)
+    in_names = " and ".join(p[1] for p in incoming)
+    out_names = " and ".join(p[1] for p in outgoing)
+
+    return {
+        "topic": f"{in_names} {process_type} {context}",
+        "reaction": reaction,
+        "particles": [p[0] for p in incoming + outgoing],
+        "description": f"{process_type.capitalize()} of {in_names} into {out_names} {context}.",
+        "tikz": (
+            "\\begin{tikzpicture}[thick]\n"
+            "  \\coordinate (v) at (0,0);\n"
+            + "".join(
+                f"  \\draw[fermion] ({-1.5},{i}) node[left] {{${p[0]}$}} -- (v);\n"
+                for i, p in enumerate(incoming)
+            )
+            + "".join(
+                f"  \\draw[fermion] (v) -- ({1.5},{i}) node[right] {{${p[0]}$}};\n"
+                for i, p in enumerate(outgoing)
+            )
+            + "\\end{tikzpicture}"
+        ),
+        "source": f"synthetic://kb/{position}",
+        "process_type": process_type,
+        "source_type": "synthetic",
+    }
+
+
+def record_key(record: Dict[str, Any]) -> str:
+    """Relevance key of a KB record: records with the same key answer the same query."""
+    context = next((c for c in CONTEXTS if record.get("topic", "").endswith(c)), "")
+    return f"{record.get('reaction', '')}|{context}"
+
+
+def record_query(record: Dict[str, Any], seed: int = 0, position: int = 0) -> str:
+    """Paraphrase a KB record into a natural-language query."""
+    rng = _rng(seed, position, salt=1)
+    templates = (
+        "Feynman diagram for {topic}",
+        "draw the {topic}",
+        "{reaction} {context}",
+        "how does {topic} look",
+    )
+    context = next((c for c in CONTEXTS if record["topic"].endswith(c)), "")
+    return rng.choice(templates).format(
+        topic=record["topic"],
+        reaction=record["reaction"],
+        context=context,
+    )
+
+
+def synthetic_rule(position: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Generate one physics rule in the pprules.json schema.
+
+    Args:
+        position: Rule position; rule numbers start at 1
+        seed: Dataset seed
+
+    Returns:
+        Rule dictionary
+    """
+    rng = _rng(seed, position, salt=2)
+    quantity = rng.choice(RULE_QUANTITIES)
+    statement = rng.choice(RULE_STATEMENTS).format(
+        interaction=rng.choice(INTERACTIONS),
+        particle=rng.choice(PARTICLES)[1],
+    )
+    return {
+        "rule_number": position + 1,
+        "title": f"{quantity.capitalize()} rule",
+        "content": f"{quantity.capitalize()} {statement}.",
+        "category": rng.choice(RULE_CATEGORIES),
+    }
+
+
+def rule_key(rule: Dict[str, Any]) -> str:
+    """Relevance key of a rule: its statement."""
+    return rule["content"]
+
+
+def rule_query(rule: Dict[str, Any]) -> str:
+    """Paraphrase a rule into a query."""
+    return f"which rule says {rule['content'][:-1].lower()}"
+
+
+def _write_json_array(path: Path, items: Iterable[Dict[str, Any]], prefix: str = "", suffix: str = ""):
+    """Stream items to a JSON array without holding them all in memory."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prefix + "[\n")
+        for i, item in enumerate(items):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+        f.write("\n]" + suffix)
+    tmp_path.replace(path)
+
+
+def _tracking(items: Iterable[Dict[str, Any]], key, relevant: Dict[str, List[int]]):
+    """Yield items, recording the positions of those whose key is in relevant."""
+    for position, item in enumerate(items):
+        positions = relevant.get(key(item))
+        if positions is not None:
+            positions.append(position)
+        yield item
+
+
+def generate_dataset(
+    data_dir: Path,
+    size: int,
+    rules_size: Optional[int] = None,
+    num_queries: int = 200,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Write a synthetic KB, rule set and query set to a data directory.
+
+    The directory gets feynman_kb.json, pprules.json and queries.json, so it
+    can be used as FEYNMAN_DATA_DIR. Records are streamed to disk, so memory
+    use does not grow with size.
+
+    Args:
+        data_dir: Target directory (created if missing)
+        size: Number of KB records
+        rules_size: Number of physics rules (defaults to size)
+        num_queries: Number of KB and rule queries each
+        seed: Dataset seed
+
+    Returns:
+        Summary with the record counts and file sizes in bytes
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    rules_size = size if rules_size is None else rules_size
+    sampler = random.Random(seed)
+
+    kb_sources = [sampler.randrange(size) for _ in range(num_queries)] if size else []
+    rule_sources = [sampler.randrange(rules_size) for _ in range(num_queries)] if rules_size else []
+    kb_items = [synthetic_record(i, seed) for i in kb_sources]
+    rule_items = [synthetic_rule(i, seed) for i in rule_sources]
+    kb_relevant: Dict[str, List[int]] = {record_key(r): [] for r in kb_items}
+    rule_relevant: Dict[str, List[int]] = {rule_key(r): [] for r in rule_items}
+
+    _write_json_array(
+        data_dir / "feynman_kb.json",
+        _tracking((synthetic_record(i, seed) for i in range(size)), record_key, kb_relevant),
+    )
+    _write_json_array(
+        data_dir / "pprules.json",
+        _tracking((synthetic_rule(i, seed) for i in range(rules_size)), rule_key, rule_relevant),
+        prefix=(
+            '{"metadata": {"title": "Synthetic rules", "total_rules": '
+            f'{rules_size}, "format_version": "1.1"}}, '
+            f'"categories": {json.dumps(list(RULE_CATEGORIES))}, "rules": '
+        ),
+        suffix="}",
+    )
+
+    queries = {
+        "kb": [
+            {"query": record_query(r, seed, i), "source": i, "relevant": kb_relevant[record_key(r)]}
+            for i, r in zip(kb_sources, kb_items)
+        ],
+        "rules": [
+            {"query": rule_query(r), "source": i, "relevant": rule_relevant[rule_key(r)]}
+            for i, r in zip(rule_sources, rule_items)
+        ],
+    }
+    with open(data_dir / "queries.json", "w", encoding="utf-8") as f:
+        json.dump(queries, f)
+
+    return {
+        "records": size,
+        "rules": rules_size,
+        "queries": num_queries,
+        "kb_file_bytes": (data_dir / "feynman_kb.json").stat().st_size,
+        "rules_file_bytes": (data_dir / "pprules.json").stat().st_size,
+    }
+
+
+class RandomProjectionEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic bag-of-words random projections.
+
+    Each lowercase word gets a Gaussian vector seeded by its CRC32; a text
+    embeds to the L2-normalized sum of its word vectors. Word vectors are
+    memoized, so embedding a large synthetic KB costs a few vector additions
+    per record.
+    """
+
+    remote = False
+
+    def __init__(self, name: str = RANDOM_PROJECTION_MODEL, dim: int = 768):
+        self.name = name
+        self.dim = dim
+        self._word_vectors: Dict[str, np.ndarray] = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        embeddings = []
+        for text in texts:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in text.lower().split():
+                vector += self._word_vector(word.strip(".,|:;()"))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+            embeddings.append(vector.tolist())
+        return embeddings
@@ -47,6 +47,11 @@ class ParticlePhysicsMCPClient:
         self._connected = False
         self._lock = asyncio.Lock()
         
+    @property
+    def is_connected(self) -> bool:
+        """Whether the server process is running and initialized."""
+        return self._connected and self.process is not None and self.process.returncode is None
+    
     async def connect(self):
         """Connect to the MCP server."""
         async with self._lock:
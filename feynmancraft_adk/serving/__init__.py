@@ -0,0 +1,38 @@
+"""
+Multi-worker serving support for FeynmanCraft ADK.
+
+Use ``gunicorn -c python:feynmancraft_adk.serving.gunicorn_conf <app>`` to
+preload the search state in the master process and share it with every
+worker (see serving.preload), serving.reload to hot-reload the KB and
+physics rules in running workers, and serving.warmup to warm the search
+tools in each worker before it reports ready.
+"""
+
+from .preload import (
+    log_worker_memory,
+    memory_usage,
+    preload_shared_state,
+    worker_memory_report,
+)
+from .reload import (
+    ReloadWatcher,
+    reload_search_state,
+    start_reload_watcher,
+    stop_reload_watcher,
+)
+from .warmup import is_ready, prefault, warmup, warmup_report
+
+__all__ = [
+    "ReloadWatcher",
+    "is_ready",
+    "log_worker_memory",
+    "memory_usage",
+    "prefault",
+    "preload_shared_state",
+    "reload_search_state",
+    "start_reload_watcher",
+    "stop_reload_watcher",
+    "warmup",
+    "warmup_report",
+    "worker_memory_report",
+]
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for serving with preloaded, shared search state.
+
+    gunicorn -c python:feynmancraft_adk.serving.gunicorn_conf <module>:<app>
+
+Workers, worker class and bind address come from ServingConfig
+(WEB_CONCURRENCY, GUNICORN_WORKER_CLASS, BIND). With PRELOAD_SHARED_STATE
+enabled (the default) the master loads the KB and rule vectors, indexes
+and records before forking, and each worker logs how much resident
+memory it shares with the master once it has started. With
+KB_RELOAD_INTERVAL set, every worker also watches the KB and rules files
+and hot-reloads them when they change (see serving.reload). The app
+should await serving.warmup() in its startup hook and report
+serving.is_ready() from its readiness check.
+"""
+
+from feynmancraft_adk.serving.preload import log_worker_memory, preload_shared_state
+from feynmancraft_adk.serving.reload import start_reload_watcher
+from feynmancraft_adk.shared_libraries.config import config
+
+workers = config.serving.workers
+worker_class = config.serving.worker_class
+bind = config.serving.bind
+preload_app = config.serving.preload_shared_state
+
+
+def on_starting(server):
+    """Load the shared search state in the master, before any worker forks."""
+    if config.serving.preload_shared_state:
+        preload_shared_state()
+
+
+def post_worker_init(worker):
+    """Report the worker's resident-memory savings and start its reload watcher."""
+    log_worker_memory(f"Worker {worker.pid}")
+    start_reload_watcher()
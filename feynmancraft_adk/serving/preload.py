@@ -0,0 +1,255 @@
+"""
+Preload-in-master mode for multi-worker serving.
+
+With a pre-forking server (gunicorn with ``preload_app``), everything the
+search tools load is created once in the master and shared by every
+forked worker instead of being rebuilt per process:
+
+- the KB and rule embedding matrices are read-only memory maps of the
+  vector stores, so their pages live in the page cache once
+- the vector index (exact, Annoy, HNSW, int8 or PQ) is memory-mapped or
+  held in arrays that workers never write
+- the compact KB record store and its lexical and metadata indexes are
+  built in the master and inherited copy-on-write
+
+preload_shared_state() loads all of it from disk without sending
+embedding requests or starting threads (neither survives fork), then
+calls gc.freeze() so the cyclic garbage collector in each worker never
+touches, and thereby copies, the preloaded objects. Missing or stale
+stores and indexes are left for the workers to build.
+
+memory_usage() reads the process's resident, proportional and shared
+memory from /proc, and log_worker_memory() reports how much of a
+worker's resident memory is shared with the master.
+"""
+
+import gc
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+# Set once preload_shared_state() has run in this process tree
+_preload_report: Optional[Dict[str, Any]] = None
+_fork_hook_registered = False
+_fork_hook_lock = threading.Lock()
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Get the memory usage of a process in bytes.
+
+    On Linux this reads /proc/<pid>/smaps_rollup: ``rss`` is resident
+    memory, ``pss`` divides shared pages among the processes mapping them,
+    and ``shared`` is resident memory also mapped by another process (for a
+    worker, mostly pages inherited from the master). Elsewhere only ``rss``
+    (peak, from getrusage) is reported.
+
+    Args:
+        pid: Process id (defaults to the current process)
+
+    Returns:
+        Dictionary with rss, pss, shared and private byte counts where available
+    """
+    path = Path(f"/proc/{pid or 'self'}/smaps_rollup")
+    try:
+        fields: Dict[str, int] = {}
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        return {
+            "rss": fields.get("Rss", 0),
+            "pss": fields.get("Pss", 0),
+            "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+            "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        }
+    except OSError:
+        import resource
+
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": maxrss if maxrss > 1 << 32 else maxrss * 1024}
+
+
+def _array_info(array: Any) -> Dict[str, Any]:
+    if array is None:
+        return {"bytes": 0, "mmap": False}
+    return {"bytes": int(array.nbytes), "mmap": isinstance(array, np.memmap)}
+
+
+def _index_arrays(index: Any) -> Dict[str, Any]:
+    """Sizes of the arrays held by a vector index."""
+    arrays = {}
+    for name in ("matrix", "vectors", "codes", "ids"):
+        array = getattr(index, name, None)
+        if isinstance(array, np.ndarray):
+            arrays[name] = _array_info(array)
+    return arrays
+
+
+def _after_fork_in_child():
+    """Reset per-process state that must not be shared with the master."""
+    import asyncio
+
+    from ..tools.kb.embedding_manager import KBEmbeddingManager
+    from ..tools.physics.embedding_manager import RulesEmbeddingManager
+
+    # asyncio locks may have been bound to the master's (closed) event loop
+    for manager_class in (KBEmbeddingManager, RulesEmbeddingManager):
+        if manager_class._instance is not None:
+            manager_class._instance._lock = asyncio.Lock()
+
+
+def _register_fork_hook():
+    global _fork_hook_registered
+
+    with _fork_hook_lock:
+        if not _fork_hook_registered and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+            _fork_hook_registered = True
+
+
+def preload_shared_state(kb: bool = True, rules: bool = True, freeze: bool = True) -> Dict[str, Any]:
+    """
+    Load the search state in the master process so forked workers share it.
+
+    Only data already on disk is loaded; nothing is embedded and no
+    background index build is started.
+
+    Args:
+        kb: Preload the KB records, embeddings and indexes
+        rules: Preload the physics rules and their embeddings
+        freeze: Move every object created so far to the permanent GC
+            generation (gc.freeze), so workers don't dirty their pages
+
+    Returns:
+        Report with load timings, what was preloaded (and whether it is
+        memory-mapped) and the master's memory usage
+    """
+    global _preload_report
+
+    start = time.perf_counter()
+    before = memory_usage()
+    report: Dict[str, Any] = {"pid": os.getpid()}
+
+    if kb:
+        from ..tools.kb.embedding_manager import get_kb_manager
+        from ..tools.kb.service import get_kb_service
+        from ..tools.kb import local
+
+        kb_start = time.perf_counter()
+        try:
+            service = get_kb_service().warm(build_missing=False)
+            snapshot = local.current_snapshot()
+            records = snapshot.records if snapshot else ()
+            manager = get_kb_manager()
+            embeddings_loaded = manager.load()
+            index = manager.vector_index if embeddings_loaded else None
+            report["kb"] = {
+                "records": len(records),
+                "tikz_bytes": len(getattr(records, "_tikz_buffer", b"")),
+                "embeddings_loaded": embeddings_loaded,
+                "embedding_matrix": _array_info(manager.embedding_matrix),
+                "embedding_index": type(index).__name__ if index is not None else None,
+                "hybrid_index": (
+                    _index_arrays(snapshot.index)
+                    if snapshot and snapshot.index is not None else None
+                ),
+                "hybrid_index_loaded": service.stats()["index_loaded"],
+                "seconds": time.perf_counter() - kb_start,
+            }
+        except Exception as e:
+            logger.error(f"Failed to preload KB state: {e}")
+            report["kb"] = {"error": str(e)}
+
+    if rules:
+        from ..tools.physics.embedding_manager import get_rules_manager
+
+        rules_start = time.perf_counter()
+        try:
+            manager = get_rules_manager()
+            embeddings_loaded = manager.load()
+            index = manager.vector_index if embeddings_loaded else None
+            report["rules"] = {
+                "rules": len(manager.physics_rules),
+                "embeddings_loaded": embeddings_loaded,
+                "embedding_matrix": _array_info(manager.embedding_matrix),
+                "embedding_index": type(index).__name__ if index is not None else None,
+                "seconds": time.perf_counter() - rules_start,
+            }
+        except Exception as e:
+            logger.error(f"Failed to preload physics rules state: {e}")
+            report["rules"] = {"error": str(e)}
+
+    _register_fork_hook()
+    gc.collect()
+    if freeze and hasattr(gc, "freeze"):
+        gc.freeze()
+        report["gc_frozen"] = gc.get_freeze_count()
+
+    after = memory_usage()
+    report["seconds"] = time.perf_counter() - start
+    report["master_rss"] = after.get("rss", 0)
+    report["preloaded_rss"] = max(0, after.get("rss", 0) - before.get("rss", 0))
+    _preload_report = report
+
+    for name in ("kb", "rules"):
+        if name in report and not report[name].get("embeddings_loaded"):
+            logger.warning(f"No current {name} embeddings store to preload; workers will build their own")
+    logger.info(
+        f"Preloaded shared search state in {report['seconds']:.2f}s "
+        f"({report['preloaded_rss'] / _MB:.1f} MB resident in the master)"
+    )
+    return report
+
+
+def worker_memory_report() -> Dict[str, Any]:
+    """
+    Compare this worker's memory with what it inherited from the master.
+
+    Returns:
+        The worker's rss, pss, shared and private bytes, the size of the
+        preloaded state and the estimated bytes saved by sharing it
+    """
+    usage = memory_usage()
+    preloaded = (_preload_report or {}).get("preloaded_rss", 0)
+    return {
+        **usage,
+        "pid": os.getpid(),
+        "preloaded": preloaded,
+        # Without preloading each worker would hold its own copy of the shared pages
+        "saved": min(usage.get("shared", 0), preloaded),
+    }
+
+
+def log_worker_memory(label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Log this worker's resident-memory savings from the preloaded state.
+
+    Args:
+        label: Name used in the log line (defaults to the pid)
+
+    Returns:
+        The worker_memory_report() that was logged
+    """
+    report = worker_memory_report()
+    label = label or f"Worker {report['pid']}"
+    if "pss" in report:
+        logger.info(
+            f"{label}: RSS {report['rss'] / _MB:.1f} MB, PSS {report['pss'] / _MB:.1f} MB, "
+            f"shared with master {report['shared'] / _MB:.1f} MB, "
+            f"saved {report['saved'] / _MB:.1f} MB of preloaded state"
+        )
+    else:
+        logger.info(f"{label}: peak RSS {report['rss'] / _MB:.1f} MB")
+    return report
@@ -0,0 +1,231 @@
+"""
+Hot reload of the KB and physics rules in a running process.
+
+reload_search_state() re-reads the KB (records, shards or bundle) and the
+physics rules file and swaps in new search state without a restart:
+
+- the KB service builds a new snapshot of the records, their lexical,
+  metadata and vector indexes, and a new KB embedding manager (see
+  LocalKBTool.reload), embedding only new or changed records
+- the rules embedding manager is replaced by one loaded for the new rules
+  (see RulesEmbeddingManager.reload)
+
+Everything is prepared in the calling thread and swapped in with a single
+reference assignment, so searches keep being served meanwhile and those
+already running finish on the state they started with. Unchanged content
+is detected by its hash and nothing is swapped. The embedding caches are
+keyed by text and model, so they stay warm across reloads.
+
+ReloadWatcher polls the modification time and size of the source files
+and reloads whatever changed. It runs one thread per process: with a
+pre-forking server, start it in every worker (see serving.gunicorn_conf),
+since threads don't survive fork. Shipping a KB update with a current
+index (e.g. a KB bundle, see kb.bundle) lets every worker load rather
+than rebuild it.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from ..shared_libraries.config import config
+
+logger = logging.getLogger(__name__)
+
+# Reloads run one at a time, whether from the watcher or an explicit call
+_reload_lock = threading.Lock()
+
+_watcher: Optional["ReloadWatcher"] = None
+_watcher_lock = threading.Lock()
+
+
+def source_signature(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    Get a cheap change signature of a KB or rules source.
+
+    Args:
+        path: File, or directory of KB shards
+
+    Returns:
+        Tuple of (latest modification time in ns, total size), or None if
+        the source does not exist
+    """
+    try:
+        if path.is_dir():
+            stats = [entry.stat() for entry in os.scandir(path) if entry.is_file()]
+            stats.append(path.stat())
+        else:
+            stats = [path.stat()]
+    except OSError:
+        return None
+    return max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats)
+
+
+def reload_search_state(kb: bool = True, rules: bool = True) -> Dict[str, Any]:
+    """
+    Reload the KB and physics rules and swap in the new search state.
+
+    Blocks while the new state is prepared (including embedding new or
+    changed records); from async code run it with asyncio.to_thread.
+
+    Args:
+        kb: Reload the KB records, embeddings and indexes
+        rules: Reload the physics rules and their embeddings
+
+    Returns:
+        Report per source with whether new state was swapped in, the
+        seconds taken and, for the KB, the snapshot version
+    """
+    report: Dict[str, Any] = {}
+    with _reload_lock:
+        if kb:
+            from ..tools.kb.local import current_snapshot
+            from ..tools.kb.service import get_kb_service
+
+            start = time.perf_counter()
+            try:
+                swapped = get_kb_service().reload()
+                snapshot = current_snapshot()
+                report["kb"] = {
+                    "reloaded": swapped,
+                    "version": snapshot.version if snapshot else None,
+                    "records": len(snapshot.records) if snapshot else 0,
+                    "seconds": time.perf_counter() - start,
+                }
+            except Exception as e:
+                logger.error(f"Failed to reload the KB: {e}")
+                report["kb"] = {"reloaded": False, "error": str(e)}
+
+        if rules:
+            from ..tools.physics.embedding_manager import RulesEmbeddingManager
+
+            start = time.perf_counter()
+            try:
+                previous = RulesEmbeddingManager._instance
+                manager = RulesEmbeddingManager.reload()
+                report["rules"] = {
+                    "reloaded": manager is not previous,
+                    "rules": len(manager.physics_rules),
+                    "seconds": time.perf_counter() - start,
+                }
+            except Exception as e:
+                logger.error(f"Failed to reload the physics rules: {e}")
+                report["rules"] = {"reloaded": False, "error": str(e)}
+
+    logger.info(f"Search state reload: {report}")
+    return report
+
+
+class ReloadWatcher:
+    """Background thread reloading the KB and physics rules when their files change."""
+
+    def __init__(self, interval: float):
+        """
+        Args:
+            interval: Seconds between checks of the source files
+        """
+        self.interval = interval
+        self.sources = {
+            "kb": Path(config.knowledge_base.local_kb_path),
+            "rules": Path(config.validation.physics_rules_path),
+        }
+        self.reloads = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._signatures = {name: source_signature(path) for name, path in self.sources.items()}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="search-reload-watcher", daemon=True)
+
+    def start(self) -> "ReloadWatcher":
+        self._thread.start()
+        logger.info(f"Watching {', '.join(str(p) for p in self.sources.values())} every {self.interval}s")
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the watcher, waiting up to timeout seconds for a running reload."""
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def check(self) -> Optional[Dict[str, Any]]:
+        """
+        Reload the sources whose signature changed since the last check.
+
+        Returns:
+            The reload report, or None if nothing changed
+        """
+        changed = {}
+        for name, path in self.sources.items():
+            signature = source_signature(path)
+            if signature is not None and signature != self._signatures[name]:
+                changed[name] = signature
+        if not changed:
+            return None
+
+        logger.info(f"Detected changes to {', '.join(changed)}; reloading")
+        report = reload_search_state(kb="kb" in changed, rules="rules" in changed)
+        for name, signature in changed.items():
+            # Retry failed reloads on the next check
+            if "error" not in report.get(name, {}):
+                self._signatures[name] = signature
+        self.reloads += 1
+        self.last_report = report
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Reload watcher check failed: {e}")
+
+
+def start_reload_watcher(interval: Optional[float] = None) -> Optional[ReloadWatcher]:
+    """
+    Start the process-wide reload watcher unless one is running.
+
+    Args:
+        interval: Seconds between checks (defaults to
+            ServingConfig.reload_interval_seconds); 0 disables the watcher
+
+    Returns:
+        The running watcher, or None if disabled
+    """
+    global _watcher
+
+    interval = config.serving.reload_interval_seconds if interval is None else interval
+    if interval <= 0:
+        return None
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_running:
+            _watcher = ReloadWatcher(interval).start()
+        return _watcher
+
+
+def stop_reload_watcher():
+    """Stop the process-wide reload watcher, if any."""
+    global _watcher
+
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+def _reset_after_fork():
+    """The parent's watcher thread does not survive fork; let the child start its own."""
+    global _watcher, _reload_lock, _watcher_lock
+
+    _watcher = None
+    _reload_lock = threading.Lock()
+    _watcher_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
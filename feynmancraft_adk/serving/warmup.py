@@ -0,0 +1,227 @@
+"""
+Startup warm-up of the search tools and the MCP client.
+
+Without a warm-up the first requests pay for initializing the KB and rules
+embedding managers, opening the vector indexes (Annoy, HNSW, ...) and
+spawning the MCP server. warmup() runs all of them concurrently with
+asyncio.gather when the process starts:
+
+- kb: the KB embedding manager and its index, and the hybrid-search
+  service with its vector, lexical and metadata indexes
+- rules: the physics rules embedding manager and its index
+- mcp: the ParticlePhysics MCP server connection
+- queries: embeddings of hot queries (ServingConfig.warmup_queries), so
+  their first search skips the embedding call
+
+With prefaulting enabled, one byte of every page of the loaded vector
+matrices and index arrays is read, so memory-mapped files are in the page
+cache before the first search touches them.
+
+Each component is reported with its timing and whether it succeeded.
+is_ready() turns true once the required components (KB and rules by
+default) are warm, for the serving layer's readiness checks. Await
+warmup() on the event loop that serves requests (e.g. in the app's startup
+hook): the MCP client and the managers' locks are bound to it.
+"""
+
+import asyncio
+import mmap
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+from ..shared_libraries.config import config
+
+logger = logging.getLogger(__name__)
+
+_report: Optional[Dict[str, Any]] = None
+_ready = False
+
+
+def prefault(arrays: Iterable[Optional[np.ndarray]]) -> int:
+    """
+    Read one byte per page of each array, faulting memory-mapped pages in.
+
+    Args:
+        arrays: Arrays to touch; None entries are skipped
+
+    Returns:
+        Total bytes of the arrays touched
+    """
+    touched = 0
+    for array in arrays:
+        if array is None or not array.size:
+            continue
+        flat = array.reshape(-1).view(np.uint8)
+        int(flat[::mmap.PAGESIZE].sum())
+        touched += flat.nbytes
+    return touched
+
+
+def _index_arrays(index: Any) -> List[np.ndarray]:
+    """The numpy arrays held by a vector index (Annoy keeps its own mmap)."""
+    if index is None:
+        return []
+    return [value for value in vars(index).values() if isinstance(value, np.ndarray)]
+
+
+async def _timed(
+    name: str,
+    warm: Callable[[], Awaitable[Dict[str, Any]]],
+    timeout: float
+) -> Dict[str, Any]:
+    """Run one warm-up component under a deadline and time it."""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(warm(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Warm-up of {name} exceeded {timeout}s")
+        result = {"ok": False, "error": f"timed out after {timeout}s"}
+    except Exception as e:
+        logger.error(f"Warm-up of {name} failed: {e}")
+        result = {"ok": False, "error": str(e)}
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+async def _warm_kb(prefault_pages: bool) -> Dict[str, Any]:
+    from ..tools.kb.embedding_manager import get_kb_manager
+    from ..tools.kb.local import current_snapshot
+    from ..tools.kb.service import get_kb_service
+
+    manager = get_kb_manager()
+    await manager.initialize()
+    index = await asyncio.to_thread(lambda: manager.vector_index)
+    service = await asyncio.to_thread(get_kb_service().warm)
+    snapshot = current_snapshot()
+
+    result = {
+        "ok": bool(manager.kb_examples) and index is not None,
+        "examples": len(manager.kb_examples),
+        "embedding_index": type(index).__name__ if index is not None else None,
+        "hybrid_index_loaded": service.stats()["index_loaded"],
+    }
+    if prefault_pages:
+        arrays = [manager.embedding_matrix, *_index_arrays(index)]
+        if snapshot is not None:
+            arrays += _index_arrays(snapshot.index)
+        result["prefaulted_bytes"] = await asyncio.to_thread(prefault, arrays)
+    return result
+
+
+async def _warm_rules(prefault_pages: bool) -> Dict[str, Any]:
+    from ..tools.physics.embedding_manager import get_rules_manager
+
+    manager = get_rules_manager()
+    await manager.initialize()
+    index = await asyncio.to_thread(lambda: manager.vector_index)
+
+    result = {
+        "ok": bool(manager.physics_rules) and index is not None,
+        "rules": len(manager.physics_rules),
+        "embedding_index": type(index).__name__ if index is not None else None,
+    }
+    if prefault_pages:
+        arrays = [manager.embedding_matrix, *_index_arrays(index)]
+        result["prefaulted_bytes"] = await asyncio.to_thread(prefault, arrays)
+    return result
+
+
+async def _warm_mcp() -> Dict[str, Any]:
+    from ..integrations.mcp.mcp_client import get_mcp_client
+
+    client = await get_mcp_client()
+    return {"ok": client.is_connected}
+
+
+def _embed_queries(queries: Sequence[str]) -> Dict[str, Any]:
+    """Embed the queries with every search model, filling the query embedding caches."""
+    from ..tools.kb.embedding_batcher import EmbeddingBatcher
+    from ..tools.kb.embedding_manager import get_kb_manager
+    from ..tools.kb.embeddings import get_embedding
+    from ..tools.physics.embedding_manager import get_rules_manager
+
+    models = list(dict.fromkeys([get_kb_manager().model_name, get_rules_manager().model_name]))
+    embedded = 0
+    for model_name in models:
+        # One batch request fills the persistent cache; get_embedding then
+        # serves from it and fills the in-process cache searches hit first
+        EmbeddingBatcher(model_name).embed(list(queries))
+        embedded += sum(1 for query in queries if get_embedding(query, model_name))
+    return {"ok": embedded == len(queries) * len(models), "queries": len(queries), "models": models}
+
+
+async def warmup(
+    kb: bool = True,
+    rules: bool = True,
+    mcp: Optional[bool] = None,
+    queries: Optional[Sequence[str]] = None,
+    prefault_pages: Optional[bool] = None,
+    timeout: Optional[float] = None,
+    required: Sequence[str] = ("kb", "rules")
+) -> Dict[str, Any]:
+    """
+    Warm up the search tools and the MCP client concurrently.
+
+    Args:
+        kb: Initialize the KB embedding manager and the KB service
+        rules: Initialize the physics rules embedding manager
+        mcp: Connect the MCP client (defaults to ServingConfig.warmup_mcp)
+        queries: Hot queries to pre-embed (defaults to ServingConfig.warmup_queries)
+        prefault_pages: Fault in the pages of the loaded vector matrices and
+            indexes (defaults to ServingConfig.warmup_prefault)
+        timeout: Deadline in seconds per component (defaults to
+            ServingConfig.warmup_timeout_seconds)
+        required: Components that must succeed for the process to be ready
+
+    Returns:
+        Report with ok, seconds and details per component, the total
+        seconds and the ready flag
+    """
+    global _report, _ready
+
+    serving = config.serving
+    mcp = serving.warmup_mcp if mcp is None else mcp
+    queries = serving.warmup_queries if queries is None else list(queries)
+    prefault_pages = serving.warmup_prefault if prefault_pages is None else prefault_pages
+    timeout = serving.warmup_timeout_seconds if timeout is None else timeout
+
+    components: Dict[str, Callable[[], Awaitable[Dict[str, Any]]]] = {}
+    if kb:
+        components["kb"] = lambda: _warm_kb(prefault_pages)
+    if rules:
+        components["rules"] = lambda: _warm_rules(prefault_pages)
+    if mcp:
+        components["mcp"] = _warm_mcp
+    if queries:
+        components["queries"] = lambda: asyncio.to_thread(_embed_queries, queries)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(_timed(name, warm, timeout) for name, warm in components.items())
+    )
+    report: Dict[str, Any] = dict(zip(components, results))
+    report["seconds"] = time.perf_counter() - start
+    report["ready"] = all(report[name]["ok"] for name in required if name in components)
+
+    _report = report
+    _ready = report["ready"]
+    failed = [name for name in components if not report[name]["ok"]]
+    logger.info(
+        f"Warm-up finished in {report['seconds']:.2f}s"
+        + (f"; failed: {', '.join(failed)}" if failed else "")
+        + ("" if _ready else " (not ready)")
+    )
+    return report
+
+
+def is_ready() -> bool:
+    """Whether warmup() has run in this process and every required component is warm."""
+    return _ready
+
+
+def warmup_report() -> Optional[Dict[str, Any]]:
+    """Get the report of the last warmup() in this process, or None if it hasn't run."""
+    return _report
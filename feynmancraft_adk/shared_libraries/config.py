@@ -1,6 +1,7 @@
 """Configuration settings for FeynmanCraft ADK."""
 
 import os
+import re
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional, Dict, Any, List
@@ -9,6 +10,18 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Bundled data directory; FEYNMAN_DATA_DIR points the KB, rules and indexes elsewhere
+_PACKAGE_DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+def _data_dir() -> Path:
+    return Path(os.getenv("FEYNMAN_DATA_DIR", str(_PACKAGE_DATA_DIR)))
+
+
+def model_slug(model_name: str) -> str:
+    """File-name-safe form of an embedding model name, e.g. "models/text-embedding-004" -> "text-embedding-004"."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", model_name.split("/")[-1]).strip("-.")
+
 
 @dataclass
 class ModelConfig:
@@ -18,9 +31,11 @@ class ModelConfig:
     temperature: float = field(default_factory=lambda: float(os.getenv("MODEL_TEMPERATURE", "0.3")))
     max_tokens: int = field(default_factory=lambda: int(os.getenv("MODEL_MAX_TOKENS", "8192")))
     
-    # Embedding Model
+    # Embedding Model ("text-embedding-004" via Gemini, or "local-hashing" for offline use)
     embedding_model: str = field(default_factory=lambda: os.getenv("EMBEDDING_MODEL", "text-embedding-004"))
-    embedding_dim: int = 768
+    embedding_dim: int = field(default_factory=lambda: int(os.getenv("EMBEDDING_DIM", "768")))
+    embedding_batch_size: int = field(default_factory=lambda: int(os.getenv("EMBEDDING_BATCH_SIZE", "100")))
+    embedding_concurrency: int = field(default_factory=lambda: int(os.getenv("EMBEDDING_CONCURRENCY", "4")))
     
     # Model-specific configurations for different agents
     # Complex agents use gemini-2.5-pro for better reasoning
@@ -41,10 +56,40 @@ class KnowledgeBaseConfig:
     mode: str = field(default_factory=lambda: os.getenv("KB_MODE", "local").lower())
     
     # Local KB Configuration
-    data_dir: Path = field(default_factory=lambda: Path(__file__).parent.parent / "data")
-    local_kb_path: Path = field(default_factory=lambda: Path(__file__).parent.parent / "data" / "feynman_kb.json")
-    local_index_path: Path = field(default_factory=lambda: Path(__file__).parent.parent / "data" / "feynman_kb.ann")
-    local_id_map_path: Path = field(default_factory=lambda: Path(__file__).parent.parent / "data" / "feynman_kb_id_map.json")
+    data_dir: Path = field(default_factory=_data_dir)
+    # KB records: a JSON array, a JSONL file, a directory of shards (see kb.ingest)
+    # or a bundle of the records with their indexes (see kb.bundle)
+    local_kb_path: Path = field(default_factory=lambda: Path(os.getenv("KB_PATH", str(_data_dir() / "feynman_kb.json"))))
+    kb_bundle_path: Path = field(default_factory=lambda: Path(os.getenv("KB_BUNDLE_PATH", str(_data_dir() / "feynman_kb.kbundle"))))
+    kb_shard_size: int = field(default_factory=lambda: int(os.getenv("KB_SHARD_SIZE", "50000")))
+    local_index_path: Path = field(default_factory=lambda: _data_dir() / "feynman_kb.ann")
+    local_id_map_path: Path = field(default_factory=lambda: _data_dir() / "feynman_kb_id_map.json")  # Legacy, superseded by the index manifest
+    
+    # Vector index engine: "exact" (brute force), "annoy", "hnsw", "int8" or "pq"
+    vector_index_engine: str = field(default_factory=lambda: os.getenv("VECTOR_INDEX_ENGINE", "annoy").lower())
+    annoy_n_trees: int = field(default_factory=lambda: int(os.getenv("ANNOY_N_TREES", "10")))
+    annoy_search_k: int = field(default_factory=lambda: int(os.getenv("ANNOY_SEARCH_K", "-1")))
+    hnsw_m: int = field(default_factory=lambda: int(os.getenv("HNSW_M", "16")))
+    hnsw_ef_construction: int = field(default_factory=lambda: int(os.getenv("HNSW_EF_CONSTRUCTION", "100")))
+    hnsw_ef_search: int = field(default_factory=lambda: int(os.getenv("HNSW_EF_SEARCH", "64")))
+    
+    # After a failed background build, searches wait this long before starting another for the same KB and model
+    index_build_retry_seconds: float = field(default_factory=lambda: float(os.getenv("INDEX_BUILD_RETRY_SECONDS", "300")))
+    
+    # Embedding vector stores (float32 or float16 on disk)
+    embeddings_dir: Path = field(default_factory=lambda: _data_dir() / "embeddings")
+    embedding_storage_dtype: str = field(default_factory=lambda: os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower())
+    
+    # Quantized search over the embedding stores: "none", "int8" or "pq"
+    embedding_quantization: str = field(default_factory=lambda: os.getenv("EMBEDDING_QUANTIZATION", "none").lower())
+    pq_subvectors: int = field(default_factory=lambda: int(os.getenv("PQ_SUBVECTORS", "0")))  # 0 = dim / 8
+    quantization_rerank: int = field(default_factory=lambda: int(os.getenv("QUANTIZATION_RERANK", "16")))
+    
+    # Persistent query-embedding cache shared by all worker processes
+    embedding_cache_enabled: bool = field(default_factory=lambda: os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true")
+    embedding_cache_path: Path = field(default_factory=lambda: Path(os.getenv("EMBEDDING_CACHE_PATH", str(_data_dir() / "embeddings" / "query_cache.sqlite3"))))
+    embedding_cache_max_entries: int = field(default_factory=lambda: int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000")))
+    embedding_cache_ttl_seconds: int = field(default_factory=lambda: int(os.getenv("EMBEDDING_CACHE_TTL", str(30 * 24 * 3600))))
     
     @property
     def use_bigquery(self) -> bool:
@@ -54,9 +99,19 @@ class KnowledgeBaseConfig:
     def use_local_kb(self) -> bool:
         return True  # Always use local KB
     
-    @property
-    def has_local_index(self) -> bool:
-        return self.local_index_path.exists()
+    def index_stem(self, model_name: str) -> Path:
+        """
+        Stem of the vector index files for an embedding model and the configured engine.
+        
+        Like the embedding stores, each model gets its own index, so switching
+        providers never overwrites one that was expensive to build.
+        """
+        base = self.local_index_path.with_suffix("")
+        return base.with_name(f"{base.name}.{model_slug(model_name)}.{self.vector_index_engine}")
+    
+    def has_index(self, model_name: str) -> bool:
+        stem = self.index_stem(model_name)
+        return stem.with_name(stem.name + ".index.json").exists()
 
 
 @dataclass
@@ -70,6 +125,12 @@ class SearchConfig:
     # Search weights for hybrid search
     vector_weight: float = field(default_factory=lambda: float(os.getenv("VECTOR_WEIGHT", "0.6")))
     keyword_weight: float = field(default_factory=lambda: float(os.getenv("KEYWORD_WEIGHT", "0.4")))
+    fusion_method: str = field(default_factory=lambda: os.getenv("FUSION_METHOD", "rrf").lower())  # "rrf" or "weighted"
+    rrf_k: int = field(default_factory=lambda: int(os.getenv("RRF_K", "60")))
+    
+    # Per-retriever deadlines; a late vector search degrades to keyword-only results
+    vector_timeout_seconds: float = field(default_factory=lambda: float(os.getenv("VECTOR_SEARCH_TIMEOUT", "3.0")))
+    keyword_timeout_seconds: float = field(default_factory=lambda: float(os.getenv("KEYWORD_SEARCH_TIMEOUT", "1.0")))
 
 
 @dataclass
@@ -80,7 +141,7 @@ class ValidationConfig:
     latex_timeout: int = field(default_factory=lambda: int(os.getenv("LATEX_TIMEOUT", "30")))
     
     # Physics Validation
-    physics_rules_path: Path = field(default_factory=lambda: Path(__file__).parent.parent / "data" / "pprules.json")
+    physics_rules_path: Path = field(default_factory=lambda: _data_dir() / "pprules.json")
     enable_physics_validation: bool = field(default_factory=lambda: os.getenv("ENABLE_PHYSICS_VALIDATION", "true").lower() == "true")
     strict_physics_mode: bool = field(default_factory=lambda: os.getenv("STRICT_PHYSICS_MODE", "false").lower() == "true")
 
@@ -105,6 +166,26 @@ class LoggingConfig:
     max_file_size: int = field(default_factory=lambda: int(os.getenv("LOG_MAX_SIZE", "10485760")))  # 10MB
 
 
+@dataclass
+class ServingConfig:
+    """Multi-worker serving configuration (see serving.gunicorn_conf)."""
+    workers: int = field(default_factory=lambda: int(os.getenv("WEB_CONCURRENCY", "2")))
+    worker_class: str = field(default_factory=lambda: os.getenv("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker"))
+    bind: str = field(default_factory=lambda: os.getenv("BIND", "0.0.0.0:8000"))
+    
+    # Load KB/rule vectors, indexes and records in the master so forked workers share them
+    preload_shared_state: bool = field(default_factory=lambda: os.getenv("PRELOAD_SHARED_STATE", "true").lower() == "true")
+    
+    # Seconds between checks of the KB and rules files for hot reload (0 disables the watcher)
+    reload_interval_seconds: float = field(default_factory=lambda: float(os.getenv("KB_RELOAD_INTERVAL", "0")))
+    
+    # Startup warm-up (see serving.warmup); queries are separated by ";"
+    warmup_queries: List[str] = field(default_factory=lambda: [q.strip() for q in os.getenv("WARMUP_QUERIES", "").split(";") if q.strip()])
+    warmup_mcp: bool = field(default_factory=lambda: os.getenv("WARMUP_MCP", "true").lower() == "true")
+    warmup_prefault: bool = field(default_factory=lambda: os.getenv("WARMUP_PREFAULT", "true").lower() == "true")
+    warmup_timeout_seconds: float = field(default_factory=lambda: float(os.getenv("WARMUP_TIMEOUT", "120")))
+
+
 @dataclass
 class FeynmanCraftConfig:
     """Main configuration class combining all settings."""
@@ -114,6 +195,7 @@ class FeynmanCraftConfig:
     validation: ValidationConfig = field(default_factory=ValidationConfig)
     api: APIConfig = field(default_factory=APIConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
+    serving: ServingConfig = field(default_factory=ServingConfig)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert config to dictionary."""
@@ -123,8 +205,11 @@ class FeynmanCraftConfig:
                 **self.knowledge_base.__dict__,
                 "data_dir": str(self.knowledge_base.data_dir),
                 "local_kb_path": str(self.knowledge_base.local_kb_path),
+                "kb_bundle_path": str(self.knowledge_base.kb_bundle_path),
                 "local_index_path": str(self.knowledge_base.local_index_path),
                 "local_id_map_path": str(self.knowledge_base.local_id_map_path),
+                "embeddings_dir": str(self.knowledge_base.embeddings_dir),
+                "embedding_cache_path": str(self.knowledge_base.embedding_cache_path),
             },
             "search": self.search.__dict__,
             "validation": {
@@ -133,6 +218,7 @@ class FeynmanCraftConfig:
             },
             "api": self.api.__dict__,
             "logging": self.logging.__dict__,
+            "serving": self.serving.__dict__,
         }
     
     def validate(self) -> List[str]:
@@ -183,7 +269,7 @@ def get_kb_config():
         "local": {
             "kb_path": str(config.knowledge_base.local_kb_path),
             "index_path": str(config.knowledge_base.local_index_path),
-            "has_index": config.knowledge_base.has_local_index,
+            "has_index": config.knowledge_base.has_index(config.models.embedding_model),
         },
     }
 
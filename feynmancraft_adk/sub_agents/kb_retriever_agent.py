@@ -34,6 +34,7 @@ from .kb_retriever_agent_prompt import PROMPT as KB_RETRIEVER_AGENT_PROMPT
 # Import all search functionality from tools
 from ..tools.kb.search import (
     search_local_tikz_examples,
+    search_local_tikz_examples_many,
     search_tikz_examples,
     search_tikz_examples_async
 )
@@ -77,6 +78,23 @@ async def search_local_tikz_examples_wrapper(query: str) -> List[Dict[str, Any]]
         return [{"error": f"Local search failed: {str(e)}"}]
 
 
+async def search_local_tikz_examples_many_wrapper(queries: List[str]) -> List[Dict[str, Any]]:
+    """
+    Wrapper for search_local_tikz_examples_many with default parameters.
+    
+    Args:
+        queries: Several search phrasings for the same physics process
+        
+    Returns:
+        Deduplicated list of relevant TikZ examples across all queries
+    """
+    try:
+        return await search_local_tikz_examples_many(queries, top_k=5)
+    except Exception as e:
+        logger.error(f"Error in search_local_tikz_examples_many_wrapper: {e}")
+        return [{"error": f"Local batch search failed: {str(e)}"}]
+
+
 async def search_tikz_examples_async_wrapper(query: str) -> List[Dict[str, Any]]:
     """
     Async wrapper for unified TikZ examples search.
@@ -109,6 +127,7 @@ KBRetrieverAgent = Agent(
         # Primary search tools
         search_tikz_examples_wrapper,
         search_local_tikz_examples_wrapper,
+        search_local_tikz_examples_many_wrapper,
         search_tikz_examples_async_wrapper,
     ],
 )
\ No newline at end of file
@@ -51,6 +51,12 @@ Use the structured plan to create effective search queries:
    - **Best for**: Development and fallback scenarios
    - **Parameters**: `query: str`
 
+3. **Batch Local Search (`search_local_tikz_examples_many_wrapper`)**:
+   - **Use when**: You have several phrasings of the same process (process, particles, interaction type)
+   - **How it works**: Embeds all queries in one request and returns one deduplicated, ranked list
+   - **Best for**: Replacing several sequential local searches
+   - **Parameters**: `queries: List[str]`
+
 **Your Workflow:**
 
 1. **Analyze the Plan**: Review state.plan to understand the physics process
@@ -36,6 +36,7 @@ from .physics_validator_agent_prompt import PROMPT as PHYSICS_VALIDATOR_AGENT_PR
 # Import physics search functionality from tools
 from ..tools.physics.search import (
     search_physics_rules,
+    search_physics_rules_many,
     search_rules_by_particles,
     search_rules_by_process,
     validate_process_against_rules
@@ -90,6 +91,23 @@ async def search_physics_rules_wrapper(query: str) -> List[Dict[str, Any]]:
         return [{"error": f"Physics rules search failed: {str(e)}"}]
 
 
+async def search_physics_rules_many_wrapper(queries: List[str]) -> List[Dict[str, Any]]:
+    """
+    Wrapper for search_physics_rules_many with default parameters.
+    
+    Args:
+        queries: Several phrasings of the physics process or rule to look up
+        
+    Returns:
+        Deduplicated list of relevant physics rules across all queries
+    """
+    try:
+        return await search_physics_rules_many(queries, top_k=5)
+    except Exception as e:
+        logger.error(f"Error in search_physics_rules_many_wrapper: {e}")
+        return [{"error": f"Physics rules batch search failed: {str(e)}"}]
+
+
 def search_rules_by_particles_wrapper(particles: str) -> List[Dict[str, Any]]:
     """
     Wrapper for searching rules by particles.
@@ -250,6 +268,7 @@ PhysicsValidatorAgent = Agent(
     tools=[
         # Physics rules search tools
         search_physics_rules_wrapper,
+        search_physics_rules_many_wrapper,
         search_rules_by_particles_wrapper,
         search_rules_by_process_wrapper,
         validate_process_wrapper,
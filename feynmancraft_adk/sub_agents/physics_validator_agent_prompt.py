@@ -87,6 +87,7 @@ After collecting all particle information, you MUST:
 - convert_units: Convert between physics units
 - check_particle_properties: Comprehensive validation
 - search_physics_rules_wrapper: Find relevant physics rules
+- search_physics_rules_many_wrapper: Find relevant physics rules for several queries at once (deduplicated)
 
 **MCP Physics Tools (Enhanced Validation):**
 - search_particle_mcp: Advanced particle search with comprehensive database
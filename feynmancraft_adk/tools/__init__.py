@@ -20,101 +20,148 @@ organized into categories:
 - KB (Knowledge Base): Embedding, search, and retrieval tools
 - Physics: Particle data and physics validation tools
 - Integrations: Third-party integrations like MCP
-"""
-
-# Knowledge Base tools
-from .kb import (
-    # Embedding utilities
-    get_embedding,
-    embed_and_cache,
-    cosine_similarity,
-    find_similar_texts,
-    # KB tool classes
-    LocalKBTool,
-)
 
-# KB data loading and management
-from .kb.data_loader import (
-    load_kb_examples,
-    get_kb_data_path,
-    validate_kb_data,
-    filter_kb_by_topic,
-    filter_kb_by_particles,
-    get_kb_stats,
-)
-
-from .kb.embedding_manager import (
-    KBEmbeddingManager,
-    embed_and_cache_kb,
-    get_kb_manager,
-)
+Exports are resolved on first access (module __getattr__), so importing
+this package, e.g. for one tool in a CLI or batch job, doesn't import the
+others or their dependencies.
+"""
 
-# KB search tools
-from .kb.search import (
-    search_local_tikz_examples,
-    search_tikz_examples,
-    search_tikz_examples_async,
-    rank_results,
-    filter_results_by_confidence,
-)
+import importlib
+from typing import Any, Dict, List, Tuple
 
-# Physics tools
-from .physics import (
-    # Particle data tools
-    search_particle,
-    get_particle_properties,
-    validate_quantum_numbers,
-    get_branching_fractions,
-    compare_particles,
-    convert_units,
-    check_particle_properties,
-)
+# Submodule -> names it exports through this package
+_EXPORTS: Dict[str, Tuple[str, ...]] = {
+    # Knowledge Base tools
+    ".kb": (
+        # Embedding utilities
+        "get_embedding",
+        "embed_and_cache",
+        "embed_batch",
+        "cosine_similarity",
+        "build_normalized_matrix",
+        "top_k_cosine",
+        "find_similar_texts",
+        "EmbeddingCache",
+        "get_embedding_cache",
+        "EmbeddingBatcher",
+        "EmbeddingProvider",
+        "GeminiEmbeddingProvider",
+        "LocalHashingEmbeddingProvider",
+        "get_embedding_provider",
+        "register_embedding_provider",
+        # KB tool classes
+        "LocalKBTool",
+        "KBService",
+        "get_kb_service",
+        # KB data loading and management
+        "load_kb_examples",
+        "get_kb_data_path",
+        "validate_kb_data",
+        "filter_kb_by_topic",
+        "filter_kb_by_particles",
+        "get_kb_stats",
+        "KBRecord",
+        "KBRecordStore",
+        "RecordView",
+        "materialize",
+        "ShardedKBRecordStore",
+        "open_kb",
+        "stream_kb_records",
+        "write_kb_shards",
+        "KBBundle",
+        "build_kb_bundle",
+        "write_kb_bundle",
+        "KBEmbeddingManager",
+        "embed_and_cache_kb",
+        "get_kb_manager",
+        # KB search tools
+        "VectorIndex",
+        "ExactIndex",
+        "AnnoyVectorIndex",
+        "HNSWIndex",
+        "Int8Index",
+        "PQIndex",
+        "create_vector_index",
+        "save_vector_index",
+        "load_vector_index",
+        "open_store_index",
+        "search_local_tikz_examples",
+        "search_local_tikz_examples_many",
+        "search_tikz_examples",
+        "search_tikz_examples_async",
+        "rank_results",
+        "filter_results_by_confidence",
+    ),
+    # Physics particle data tools
+    ".physics": (
+        "search_particle",
+        "get_particle_properties",
+        "validate_quantum_numbers",
+        "get_branching_fractions",
+        "compare_particles",
+        "convert_units",
+        "check_particle_properties",
+    ),
+    # Physics data loading and management
+    ".physics.data_loader": (
+        "load_physics_rules",
+        "get_rules_data_path",
+        "validate_rules_data",
+        "filter_rules_by_category",
+        "search_rules_by_keyword",
+        "get_rule_by_number",
+        "get_rules_stats",
+        "create_rule_index",
+    ),
+    ".physics.embedding_manager": (
+        "RulesEmbeddingManager",
+        "embed_and_cache_rules",
+        "get_rules_manager",
+    ),
+    # Physics search tools
+    ".physics.search": (
+        "search_physics_rules",
+        "search_physics_rules_many",
+        "filter_rules_by_type",
+        "rank_rules",
+        "search_rules_by_particles",
+        "search_rules_by_process",
+        "get_conservation_rules",
+        "validate_process_against_rules",
+    ),
+    # Natural language physics parsing
+    ".physics.physics_tools": ("parse_natural_language_physics",),
+    # MCP integration tools
+    ".integrations": (
+        "search_particle_mcp",
+        "get_particle_properties_mcp",
+        "validate_quantum_numbers_mcp",
+        "get_branching_fractions_mcp",
+        "compare_particles_mcp",
+        "convert_units_mcp",
+        "check_particle_properties_mcp",
+    ),
+}
 
-# Physics data loading and management
-from .physics.data_loader import (
-    load_physics_rules,
-    get_rules_data_path,
-    validate_rules_data,
-    filter_rules_by_category,
-    filter_rules_by_particles as filter_physics_rules_by_particles,
-    search_rules_by_keyword,
-    get_rule_by_number,
-    get_rules_stats,
-    create_rule_index,
-)
+# Exported name -> (submodule, name in the submodule)
+_LAZY_EXPORTS: Dict[str, Tuple[str, str]] = {
+    name: (module, name) for module, names in _EXPORTS.items() for name in names
+}
+_LAZY_EXPORTS["filter_physics_rules_by_particles"] = (".physics.data_loader", "filter_rules_by_particles")
 
-from .physics.embedding_manager import (
-    RulesEmbeddingManager,
-    embed_and_cache_rules,
-    get_rules_manager,
-)
 
-# Physics search tools
-from .physics.search import (
-    search_physics_rules,
-    filter_rules_by_type,
-    rank_rules,
-    search_rules_by_particles,
-    search_rules_by_process,
-    get_conservation_rules,
-    validate_process_against_rules,
-)
+def __getattr__(name: str) -> Any:
+    """Import an exported name from its submodule on first access."""
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module, attribute = _LAZY_EXPORTS[name]
+    value = getattr(importlib.import_module(module, __name__), attribute)
+    globals()[name] = value
+    return value
 
-# Natural language physics parsing
-from .physics.physics_tools import (
-    parse_natural_language_physics,
-)
 
-# MCP integration tools
-from .integrations import (
-    search_particle_mcp,
-    get_particle_properties_mcp,
-    validate_quantum_numbers_mcp,
-    get_branching_fractions_mcp,
-    compare_particles_mcp,
-    convert_units_mcp,
-    check_particle_properties_mcp,
-)
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
 # LaTeX compilation tools removed - using prompt-based validation
 
@@ -122,9 +169,32 @@ __all__ = [
     # KB embedding utilities
     "get_embedding",
     "embed_and_cache",
+    "embed_batch",
     "cosine_similarity",
+    "build_normalized_matrix",
+    "top_k_cosine",
     "find_similar_texts",
+    "EmbeddingCache",
+    "get_embedding_cache",
+    "EmbeddingBatcher",
+    "EmbeddingProvider",
+    "GeminiEmbeddingProvider",
+    "LocalHashingEmbeddingProvider",
+    "get_embedding_provider",
+    "register_embedding_provider",
     "LocalKBTool",
+    "KBService",
+    "VectorIndex",
+    "ExactIndex",
+    "AnnoyVectorIndex",
+    "HNSWIndex",
+    "Int8Index",
+    "PQIndex",
+    "create_vector_index",
+    "save_vector_index",
+    "load_vector_index",
+    "open_store_index",
+    "get_kb_service",
     
     # KB data loading and management
     "load_kb_examples",
@@ -133,12 +203,24 @@ __all__ = [
     "filter_kb_by_topic",
     "filter_kb_by_particles",
     "get_kb_stats",
+    "KBRecord",
+    "KBRecordStore",
+    "RecordView",
+    "materialize",
+    "ShardedKBRecordStore",
+    "open_kb",
+    "stream_kb_records",
+    "write_kb_shards",
+    "KBBundle",
+    "build_kb_bundle",
+    "write_kb_bundle",
     "KBEmbeddingManager",
     "embed_and_cache_kb",
     "get_kb_manager",
     
     # KB search tools
     "search_local_tikz_examples",
+    "search_local_tikz_examples_many",
     "search_tikz_examples",
     "search_tikz_examples_async",
     "rank_results",
@@ -169,6 +251,7 @@ __all__ = [
     
     # Physics search tools
     "search_physics_rules",
+    "search_physics_rules_many",
     "filter_rules_by_type",
     "rank_rules",
     "search_rules_by_particles",
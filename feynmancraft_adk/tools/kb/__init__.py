@@ -1,49 +1,112 @@
 """
 Knowledge Base tools for FeynmanCraft ADK.
+
+Exports are resolved on first access (module __getattr__), so importing
+the package doesn't import numpy, the embedding SDKs or the search and
+index modules until one of their names is used.
 """
 
-from .embeddings import (
-    get_embedding,
-    embed_and_cache,
-    cosine_similarity,
-    find_similar_texts
-)
+import importlib
+from typing import Any, Dict, List, Tuple
+
+# Submodule -> names it exports through this package
+_EXPORTS: Dict[str, Tuple[str, ...]] = {
+    ".embeddings": (
+        "get_embedding",
+        "embed_and_cache",
+        "embed_batch",
+        "cosine_similarity",
+        "build_normalized_matrix",
+        "top_k_cosine",
+        "find_similar_texts",
+    ),
+    ".embedding_cache": ("EmbeddingCache", "get_embedding_cache"),
+    ".embedding_batcher": ("EmbeddingBatcher",),
+    ".embedding_providers": (
+        "EmbeddingProvider",
+        "GeminiEmbeddingProvider",
+        "LocalHashingEmbeddingProvider",
+        "get_embedding_provider",
+        "register_embedding_provider",
+    ),
+    ".data_loader": (
+        "load_kb_examples",
+        "get_kb_data_path",
+        "validate_kb_data",
+        "filter_kb_by_topic",
+        "filter_kb_by_particles",
+        "get_kb_stats",
+    ),
+    ".records": ("KBRecord", "KBRecordStore", "RecordView", "materialize"),
+    ".ingest": ("ShardedKBRecordStore", "open_kb", "stream_kb_records", "write_kb_shards"),
+    ".bundle": ("KBBundle", "build_kb_bundle", "write_kb_bundle"),
+    ".embedding_manager": ("KBEmbeddingManager", "embed_and_cache_kb", "get_kb_manager"),
+    ".vector_index": (
+        "VectorIndex",
+        "ExactIndex",
+        "AnnoyVectorIndex",
+        "HNSWIndex",
+        "Int8Index",
+        "PQIndex",
+        "create_vector_index",
+        "save_vector_index",
+        "load_vector_index",
+        "open_store_index",
+    ),
+    ".service": ("KBService", "get_kb_service"),
+    ".search": (
+        "search_local_tikz_examples",
+        "search_local_tikz_examples_many",
+        "search_tikz_examples",
+        "search_tikz_examples_async",
+        "rank_results",
+        "filter_results_by_confidence",
+    ),
+    ".local": ("LocalKBTool",),
+}
+
+_LAZY_EXPORTS: Dict[str, str] = {
+    name: module for module, names in _EXPORTS.items() for name in names
+}
+
 
-from .data_loader import (
-    load_kb_examples,
-    get_kb_data_path,
-    validate_kb_data,
-    filter_kb_by_topic,
-    filter_kb_by_particles,
-    get_kb_stats,
-)
+def __getattr__(name: str) -> Any:
+    """Import an exported name from its submodule on first access."""
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        value = getattr(importlib.import_module(module, __name__), name)
+    except ImportError:
+        if name != "LocalKBTool":
+            raise
+        # KB tool classes are optional
+        value = None
+    globals()[name] = value
+    return value
 
-from .embedding_manager import (
-    KBEmbeddingManager,
-    embed_and_cache_kb,
-    get_kb_manager,
-)
 
-from .search import (
-    search_local_tikz_examples,
-    search_tikz_examples,
-    search_tikz_examples_async,
-    rank_results,
-    filter_results_by_confidence,
-)
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_EXPORTS))
 
-# Import KB tool classes
-try:
-    from .local import LocalKBTool
-except ImportError:
-    LocalKBTool = None
 
 __all__ = [
     # Embedding utilities
     "get_embedding",
     "embed_and_cache",
+    "embed_batch",
     "cosine_similarity",
+    "build_normalized_matrix",
+    "top_k_cosine",
     "find_similar_texts",
+    "EmbeddingCache",
+    "get_embedding_cache",
+    "EmbeddingBatcher",
+    "EmbeddingProvider",
+    "GeminiEmbeddingProvider",
+    "LocalHashingEmbeddingProvider",
+    "get_embedding_provider",
+    "register_embedding_provider",
     
     # Data loading
     "load_kb_examples",
@@ -52,6 +115,17 @@ __all__ = [
     "filter_kb_by_topic",
     "filter_kb_by_particles",
     "get_kb_stats",
+    "KBRecord",
+    "KBRecordStore",
+    "RecordView",
+    "materialize",
+    "ShardedKBRecordStore",
+    "open_kb",
+    "stream_kb_records",
+    "write_kb_shards",
+    "KBBundle",
+    "build_kb_bundle",
+    "write_kb_bundle",
     
     # Embedding management
     "KBEmbeddingManager",
@@ -60,6 +134,7 @@ __all__ = [
     
     # Search tools
     "search_local_tikz_examples",
+    "search_local_tikz_examples_many",
     "search_tikz_examples",
     "search_tikz_examples_async",
     "rank_results",
@@ -67,4 +142,16 @@ __all__ = [
     
     # Tool classes
     "LocalKBTool",
+    "KBService",
+    "VectorIndex",
+    "ExactIndex",
+    "AnnoyVectorIndex",
+    "HNSWIndex",
+    "Int8Index",
+    "PQIndex",
+    "create_vector_index",
+    "save_vector_index",
+    "load_vector_index",
+    "open_store_index",
+    "get_kb_service",
 ]
\ No newline at end of file
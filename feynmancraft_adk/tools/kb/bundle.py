@@ -0,0 +1,589 @@
+"""
+Single-file, versioned KB bundle for fast cold starts.
+
+Without a bundle a cold start parses the KB file, tokenizes every record for
+the BM25 and metadata indexes, and opens the vector index and embedding store
+from separate files that are only tied to the KB by the content hash in
+their manifests. A bundle packs all of it into one file written atomically
+by ``python -m feynmancraft_adk.tools.kb.bundle``:
+
+- a 64-byte prefix: magic, format version and the position of the table
+- sections, each 64-byte aligned: the records (one JSON object per record,
+  TikZ bodies in their own section), the packed BM25 and metadata indexes,
+  the KB embedding matrix and the vector index payload
+- the table: a JSON object with the format version, the KB content hash,
+  the record fields, the embedding model, the vector index manifest and
+  the offset, length and type of every section
+
+Opening a bundle maps the file and reads only the table. Arrays are views
+of the mapping, records are decoded one by one when first accessed, and
+posting lists when a query first looks them up, so time to first query no
+longer depends on the size of the KB. Since the records and every index
+come from the same file, an index can never describe a different KB
+version than the records it is served with.
+
+Point KnowledgeBaseConfig.local_kb_path (KB_PATH) at a bundle to serve from
+it; ingest.open_kb recognizes bundles by their magic.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import logging
+
+import numpy as np
+
+from ...shared_libraries.config import config
+from .lexical import BM25Index, get_lexical_index, set_lexical_index
+from .metadata import MetadataIndex, get_metadata_index, set_metadata_index
+from .records import (
+    LAZY_FIELD,
+    _LAZY,
+    _MISSING,
+    KBRecord,
+    KBRecordStore,
+    RecordView,
+    compute_records_hash,
+)
+from .vector_index import (
+    IndexPayload,
+    VectorIndex,
+    load_index_payload,
+    save_vector_index,
+)
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b"FKBUNDLE"
+BUNDLE_FORMAT_VERSION = 1
+
+# Magic, format version, table offset, table length
+_PREFIX = struct.Struct("<8sI4xQQ")
+_PREFIX_SIZE = 64
+_ALIGN = 64
+
+
+def is_kb_bundle(path: Union[str, Path]) -> bool:
+    """Check whether a path is a KB bundle file."""
+    path = Path(path)
+    if not path.is_file():
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+
+
+class _BundleWriter:
+    """Appends aligned sections to a temporary file and finishes with the table."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+        self.sections: Dict[str, Dict[str, Any]] = {}
+        self._file = open(self.tmp, "wb")
+        self._file.write(b"\0" * _PREFIX_SIZE)
+
+    def _begin(self, name: str) -> int:
+        if name in self.sections:
+            raise ValueError(f"Duplicate bundle section: {name}")
+        position = self._file.tell()
+        padding = -position % _ALIGN
+        self._file.write(b"\0" * padding)
+        return position + padding
+
+    def add_bytes(self, name: str, chunks: Iterable[bytes], kind: str = "bytes"):
+        offset = self._begin(name)
+        length = 0
+        for chunk in chunks:
+            self._file.write(chunk)
+            length += len(chunk)
+        self.sections[name] = {"offset": offset, "length": length, "kind": kind}
+
+    def add_json(self, name: str, value: Any):
+        self.add_bytes(name, [json.dumps(value, ensure_ascii=False).encode("utf-8")], kind="json")
+
+    def add_array(self, name: str, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        offset = self._begin(name)
+        if array.nbytes:
+            self._file.write(memoryview(array).cast("B"))
+        self.sections[name] = {
+            "offset": offset,
+            "length": int(array.nbytes),
+            "kind": "array",
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+
+    def finish(self, table: Dict[str, Any]) -> Dict[str, Any]:
+        """Write the table and prefix, move the bundle into place and return the table."""
+        table = {**table, "sections": self.sections}
+        encoded = json.dumps(table, ensure_ascii=False).encode("utf-8")
+        table_offset = self._file.tell()
+        self._file.write(encoded)
+        self._file.seek(0)
+        self._file.write(_PREFIX.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, table_offset, len(encoded)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp, self.path)
+        return table
+
+    def abort(self):
+        self._file.close()
+        if self.tmp.exists():
+            self.tmp.unlink()
+
+
+def _write_records(writer: _BundleWriter, records: Sequence) -> List[str]:
+    """Write the record sections; return the record fields in column order."""
+    fields: Dict[str, None] = {}
+    row_offsets = [0]
+    tikz_offsets = [0]
+    lazy = np.zeros(len(records), dtype=np.uint8)
+
+    def rows():
+        for position, record in enumerate(records):
+            row = {}
+            for key in record:
+                fields.setdefault(key)
+                value = record[key]
+                if key == LAZY_FIELD and isinstance(value, str):
+                    lazy[position] = 1
+                    tikz_offsets.append(tikz_offsets[-1] + len(value.encode("utf-8")))
+                    continue
+                row[key] = list(value) if isinstance(value, tuple) else value
+            if not lazy[position]:
+                tikz_offsets.append(tikz_offsets[-1])
+            encoded = json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            row_offsets.append(row_offsets[-1] + len(encoded))
+            yield encoded
+
+    def tikz():
+        for position, record in enumerate(records):
+            if lazy[position]:
+                yield record[LAZY_FIELD].encode("utf-8")
+
+    writer.add_bytes("records", rows())
+    writer.add_array("record_offsets", np.asarray(row_offsets, dtype=np.int64))
+    writer.add_bytes("tikz", tikz())
+    writer.add_array("tikz_offsets", np.asarray(tikz_offsets, dtype=np.int64))
+    writer.add_array("tikz_lazy", lazy)
+    return list(fields)
+
+
+def _write_packed(writer: _BundleWriter, name: str, packed: Tuple[Dict[str, Any], Dict[str, np.ndarray]]):
+    meta, arrays = packed
+    writer.add_json(name, meta)
+    for key, array in arrays.items():
+        writer.add_array(f"{name}/{key}", array)
+
+
+def _write_index(writer: _BundleWriter, index: VectorIndex, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Write an index's payload files as ``index<suffix>`` sections; return its manifest."""
+    if getattr(index, "vectors_file", None):
+        raise ValueError("Indexes referencing an external vector store cannot be bundled")
+
+    with tempfile.TemporaryDirectory() as directory:
+        stem = Path(directory) / "index"
+        manifest = save_vector_index(index, stem, metadata=metadata)
+        # The bundle is the payload; sections are named by suffix alone
+        prefix = manifest.pop("payload")
+        for path in sorted(Path(directory).iterdir()):
+            if not path.name.startswith(prefix + "."):
+                continue
+            suffix = path.name[len(prefix):]
+            if suffix.endswith(".npy"):
+                writer.add_array(f"index{suffix}", np.load(path, mmap_mode="r"))
+            elif suffix.endswith(".npz"):
+                with np.load(path) as data:
+                    for key in data.files:
+                        writer.add_array(f"index{suffix}/{key}", data[key])
+            else:
+                with open(path, "rb") as f:
+                    writer.add_bytes(f"index{suffix}", iter(lambda: f.read(1 << 20), b""))
+    return manifest
+
+
+def write_kb_bundle(
+    path: Union[str, Path],
+    records: Sequence,
+    content_hash: Optional[str] = None,
+    embeddings: Optional[Tuple[np.ndarray, Sequence[int], str]] = None,
+    index: Optional[Tuple[VectorIndex, Dict[str, Any]]] = None,
+    source: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Atomically write a KB bundle.
+
+    The bundle is written to a temporary file and renamed into place, so
+    processes that have the previous bundle mapped keep reading it.
+
+    Args:
+        path: Bundle file
+        records: KB records, in row order
+        content_hash: Hash of the records (computed if not given)
+        embeddings: Optional (row-normalized matrix, KB position of each row,
+            model name)
+        index: Optional (vector index, index metadata) over the records
+        source: Where the records came from, for the table
+
+    Returns:
+        The bundle table
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if content_hash is None:
+        content_hash = getattr(records, "content_hash", None) or compute_records_hash(records)
+
+    table: Dict[str, Any] = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "content_hash": content_hash,
+        "count": len(records),
+        "source": source,
+        "created_at": time.time(),
+        "vectors": None,
+        "index": None,
+    }
+
+    writer = _BundleWriter(path)
+    try:
+        table["fields"] = _write_records(writer, records)
+        _write_packed(writer, "lexical", get_lexical_index(records).pack())
+        _write_packed(writer, "metadata", get_metadata_index(records).pack())
+
+        if embeddings is not None:
+            matrix, rows, model_name = embeddings
+            dtype = config.knowledge_base.embedding_storage_dtype
+            writer.add_array("vectors", np.asarray(matrix, dtype=dtype))
+            writer.add_array("vectors.rows", np.asarray(rows, dtype=np.int64))
+            table["vectors"] = {
+                "model_name": model_name,
+                "dim": int(matrix.shape[1]),
+                "count": int(matrix.shape[0]),
+                "dtype": dtype,
+            }
+
+        if index is not None:
+            table["index"] = _write_index(writer, *index)
+
+        table = writer.finish(table)
+    except BaseException:
+        writer.abort()
+        raise
+
+    logger.info(f"Wrote KB bundle with {len(records)} records to {path}")
+    return table
+
+
+class _BundlePayload(IndexPayload):
+    """Reads an index payload from a bundle's ``index<suffix>`` sections."""
+
+    def __init__(self, bundle: "KBBundle"):
+        super().__init__(bundle.path)
+        self.bundle = bundle
+
+    def array(self, suffix: str) -> np.ndarray:
+        return self.bundle.array(f"index{suffix}")
+
+    def arrays(self, suffix: str) -> Dict[str, np.ndarray]:
+        prefix = f"index{suffix}/"
+        return {
+            name[len(prefix):]: self.bundle.array(name)
+            for name in self.bundle.sections if name.startswith(prefix)
+        }
+
+    def path(self, suffix: str) -> Path:
+        # Engines that open their file themselves (Annoy) get a copy next to
+        # the bundle, named by content hash so it is extracted once per version
+        target = self.bundle.path.with_name(
+            f"{self.bundle.path.name}.{self.bundle.content_hash[:16]}{suffix}"
+        )
+        if not target.exists():
+            tmp = target.with_name(target.name + f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(self.bundle.section_bytes(f"index{suffix}"))
+            os.replace(tmp, target)
+        return target
+
+    def sibling(self, name: str) -> Path:
+        raise ValueError("Bundled indexes cannot reference external files")
+
+
+class BundleRecordStore(KBRecordStore):
+    """
+    KBRecordStore over a bundle's record sections.
+
+    Each record is decoded the first time it is accessed; TikZ bodies stay
+    in the mapped file and are decoded on read, as in KBRecordStore.
+    """
+
+    def __init__(self, bundle: "KBBundle"):
+        self.bundle = bundle
+        self.source = str(bundle.path)
+        self.offset = 0
+        self.fields = tuple(bundle.table["fields"])
+        self._columns = {field: column for column, field in enumerate(self.fields)}
+        self.content_hash = bundle.content_hash
+        self._rows = bundle.section_bytes("records")
+        self._row_offsets = bundle.array("record_offsets")
+        self._tikz_buffer = bundle.section_bytes("tikz")
+        self._tikz_offsets = bundle.array("tikz_offsets")
+        self._tikz_lazy = bundle.array("tikz_lazy")
+        self._records: List[Optional[KBRecord]] = [None] * bundle.count
+
+    @property
+    def decoded(self) -> int:
+        """Number of records decoded so far."""
+        return sum(record is not None for record in self._records)
+
+    def _record(self, index: int) -> KBRecord:
+        record = self._records[index]
+        if record is None:
+            start, end = self._row_offsets[index], self._row_offsets[index + 1]
+            row = json.loads(bytes(self._rows[start:end]))
+            lazy = bool(self._tikz_lazy[index])
+            values = tuple(
+                self._compact(field, _LAZY if lazy and field == LAZY_FIELD else row.get(field, _MISSING))
+                for field in self.fields
+            )
+            # Concurrent first reads may both decode; either result is equivalent
+            record = self._records[index] = KBRecord(self, index, values)
+        return record
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[KBRecord, List[KBRecord]]:
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("KB record position out of range")
+        return self._record(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._record(index)
+
+    def __repr__(self) -> str:
+        return f"BundleRecordStore({len(self)} records from {self.source}, {self.decoded} decoded)"
+
+    def view(self, index: int, **extra: Any) -> RecordView:
+        return RecordView(self[index], **extra)
+
+
+class KBBundle:
+    """Read-only, memory-mapped KB bundle; sections are read on first use."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a bundle, reading only its table.
+
+        Args:
+            path: Bundle file
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+            ValueError: If it is not a bundle, uses another format version
+                or is truncated
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _PREFIX_SIZE:
+                raise ValueError(f"{self.path} is not a KB bundle")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, table_offset, table_length = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f"{self.path} is not a KB bundle")
+        if version != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"KB bundle format {version} is not supported")
+        if table_offset + table_length > size:
+            raise ValueError(f"KB bundle {self.path} is truncated")
+
+        self.table: Dict[str, Any] = json.loads(self._mmap[table_offset:table_offset + table_length])
+        self.sections: Dict[str, Dict[str, Any]] = self.table["sections"]
+        for name, section in self.sections.items():
+            if section["offset"] + section["length"] > table_offset:
+                raise ValueError(f"KB bundle section {name} is out of bounds")
+
+        self.content_hash: str = self.table["content_hash"]
+        self.count: int = self.table["count"]
+        self._lock = threading.Lock()
+        self._records: Optional[BundleRecordStore] = None
+
+    def __repr__(self) -> str:
+        return f"KBBundle({self.path}, {self.count} records, {self.content_hash[:12]})"
+
+    def section_bytes(self, name: str) -> memoryview:
+        """Zero-copy view of a section."""
+        section = self.sections[name]
+        return memoryview(self._mmap)[section["offset"]:section["offset"] + section["length"]]
+
+    def array(self, name: str) -> np.ndarray:
+        """Read-only array view of an array section."""
+        section = self.sections[name]
+        dtype = np.dtype(section["dtype"])
+        shape = tuple(section["shape"])
+        count = int(np.prod(shape)) if shape else 1
+        return np.frombuffer(self._mmap, dtype=dtype, count=count, offset=section["offset"]).reshape(shape)
+
+    def json(self, name: str) -> Any:
+        """Parse a JSON section."""
+        return json.loads(bytes(self.section_bytes(name)))
+
+    def _packed(self, name: str) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        prefix = f"{name}/"
+        arrays = {
+            section[len(prefix):]: self.array(section)
+            for section in self.sections if section.startswith(prefix)
+        }
+        return self.json(name), arrays
+
+    @property
+    def records(self) -> BundleRecordStore:
+        """
+        The bundle's record store, with its BM25 and metadata indexes registered.
+
+        get_lexical_index() and get_metadata_index() return the bundled
+        indexes for this store instead of building them.
+        """
+        if self._records is None:
+            with self._lock:
+                if self._records is None:
+                    records = BundleRecordStore(self)
+                    set_lexical_index(records, BM25Index.from_packed(*self._packed("lexical")))
+                    set_metadata_index(records, MetadataIndex.from_packed(*self._packed("metadata")))
+                    self._records = records
+        return self._records
+
+    def embeddings(self, model_name: str, upcast: bool = True) -> Optional[Tuple[np.ndarray, List[int]]]:
+        """
+        Get the bundled KB embedding matrix if it was made with a model.
+
+        Args:
+            model_name: Embedding model the caller queries with
+            upcast: Convert a float16 matrix to float32 in memory
+
+        Returns:
+            Tuple of (row-normalized matrix, KB position of each row), or None
+        """
+        vectors = self.table.get("vectors")
+        if not vectors or vectors["model_name"] != model_name:
+            return None
+        matrix = self.array("vectors")
+        if upcast and matrix.dtype != np.float32:
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        return matrix, self.array("vectors.rows").tolist()
+
+    @property
+    def index_manifest(self) -> Optional[Dict[str, Any]]:
+        """Manifest of the bundled vector index (see save_vector_index), if any."""
+        return self.table.get("index")
+
+    def vector_index(self, **param_overrides) -> Optional[VectorIndex]:
+        """
+        Load the bundled vector index; its arrays are views of the bundle.
+
+        Args:
+            **param_overrides: Query-time parameters (see load_vector_index)
+
+        Returns:
+            The index, or None if the bundle has none or it is corrupt
+        """
+        if self.index_manifest is None:
+            return None
+        return load_index_payload(self.index_manifest, _BundlePayload(self), **param_overrides)
+
+
+def build_kb_bundle(
+    output: Optional[Union[str, Path]] = None,
+    kb_path: Optional[Union[str, Path]] = None,
+    include_vectors: bool = True
+) -> Dict[str, Any]:
+    """
+    Build a bundle from a KB, its embeddings and its vector index.
+
+    The KB embeddings store is refreshed first (embedding only new or
+    changed records, see KBEmbeddingManager.refresh_embeddings). The local
+    vector index is reused if it matches the KB and embedding model, and
+    built with the configured engine otherwise.
+
+    Args:
+        output: Bundle file (defaults to KnowledgeBaseConfig.kb_bundle_path)
+        kb_path: KB to bundle (defaults to KnowledgeBaseConfig.local_kb_path)
+        include_vectors: Also bundle the embeddings and vector index
+
+    Returns:
+        The bundle table
+    """
+    from .data_loader import load_kb_examples
+    from .embedding_manager import get_kb_manager
+    from .local import INDEX_STEM, EMB_DIM, index_metadata
+    from .vector_index import create_vector_index, load_vector_index
+
+    output = Path(output or config.knowledge_base.kb_bundle_path)
+    kb_path = str(kb_path or config.knowledge_base.local_kb_path)
+    records = load_kb_examples(kb_path, reload=True)
+    content_hash = getattr(records, "content_hash", None) or compute_records_hash(records)
+
+    embeddings = index = None
+    if include_vectors:
+        manager = get_kb_manager()
+        stats = manager.refresh_embeddings(records)
+        logger.info(f"KB embeddings refreshed: {stats}")
+        if manager.embedding_matrix is None:
+            raise RuntimeError("No KB embeddings available")
+        matrix, rows = manager.embedding_matrix, list(manager.matrix_rows)
+        embeddings = (matrix, rows, manager.model_name)
+
+        metadata = index_metadata(content_hash, len(records), manager.model_name)
+        loaded = load_vector_index(INDEX_STEM)
+        if loaded is not None and loaded[1].get("metadata") == metadata:
+            vector_index = loaded[0]
+        else:
+            vector_index = create_vector_index(dim=EMB_DIM)
+            logger.info(f"Building {vector_index.engine} index over {len(rows)} vectors...")
+            vector_index.build(matrix, rows)
+        index = (vector_index, metadata)
+
+    return write_kb_bundle(
+        output, records, content_hash=content_hash, embeddings=embeddings,
+        index=index, source=kb_path,
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build a single-file KB bundle.")
+    parser.add_argument("--kb", type=Path, default=None,
+                        help="KB file or shard directory (defaults to KB_PATH)")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Bundle file (defaults to KB_BUNDLE_PATH)")
+    parser.add_argument("--no-vectors", action="store_true",
+                        help="Only bundle the records and lexical indexes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    table = build_kb_bundle(args.output, args.kb, include_vectors=not args.no_vectors)
+    summary = {
+        "output": str(args.output or config.knowledge_base.kb_bundle_path),
+        "count": table["count"],
+        "content_hash": table["content_hash"],
+        "vectors": table["vectors"],
+        "index_engine": (table["index"] or {}).get("engine"),
+        "sections": len(table["sections"]),
+    }
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
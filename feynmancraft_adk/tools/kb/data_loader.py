@@ -4,34 +4,51 @@ Data loading utilities for Knowledge Base.
 
 import json
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Union
 import logging
 
+from ...shared_libraries.config import config
+from .lexical import get_lexical_index
+from .ingest import ShardedKBRecordStore, open_kb, validate_record
+from .records import KBRecordStore
+
 logger = logging.getLogger(__name__)
 
+# Record stores opened so far, by absolute path; shared by every KB search path
+_stores: Dict[str, Union[KBRecordStore, ShardedKBRecordStore]] = {}
+_stores_lock = threading.Lock()
+
 
 def get_kb_data_path() -> str:
     """
     Get the path to the KB data file.
     
     Returns:
-        Absolute path to feynman_kb.json
+        Absolute path to the KB file or shard directory
+        (KnowledgeBaseConfig.local_kb_path)
     """
-    # Navigate from tools/kb to data directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(current_dir, "..", "..", "data", "feynman_kb.json")
-    return os.path.normpath(data_path)
+    return str(config.knowledge_base.local_kb_path)
 
 
-def load_kb_examples(path: Optional[str] = None) -> List[Dict[str, Any]]:
+def load_kb_examples(
+    path: Optional[str] = None,
+    reload: bool = False
+) -> Union[KBRecordStore, ShardedKBRecordStore]:
     """
-    Load KB examples from JSON file.
+    Load KB examples from a JSON array, a JSONL file or a shard directory.
+    
+    Files are streamed (see ingest.stream_kb_records) into a shared,
+    read-only record store once per process; later calls return the same
+    store until reload is set. Shard directories are opened from their
+    manifest and each shard is parsed on first access.
     
     Args:
         path: Optional custom path to KB file. If None, uses default path.
+        reload: Re-read the file and replace the shared store
         
     Returns:
-        List of KB examples
+        Read-only sequence of KB records (Mappings)
         
     Raises:
         FileNotFoundError: If the KB file doesn't exist
@@ -39,21 +56,30 @@ def load_kb_examples(path: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     if path is None:
         path = get_kb_data_path()
+    key = os.path.abspath(path)
+    
+    store = _stores.get(key)
+    if store is not None and not reload:
+        return store
         
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            logger.info(f"Loaded {len(data)} KB examples from {path}")
-            return data
-    except FileNotFoundError:
-        logger.error(f"KB file not found at {path}")
-        raise
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in KB file: {e}")
-        raise
-
-
-def validate_kb_data(examples: List[Dict[str, Any]]) -> List[str]:
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None and not reload:
+            return store
+            
+        try:
+            store = open_kb(path)
+        except FileNotFoundError:
+            logger.error(f"KB file not found at {path}")
+            raise
+        except json.JSONDecodeError as e:
+            logger.error(f"Invalid JSON in KB file: {e}")
+            raise
+        _stores[key] = store
+        return store
+
+
+def validate_kb_data(examples: Sequence[Dict[str, Any]]) -> List[str]:
     """
     Validate KB data format and content.
     
@@ -67,38 +93,18 @@ def validate_kb_data(examples: List[Dict[str, Any]]) -> List[str]:
     required_fields = ["id", "topic", "description", "tikz"]
     
     for i, example in enumerate(examples):
-        # Check required fields
-        for field in required_fields:
-            if field not in example:
-                errors.append(f"Example {i}: Missing required field '{field}'")
-                
-        # Validate field types
-        if "id" in example and not isinstance(example["id"], (str, int)):
-            errors.append(f"Example {i}: 'id' must be string or int")
-            
-        if "topic" in example and not isinstance(example["topic"], str):
-            errors.append(f"Example {i}: 'topic' must be string")
-            
-        if "description" in example and not isinstance(example["description"], str):
-            errors.append(f"Example {i}: 'description' must be string")
-            
-        if "tikz" in example and not isinstance(example["tikz"], str):
-            errors.append(f"Example {i}: 'tikz' must be string")
-            
-        # Validate optional fields
-        if "particles" in example and not isinstance(example["particles"], list):
-            errors.append(f"Example {i}: 'particles' must be list")
-            
-        if "reaction" in example and not isinstance(example["reaction"], str):
-            errors.append(f"Example {i}: 'reaction' must be string")
+        errors.extend(validate_record(example, i, required_fields))
             
     return errors
 
 
-def filter_kb_by_topic(examples: List[Dict[str, Any]], topic: str) -> List[Dict[str, Any]]:
+def filter_kb_by_topic(examples: Sequence[Dict[str, Any]], topic: str) -> List[Dict[str, Any]]:
     """
     Filter KB examples by topic.
     
+    Candidates come from the topic vocabulary of the shared lexical index,
+    so only those are checked with a substring match.
+    
     Args:
         examples: List of KB examples
         topic: Topic to filter by (case-insensitive)
@@ -107,13 +113,16 @@ def filter_kb_by_topic(examples: List[Dict[str, Any]], topic: str) -> List[Dict[
         Filtered list of examples
     """
     topic_lower = topic.lower()
+    candidates = get_lexical_index(examples).substring_candidates("topic", topic)
+    if candidates is None:
+        candidates = range(len(examples))
     return [
-        example for example in examples
-        if topic_lower in example.get("topic", "").lower()
+        examples[i] for i in sorted(candidates)
+        if topic_lower in examples[i].get("topic", "").lower()
     ]
 
 
-def filter_kb_by_particles(examples: List[Dict[str, Any]], particles: List[str]) -> List[Dict[str, Any]]:
+def filter_kb_by_particles(examples: Sequence[Dict[str, Any]], particles: List[str]) -> List[Dict[str, Any]]:
     """
     Filter KB examples by particles involved.
     
@@ -129,7 +138,7 @@ def filter_kb_by_particles(examples: List[Dict[str, Any]], particles: List[str])
     
     for example in examples:
         example_particles = example.get("particles", [])
-        if isinstance(example_particles, list):
+        if isinstance(example_particles, (list, tuple)):
             example_particles_lower = [p.lower() for p in example_particles]
             if any(p in example_particles_lower for p in particles_lower):
                 filtered.append(example)
@@ -137,7 +146,7 @@ def filter_kb_by_particles(examples: List[Dict[str, Any]], particles: List[str])
     return filtered
 
 
-def get_kb_stats(examples: List[Dict[str, Any]]) -> Dict[str, Any]:
+def get_kb_stats(examples: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Get statistics about the KB data.
     
@@ -0,0 +1,152 @@
+"""
+Batched embedding generation for index and cache builds.
+
+EmbeddingBatcher splits a list of texts into chunks, sends each chunk as one
+batch embedding request with bounded concurrency and per-chunk retries, and
+reports progress as chunks complete. For remote providers, texts already in
+the persistent embedding cache are not sent, and fresh results are written
+back to it.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+import logging
+
+from ...shared_libraries.config import config
+from .embedding_providers import get_embedding_provider
+from .embeddings import (
+    QUERY_TASK_TYPE,
+    embed_batch,
+    get_cached_embeddings,
+    store_cached_embeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class EmbeddingBatcher:
+    """Embed many texts through chunked batch requests."""
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        task_type: str = QUERY_TASK_TYPE,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_backoff: float = 1.0,
+        progress_callback: Optional[ProgressCallback] = None
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            model_name: Name of the embedding model (defaults to ModelConfig.embedding_model)
+            task_type: Embedding task type
+            batch_size: Texts per request (defaults to ModelConfig.embedding_batch_size)
+            max_concurrency: Requests in flight (defaults to ModelConfig.embedding_concurrency)
+            max_retries: Attempts per chunk (defaults to APIConfig.retry_attempts)
+            retry_backoff: Base delay in seconds, doubled after each failed attempt
+            progress_callback: Called with (texts_done, texts_total) after each chunk
+        """
+        self.provider = get_embedding_provider(model_name)
+        self.model_name = self.provider.name
+        self.task_type = task_type
+        self.batch_size = max(1, batch_size or config.models.embedding_batch_size)
+        self.max_concurrency = max(1, max_concurrency or config.models.embedding_concurrency)
+        self.max_retries = max(1, max_retries or config.api.retry_attempts)
+        self.retry_backoff = retry_backoff
+        self.progress_callback = progress_callback
+        self.requests_sent = 0
+        self._lock = threading.Lock()
+
+    def _embed_chunk(self, chunk: List[str]) -> List[Optional[List[float]]]:
+        """Embed one chunk, retrying with exponential backoff."""
+        delay = self.retry_backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with self._lock:
+                    self.requests_sent += 1
+                return embed_batch(chunk, self.model_name, self.task_type)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(
+                        f"Embedding chunk of {len(chunk)} texts failed after {attempt} attempts: {e}"
+                    )
+                    return [None] * len(chunk)
+                logger.warning(f"Embedding chunk failed (attempt {attempt}), retrying: {e}")
+                time.sleep(delay)
+                delay *= 2
+        return [None] * len(chunk)
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed texts, returning one vector (or None on failure) per input.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embeddings aligned with texts
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        total = len(unique_texts)
+        resolved: Dict[str, Optional[List[float]]] = {}
+        pending: List[str] = []
+
+        cached: Dict[str, List[float]] = {}
+        if self.provider.remote:
+            cached = get_cached_embeddings(unique_texts, self.model_name, self.task_type)
+        for text in unique_texts:
+            resolved[text] = cached.get(text) or None
+            if resolved[text] is None:
+                pending.append(text)
+
+        done = total - len(pending)
+        if done:
+            logger.info(f"{done}/{total} embeddings served from cache")
+        self._report(done, total)
+
+        chunks = [
+            pending[i:i + self.batch_size]
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        if chunks:
+            logger.info(
+                f"Embedding {len(pending)} texts in {len(chunks)} batch requests "
+                f"(batch_size={self.batch_size}, concurrency={self.max_concurrency})"
+            )
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {executor.submit(self._embed_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                fresh = {}
+                for text, embedding in zip(chunk, future.result()):
+                    resolved[text] = embedding or None
+                    if embedding:
+                        fresh[text] = embedding
+                if self.provider.remote:
+                    store_cached_embeddings(fresh, self.model_name, self.task_type)
+                done += len(chunk)
+                self._report(done, total)
+
+        return [resolved[text] for text in texts]
+
+    async def aembed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Async variant of embed that runs the requests off the event loop."""
+        return await asyncio.to_thread(self.embed, texts)
+
+    def _report(self, done: int, total: int):
+        """Forward progress to the callback, if any."""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(min(done, total), total)
+        except Exception as e:
+            logger.warning(f"Progress callback failed: {e}")
@@ -0,0 +1,351 @@
+"""
+Persistent, content-addressed cache for text embeddings.
+
+Embeddings are stored in SQLite keyed by a hash of (model, task type,
+normalized text), so they survive process restarts and are shared by every
+worker process on the host. The cache is bounded by entry count (least
+recently used entries are evicted first) and by an optional TTL.
+
+Hits only read the database: their access times are collected in memory
+and written with the process's next write, eviction pass or close, so
+lookups from many workers never queue for the SQLite write lock.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import logging
+
+import numpy as np
+
+from ...shared_libraries.config import config
+
+logger = logging.getLogger(__name__)
+
+# Number of writes between eviction passes
+_EVICTION_INTERVAL = 256
+
+# Keys per SELECT ... IN (...) statement, below SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+# Pending access times written on their own once this many keys were hit
+_TOUCH_FLUSH_SIZE = 1024
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache safe for concurrent threads and processes.
+
+    Each process lazily opens its own connection (WAL mode), so the cache
+    can be shared across forked workers.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_entries: int = 50000,
+        ttl_seconds: Optional[float] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file
+            max_entries: Maximum number of cached embeddings
+            ttl_seconds: Entries older than this are treated as misses (None disables)
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        # key -> last access time of hits not yet written
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this process's connection, opening it on first use or after fork."""
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " task_type TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access"
+            " ON embeddings (last_access)"
+        )
+        conn.commit()
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """
+        Look up a cached embedding.
+
+        Args:
+            key: Content-addressed key (see embeddings.embedding_cache_key)
+
+        Returns:
+            Embedding vector, or None on a miss
+        """
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            vector, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                return None
+
+            self._touch(conn, [key], now)
+            self.hits += 1
+
+        return np.frombuffer(vector, dtype=np.float32).tolist()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Look up several cached embeddings with one query per chunk of keys.
+
+        Args:
+            keys: Content-addressed keys (see embeddings.embedding_cache_key)
+
+        Returns:
+            Mapping of the keys that hit to their embedding vectors
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        now = time.time()
+        found: Dict[str, List[float]] = {}
+        expired: List[str] = []
+
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, vector, created_at in rows:
+                    if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                        expired.append(key)
+                    else:
+                        found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if expired:
+                conn.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k in expired])
+                conn.commit()
+            self._touch(conn, found, now)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+
+        return found
+
+    def put(self, key: str, embedding: List[float], model_name: str, task_type: str):
+        """
+        Store an embedding.
+
+        Args:
+            key: Content-addressed key (see embeddings.embedding_cache_key)
+            embedding: Embedding vector
+            model_name: Embedding model name
+            task_type: Embedding task type
+        """
+        if not embedding:
+            return
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings"
+                " (key, model, task_type, dim, vector, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model_name, task_type.lower(), vector.shape[0],
+                 vector.tobytes(), now, now)
+            )
+            self._write_touched(conn)
+            conn.commit()
+
+            self._writes += 1
+            if self._writes % _EVICTION_INTERVAL == 0:
+                self._evict(conn)
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]], model_name: str, task_type: str):
+        """
+        Store several embeddings in one transaction.
+
+        Args:
+            items: (key, embedding) pairs; empty embeddings are skipped
+            model_name: Embedding model name
+            task_type: Embedding task type
+        """
+        now = time.time()
+        rows = []
+        for key, embedding in items:
+            if not embedding:
+                continue
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((key, model_name, task_type.lower(), vector.shape[0], vector.tobytes(), now, now))
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings"
+                " (key, model, task_type, dim, vector, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._write_touched(conn)
+            conn.commit()
+
+            before = self._writes
+            self._writes += len(rows)
+            if self._writes // _EVICTION_INTERVAL != before // _EVICTION_INTERVAL:
+                self._evict(conn)
+
+    def _touch(self, conn: sqlite3.Connection, keys: Iterable[str], now: float):
+        """Record hits; their access times are written once enough are pending."""
+        for key in keys:
+            self._touched[key] = now
+        if len(self._touched) >= _TOUCH_FLUSH_SIZE:
+            try:
+                self._write_touched(conn)
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                # Busy with another process's write; access times are only an eviction hint
+                logger.debug(f"Deferred embedding cache access times: {e}")
+
+    def _write_touched(self, conn: sqlite3.Connection):
+        """Write pending access times in the caller's transaction."""
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(at, key) for key, at in touched.items()]
+        )
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then least recently used ones above the bound."""
+        self._write_touched(conn)
+        if self.ttl_seconds:
+            conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            logger.info(f"Evicted {excess} entries from embedding cache")
+        conn.commit()
+
+    def evict(self):
+        """Run an eviction pass now."""
+        with self._lock:
+            self._evict(self._connection())
+
+    def clear(self):
+        """Remove all cached embeddings."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+
+    def stats(self) -> dict:
+        """Get cache size and hit statistics for this process."""
+        with self._lock:
+            (count,) = self._connection().execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {
+            "path": str(self.path),
+            "entries": count,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        """Write pending access times and close this process's connection."""
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                try:
+                    self._write_touched(self._conn)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not write embedding cache access times: {e}")
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the process-wide embedding cache.
+
+    Returns:
+        The shared EmbeddingCache, or None if caching is disabled
+    """
+    global _cache
+
+    kb_config = config.knowledge_base
+    if not kb_config.embedding_cache_enabled:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    kb_config.embedding_cache_path,
+                    max_entries=kb_config.embedding_cache_max_entries,
+                    ttl_seconds=kb_config.embedding_cache_ttl_seconds or None,
+                )
+    return _cache
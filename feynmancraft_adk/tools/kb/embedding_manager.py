@@ -2,16 +2,27 @@
 KB Embedding Manager with singleton pattern for managing embeddings cache.
 """
 
-import os
-import json
-import pickle
 import asyncio
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Sequence
 import logging
 from pathlib import Path
 
+import numpy as np
+
+from ...shared_libraries.config import config
 from .data_loader import load_kb_examples
-from .embeddings import get_embedding
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_providers import default_embedding_model
+from .embeddings import _hash_text, build_normalized_matrix
+from .vector_index import delete_vector_index, open_store_index, quantized_index_stem
+from .vector_store import (
+    compute_content_hash,
+    delete_vector_store,
+    load_vector_store,
+    save_vector_store,
+    store_stem,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,44 +36,98 @@ class KBEmbeddingManager:
     """
     
     _instance = None
+    # Created on first use; threads may race to create it
+    _instance_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            # Initialize instance variables
-            cls._instance.kb_examples = []
-            cls._instance.embeddings_cache = {}
-            cls._instance.model_name = "models/text-embedding-004"
-            cls._instance.is_initialized = False
-            cls._instance._lock = asyncio.Lock()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls._create()
         return cls._instance
     
+    @classmethod
+    def _create(cls) -> "KBEmbeddingManager":
+        """Create a manager with empty state, without making it the singleton."""
+        instance = super().__new__(cls)
+        # Initialize instance variables
+        instance.kb_examples = []
+        instance.embeddings_cache = {}
+        instance.embedding_matrix = None
+        instance._vector_index = None
+        instance._index_lock = threading.Lock()
+        instance.matrix_rows = []
+        instance._example_rows = {}
+        instance.model_name = default_embedding_model()
+        instance.is_initialized = False
+        instance._lock = asyncio.Lock()
+        instance._store_lock = threading.Lock()
+        return instance
+    
+    @classmethod
+    def reload(cls, examples: Optional[Sequence[Dict[str, Any]]] = None) -> "KBEmbeddingManager":
+        """
+        Load the KB and its embeddings into a new manager and swap it in.
+        
+        The new manager is fully prepared in the calling thread (only new
+        or changed examples are embedded, see refresh_embeddings, and the
+        vector index is built) before it replaces the singleton. Searches
+        holding the previous manager finish on it, so a search never mixes
+        two KB versions. Blocks while embedding; call it off the event loop.
+        
+        Args:
+            examples: KB examples to load; re-read from disk if None
+            
+        Returns:
+            The new manager
+        """
+        current = cls._instance
+        fresh = cls._create()
+        if current is not None:
+            fresh.model_name = current.model_name
+            # The store files are shared, so refreshes still run one at a time
+            fresh._store_lock = current._store_lock
+            
+        fresh.refresh_embeddings(examples)
+        # Build the search index now rather than on the first query
+        fresh.vector_index
+        fresh.is_initialized = True
+        with cls._instance_lock:
+            cls._instance = fresh
+        logger.info(f"Swapped in KB embedding manager with {len(fresh.kb_examples)} examples")
+        return fresh
+    
     @property
     def cache_dir(self) -> Path:
         """Get the cache directory for storing embeddings."""
-        # Navigate from tools/kb to data/embeddings
-        current_dir = Path(__file__).parent
-        cache_dir = current_dir.parent.parent / "data" / "embeddings"
+        cache_dir = config.knowledge_base.embeddings_dir
         cache_dir.mkdir(parents=True, exist_ok=True)
         return cache_dir
     
     @property
-    def cache_file(self) -> Path:
-        """Get the cache file path."""
-        return self.cache_dir / "kb_embeddings.pkl"
+    def store_path(self) -> Path:
+        """Get the vector store path (without extension)."""
+        return store_stem(self.cache_dir, "kb_embeddings", self.model_name)
     
     def reset(self):
         """Reset the manager state. Useful for testing."""
         self.kb_examples = []
         self.embeddings_cache = {}
+        self.embedding_matrix = None
+        self._vector_index = None
+        self.matrix_rows = []
+        self._example_rows = {}
         self.is_initialized = False
     
     async def initialize(self, force_regenerate: bool = False):
         """
         Initialize the embedding manager.
         
+        If the stored embeddings are stale, only new or changed examples are
+        re-embedded (see refresh_embeddings).
+        
         Args:
-            force_regenerate: If True, regenerate embeddings even if cache exists
+            force_regenerate: If True, regenerate all embeddings even if cache exists
         """
         async with self._lock:
             if self.is_initialized and not force_regenerate:
@@ -79,57 +144,55 @@ class KBEmbeddingManager:
                 self.is_initialized = True
                 return
                 
-            # Generate embeddings
-            await self.generate_embeddings()
-            
-            # Save to cache
-            self.save_embeddings()
+            if force_regenerate:
+                # Generate embeddings
+                await self.generate_embeddings()
+                self._build_matrix()
+                
+                # Save to cache
+                self.save_embeddings()
+            else:
+                await asyncio.to_thread(self.refresh_embeddings, self.kb_examples)
             
             self.is_initialized = True
             logger.info("KB Embedding Manager initialized successfully")
     
-    async def generate_embeddings(self):
-        """Generate embeddings for all KB examples."""
+    def load(self) -> bool:
+        """
+        Load the KB examples and the stored embeddings without generating any.
+        
+        Used to preload a server's master process, where no embedding
+        requests or threads should be started before workers fork.
+        
+        Returns:
+            True if the embeddings store was current and is now loaded
+        """
+        self.kb_examples = load_kb_examples()
+        self.is_initialized = self.load_embeddings()
+        return self.is_initialized
+    
+    async def generate_embeddings(self, progress_callback=None):
+        """
+        Generate embeddings for all KB examples through batched requests.
+        
+        Args:
+            progress_callback: Optional callable receiving (done, total)
+        """
         logger.info("Generating embeddings for KB examples...")
         self.embeddings_cache = {}
         
-        # Create tasks for parallel embedding generation
-        tasks = []
-        for i, example in enumerate(self.kb_examples):
-            text_to_embed = self._get_text_for_embedding(example)
-            tasks.append(self._generate_single_embedding(i, text_to_embed))
+        texts = [self._get_text_for_embedding(example) for example in self.kb_examples]
+        batcher = EmbeddingBatcher(self.model_name, progress_callback=progress_callback)
+        embeddings = await batcher.aembed(texts)
         
-        # Execute tasks with concurrency limit
-        semaphore = asyncio.Semaphore(10)  # Limit concurrent API calls
-        
-        async def limited_task(task):
-            async with semaphore:
-                return await task
-                
-        limited_tasks = [limited_task(task) for task in tasks]
-        results = await asyncio.gather(*limited_tasks, return_exceptions=True)
-        
-        # Process results
-        success_count = 0
-        for result in results:
-            if isinstance(result, tuple) and not isinstance(result, Exception):
-                idx, embedding = result
-                if embedding:
-                    self.embeddings_cache[idx] = embedding
-                    success_count += 1
-            elif isinstance(result, Exception):
-                logger.error(f"Error generating embedding: {result}")
+        for idx, embedding in enumerate(embeddings):
+            if embedding:
+                self.embeddings_cache[idx] = embedding
                 
-        logger.info(f"Generated {success_count}/{len(self.kb_examples)} embeddings successfully")
-    
-    async def _generate_single_embedding(self, index: int, text: str) -> tuple:
-        """Generate embedding for a single text."""
-        try:
-            embedding = await asyncio.to_thread(get_embedding, text, self.model_name)
-            return (index, embedding)
-        except Exception as e:
-            logger.error(f"Failed to generate embedding for index {index}: {e}")
-            return (index, None)
+        logger.info(
+            f"Generated {len(self.embeddings_cache)}/{len(self.kb_examples)} embeddings "
+            f"in {batcher.requests_sent} requests"
+        )
     
     def _get_text_for_embedding(self, example: Dict[str, Any]) -> str:
         """Get the text representation of an example for embedding."""
@@ -151,6 +214,174 @@ class KBEmbeddingManager:
             
         return " | ".join(text_parts)
     
+    async def refresh(self, progress_callback=None) -> Dict[str, int]:
+        """
+        Reload the KB file and incrementally refresh the embeddings store.
+        
+        Args:
+            progress_callback: Optional callable receiving (done, total)
+            
+        Returns:
+            Refresh statistics (see refresh_embeddings)
+        """
+        async with self._lock:
+            stats = await asyncio.to_thread(
+                self.refresh_embeddings, None, progress_callback
+            )
+            self.is_initialized = True
+            return stats
+    
+    def refresh_embeddings(
+        self,
+        examples: Optional[Sequence[Dict[str, Any]]] = None,
+        progress_callback=None
+    ) -> Dict[str, int]:
+        """
+        Bring the embeddings store in line with the KB, embedding only what changed.
+        
+        Every example is identified by a hash of its embedding text. Vectors of
+        unchanged examples are reused from the store, new or edited examples
+        are embedded in batches, deleted ones are dropped, and the store is
+        rewritten once.
+        
+        Args:
+            examples: KB examples to index; reloaded from disk if None
+            progress_callback: Optional callable receiving (done, total)
+            
+        Returns:
+            Counts of reused, embedded, failed and dropped records
+        """
+        with self._store_lock:
+            if examples is None:
+                examples = load_kb_examples(reload=True)
+            texts = [self._get_text_for_embedding(example) for example in examples]
+            hashes = [_hash_text(text) for text in texts]
+            
+            # Index the previous store by record hash
+            previous_matrix = None
+            previous_rows: Dict[str, int] = {}
+            loaded = load_vector_store(self.store_path, model_name=self.model_name)
+            if loaded is not None:
+                previous_matrix, manifest = loaded
+                if manifest.record_hashes:
+                    previous_rows = {
+                        record_hash: row for row, record_hash in enumerate(manifest.record_hashes)
+                    }
+                elif manifest.content_hash == compute_content_hash(texts):
+                    # Store written without per-record hashes but still current
+                    previous_rows = {hashes[idx]: row for row, idx in enumerate(manifest.keys)}
+                
+            pending = [i for i, record_hash in enumerate(hashes) if record_hash not in previous_rows]
+            fresh: Dict[int, int] = {}
+            fresh_matrix = None
+            if pending:
+                logger.info(f"Embedding {len(pending)} new or changed KB examples")
+                batcher = EmbeddingBatcher(self.model_name, progress_callback=progress_callback)
+                embeddings = batcher.embed([texts[i] for i in pending])
+                embedded = [(i, e) for i, e in zip(pending, embeddings) if e]
+                if embedded:
+                    fresh_matrix = build_normalized_matrix([e for _, e in embedded])
+                    fresh = {i: row for row, (i, _) in enumerate(embedded)}
+                    
+            rows = [
+                i for i, record_hash in enumerate(hashes)
+                if record_hash in previous_rows or i in fresh
+            ]
+            reused = sum(1 for record_hash in hashes if record_hash in previous_rows)
+            stats = {
+                "total": len(examples),
+                "reused": reused,
+                "embedded": len(fresh),
+                "failed": len(pending) - len(fresh),
+                "dropped": len(set(previous_rows) - set(hashes)),
+            }
+            
+            dims = set()
+            if reused:
+                dims.add(previous_matrix.shape[1])
+            if fresh:
+                dims.add(fresh_matrix.shape[1])
+            if len(dims) > 1:
+                logger.error("Embedding dimension changed, run a full regeneration")
+                return stats
+                
+            unchanged = (
+                loaded is not None
+                and not fresh
+                and loaded[1].record_hashes
+                and loaded[1].keys == rows
+                and loaded[1].content_hash == compute_content_hash(texts)
+            )
+            
+            if unchanged or not rows:
+                matrix = previous_matrix if rows else None
+            else:
+                matrix = np.empty((len(rows), dims.pop()), dtype=np.float32)
+                for row, i in enumerate(rows):
+                    if i in fresh:
+                        matrix[row] = fresh_matrix[fresh[i]]
+                    else:
+                        matrix[row] = previous_matrix[previous_rows[hashes[i]]]
+                        
+            self.kb_examples = examples
+            self.embeddings_cache = {}
+            self._set_matrix(matrix, rows)
+            if not unchanged:
+                self.save_embeddings()
+                
+            logger.info(f"Refreshed KB embeddings: {stats}")
+            return stats
+    
+    def _content_hash(self) -> str:
+        """Hash the embedding texts of the loaded examples, in order."""
+        return compute_content_hash(
+            self._get_text_for_embedding(example) for example in self.kb_examples
+        )
+    
+    @property
+    def vector_index(self):
+        """
+        Search index over the embedding matrix, built on first use.
+        
+        With KnowledgeBaseConfig.embedding_quantization set, this is an int8
+        or PQ index whose codes are kept next to the vector store and whose
+        rerank reads the store's memory-mapped matrix.
+        """
+        if self._vector_index is None and self.embedding_matrix is not None:
+            with self._index_lock:
+                if self._vector_index is None and self.embedding_matrix is not None:
+                    self._vector_index = open_store_index(
+                        self.embedding_matrix, self.matrix_rows, self.store_path
+                    )
+        return self._vector_index
+    
+    def _set_matrix(self, matrix, rows: List[int]):
+        """Install a normalized matrix and its row -> example index mapping."""
+        self.embedding_matrix = matrix
+        self.matrix_rows = rows
+        self._example_rows = {idx: row for row, idx in enumerate(rows)}
+        self._vector_index = None
+    
+    def _build_matrix(self):
+        """
+        Pack freshly generated embeddings into a normalized matrix.
+        
+        The per-example lists in embeddings_cache are released afterwards.
+        """
+        rows = sorted(
+            idx for idx in self.embeddings_cache
+            if 0 <= idx < len(self.kb_examples)
+        )
+        vectors = [self.embeddings_cache[idx] for idx in rows]
+        
+        if vectors and len({len(v) for v in vectors}) != 1:
+            logger.error("Inconsistent embedding dimensions, vector search disabled")
+            rows, vectors = [], []
+            
+        self._set_matrix(build_normalized_matrix(vectors) if vectors else None, rows)
+        self.embeddings_cache = {}
+        logger.info(f"Built embedding matrix with {len(rows)} rows")
+    
     def get_embedding(self, index: int) -> Optional[List[float]]:
         """
         Get embedding for a specific KB example by index.
@@ -161,30 +392,46 @@ class KBEmbeddingManager:
         Returns:
             Embedding vector or None if not found
         """
-        return self.embeddings_cache.get(index)
+        row = self._example_rows.get(index)
+        if row is None:
+            return None
+        return self.embedding_matrix[row].tolist()
     
     def get_all_embeddings(self) -> Dict[int, List[float]]:
         """Get all cached embeddings."""
-        return self.embeddings_cache.copy()
+        return {idx: self.get_embedding(idx) for idx in self.matrix_rows}
     
     def save_embeddings(self) -> bool:
         """
-        Save embeddings to disk.
+        Save the embedding matrix to the on-disk vector store.
         
         Returns:
             True if successful, False otherwise
         """
+        if self.embedding_matrix is None:
+            logger.warning("No embeddings to save")
+            return False
+            
         try:
-            cache_data = {
-                'embeddings': self.embeddings_cache,
-                'model_name': self.model_name,
-                'num_examples': len(self.kb_examples)
-            }
+            save_vector_store(
+                self.store_path,
+                self.embedding_matrix,
+                keys=self.matrix_rows,
+                model_name=self.model_name,
+                content_hash=self._content_hash(),
+                dtype=config.knowledge_base.embedding_storage_dtype,
+                record_hashes=[
+                    _hash_text(self._get_text_for_embedding(self.kb_examples[idx]))
+                    for idx in self.matrix_rows
+                ],
+            )
+            logger.info(f"Saved embeddings to {self.store_path}")
             
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-                
-            logger.info(f"Saved embeddings to {self.cache_file}")
+            if config.knowledge_base.embedding_quantization != "none":
+                # Serve the rerank from the store's memory map instead of RAM
+                loaded = load_vector_store(self.store_path, upcast=False)
+                if loaded is not None:
+                    self._set_matrix(loaded[0], self.matrix_rows)
             return True
         except Exception as e:
             logger.error(f"Failed to save embeddings: {e}")
@@ -192,30 +439,44 @@ class KBEmbeddingManager:
     
     def load_embeddings(self) -> bool:
         """
-        Load embeddings from disk.
+        Load embeddings from the on-disk vector store.
+        
+        The store is rejected if its model name or content hash do not
+        match the loaded KB examples. Examples loaded from a KB bundle use
+        the embeddings bundled with them when the model matches.
         
         Returns:
             True if successful, False otherwise
         """
-        if not self.cache_file.exists():
-            logger.info("No embeddings cache file found")
-            return False
-            
         try:
-            with open(self.cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-                
-            # Validate cache
-            if cache_data.get('num_examples') != len(self.kb_examples):
-                logger.warning("Cache size mismatch, regenerating embeddings")
+            bundle = getattr(self.kb_examples, "bundle", None)
+            if bundle is not None:
+                bundled = bundle.embeddings(
+                    self.model_name,
+                    upcast=config.knowledge_base.embedding_quantization == "none",
+                )
+                if bundled is not None:
+                    self._set_matrix(*bundled)
+                    logger.info(f"Loaded {len(self.matrix_rows)} embeddings from {bundle.path}")
+                    return True
+                    
+            loaded = load_vector_store(
+                self.store_path,
+                model_name=self.model_name,
+                content_hash=self._content_hash(),
+                upcast=config.knowledge_base.embedding_quantization == "none",
+            )
+            if loaded is None:
+                logger.info("No usable embeddings store, regenerating embeddings")
                 return False
                 
-            if cache_data.get('model_name') != self.model_name:
-                logger.warning("Model name mismatch, regenerating embeddings")
+            matrix, manifest = loaded
+            if any(not 0 <= idx < len(self.kb_examples) for idx in manifest.keys):
+                logger.warning("Embeddings store rows out of range, regenerating embeddings")
                 return False
                 
-            self.embeddings_cache = cache_data['embeddings']
-            logger.info(f"Loaded {len(self.embeddings_cache)} embeddings from cache")
+            self._set_matrix(matrix, list(manifest.keys))
+            logger.info(f"Loaded {manifest.count} embeddings from {self.store_path}")
             return True
             
         except Exception as e:
@@ -225,18 +486,16 @@ class KBEmbeddingManager:
     def clear_cache(self):
         """Clear the embeddings cache from memory and disk."""
         self.embeddings_cache = {}
+        self._set_matrix(None, [])
         self.is_initialized = False
         
-        if self.cache_file.exists():
-            try:
-                self.cache_file.unlink()
-                logger.info("Deleted embeddings cache file")
-            except Exception as e:
-                logger.error(f"Failed to delete cache file: {e}")
-
-
-# Convenience functions for backward compatibility
-_manager = KBEmbeddingManager()
+        try:
+            delete_vector_store(self.store_path)
+            for method in ("int8", "pq"):
+                delete_vector_index(quantized_index_stem(self.store_path, method))
+            logger.info("Deleted embeddings store")
+        except Exception as e:
+            logger.error(f"Failed to delete embeddings store: {e}")
 
 
 async def embed_and_cache_kb(force_regenerate: bool = False):
@@ -246,9 +505,14 @@ async def embed_and_cache_kb(force_regenerate: bool = False):
     Args:
         force_regenerate: If True, regenerate embeddings even if cache exists
     """
-    await _manager.initialize(force_regenerate)
+    await get_kb_manager().initialize(force_regenerate)
 
 
 def get_kb_manager() -> KBEmbeddingManager:
-    """Get the singleton KB embedding manager instance."""
-    return _manager
\ No newline at end of file
+    """
+    Get the singleton KB embedding manager instance.
+    
+    The instance changes when KBEmbeddingManager.reload() swaps in a new
+    one, so callers should get it once per operation rather than keep it.
+    """
+    return KBEmbeddingManager()
\ No newline at end of file
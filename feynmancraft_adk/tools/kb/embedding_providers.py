@@ -0,0 +1,222 @@
+"""
+Pluggable embedding providers.
+
+The embedding model named by ``ModelConfig.embedding_model`` selects a
+provider:
+
+- ``text-embedding-004`` (or any other Gemini model): remote Gemini API
+- ``local-hashing``: CPU-only hashed character n-gram vectors, deterministic
+  and offline, for air-gapped deployments, tests and reproducible benchmarks
+
+Additional providers can be added with register_embedding_provider.
+"""
+
+import math
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List
+import logging
+
+import numpy as np
+
+from ...shared_libraries.config import config
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HASHING_MODEL = "local-hashing"
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[\^_][a-z0-9+\-]+)?|[+\-]")
+
+
+class EmbeddingProvider(ABC):
+    """Interface implemented by every embedding backend."""
+
+    #: Model name stored alongside generated vectors
+    name: str
+    #: Output vector dimension
+    dim: int
+    #: Whether calls leave the process (network, quota, API key)
+    remote: bool = True
+
+    @abstractmethod
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+            task_type: Embedding task type (providers may ignore it)
+
+        Returns:
+            One embedding per input text, in order
+
+        Raises:
+            Exception: If the backend fails; callers decide whether to retry
+        """
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the Gemini embedding API."""
+
+    remote = True
+
+    def __init__(self, name: str = "models/text-embedding-004", dim: int = 768):
+        self.name = name
+        self.dim = dim
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if not texts:
+            return []
+
+        # Imported on first use: the Gemini SDK takes most of a second to import
+        import google.generativeai as genai
+
+        result = genai.embed_content(
+            model=self.name,
+            content=list(texts),
+            task_type=task_type,
+        )
+        embeddings = result['embedding']
+        if len(texts) == 1 and embeddings and not isinstance(embeddings[0], list):
+            embeddings = [embeddings]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+
+class LocalHashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic CPU-only embeddings from hashed n-gram features.
+
+    Word tokens (LaTeX commands are reduced to their names, so ``\\gamma``
+    and ``gamma`` match) and character n-grams of each word are hashed with
+    CRC32 into a fixed number of signed buckets. Counts are log-scaled and
+    the vector is L2-normalized, so cosine similarity behaves like a
+    TF-weighted n-gram overlap.
+    """
+
+    remote = False
+
+    def __init__(
+        self,
+        name: str = LOCAL_HASHING_MODEL,
+        dim: int = 768,
+        ngram_range: tuple = (3, 5),
+        char_weight: float = 0.5
+    ):
+        self.name = name
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.char_weight = char_weight
+
+    def _features(self, text: str) -> Dict[str, float]:
+        """Extract weighted word and character n-gram features."""
+        features: Dict[str, float] = {}
+        words = _WORD_RE.findall(text.lower())
+        low, high = self.ngram_range
+
+        for word in words:
+            key = "w:" + word
+            features[key] = features.get(key, 0.0) + 1.0
+
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                for i in range(len(padded) - n + 1):
+                    key = "c:" + padded[i:i + n]
+                    features[key] = features.get(key, 0.0) + self.char_weight
+
+        return features
+
+    def embed_one(self, text: str) -> List[float]:
+        """Embed a single text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vector[h % self.dim] += sign * math.log1p(weight)
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        return [self.embed_one(text) for text in texts]
+
+
+ProviderFactory = Callable[[str], EmbeddingProvider]
+
+_PROVIDER_FACTORIES: Dict[str, ProviderFactory] = {
+    LOCAL_HASHING_MODEL: lambda name: LocalHashingEmbeddingProvider(
+        name=name, dim=config.models.embedding_dim
+    ),
+}
+_providers: Dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def register_embedding_provider(prefix: str, factory: ProviderFactory):
+    """
+    Register a provider for model names starting with a prefix.
+
+    Args:
+        prefix: Model name prefix, e.g. "local-hashing"
+        factory: Callable building the provider from the full model name
+    """
+    with _providers_lock:
+        _PROVIDER_FACTORIES[prefix] = factory
+        for name in [n for n in _providers if n.startswith(prefix)]:
+            del _providers[name]
+
+
+def resolve_embedding_model_name(model_name: str) -> str:
+    """
+    Normalize a configured model name to the name stored with vectors.
+
+    Gemini models get the ``models/`` prefix the API expects; names of
+    registered providers are returned unchanged.
+    """
+    if any(model_name.startswith(prefix) for prefix in _PROVIDER_FACTORIES):
+        return model_name
+    if not model_name.startswith("models/"):
+        return f"models/{model_name}"
+    return model_name
+
+
+def default_embedding_model() -> str:
+    """Get the resolved name of the configured embedding model."""
+    return resolve_embedding_model_name(config.models.embedding_model)
+
+
+def get_embedding_provider(model_name: str = None) -> EmbeddingProvider:
+    """
+    Get the (cached) provider for a model name.
+
+    Args:
+        model_name: Embedding model name; defaults to ModelConfig.embedding_model
+
+    Returns:
+        The matching EmbeddingProvider
+    """
+    model_name = resolve_embedding_model_name(model_name or config.models.embedding_model)
+
+    provider = _providers.get(model_name)
+    if provider is not None:
+        return provider
+
+    with _providers_lock:
+        provider = _providers.get(model_name)
+        if provider is None:
+            factory = next(
+                (f for prefix, f in _PROVIDER_FACTORIES.items() if model_name.startswith(prefix)),
+                None
+            )
+            if factory is not None:
+                provider = factory(model_name)
+            else:
+                provider = GeminiEmbeddingProvider(model_name, dim=config.models.embedding_dim)
+            _providers[model_name] = provider
+            logger.info(f"Using embedding provider {type(provider).__name__} for {model_name}")
+    return provider
@@ -2,43 +2,182 @@
 Embedding utilities for KB search and similarity operations.
 """
 
-import google.generativeai as genai
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 import numpy as np
 from functools import lru_cache
 import hashlib
+import logging
+
+from .embedding_cache import get_embedding_cache
+from .embedding_providers import get_embedding_provider
+
+logger = logging.getLogger(__name__)
+
+QUERY_TASK_TYPE = "retrieval_query"
 
 
 def _hash_text(text: str) -> str:
     """Create a hash of text for caching purposes."""
-    return hashlib.md5(text.encode()).hexdigest()
+    return hashlib.sha256(text.encode()).hexdigest()
 
 
-@lru_cache(maxsize=1000)
-def get_embedding(text: str, model_name: str = "models/text-embedding-004") -> List[float]:
+def embedding_cache_key(text: str, model_name: str, task_type: str) -> str:
     """
-    Get embedding for text using Gemini embedding model.
+    Build the persistent-cache key for an embedding request.
+    
+    Whitespace is collapsed so trivially different texts share an entry.
     
     Args:
         text: Text to embed
-        model_name: Name of the embedding model to use
+        model_name: Name of the embedding model
+        task_type: Embedding task type
+        
+    Returns:
+        Hex digest of (model, task type, normalized text)
+    """
+    normalized = " ".join(text.split())
+    return _hash_text(f"{model_name}\0{task_type.lower()}\0{normalized}")
+
+
+def get_cached_embedding(text: str, model_name: str, task_type: str) -> Optional[List[float]]:
+    """Look up an embedding in the persistent cache, if enabled."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(embedding_cache_key(text, model_name, task_type))
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+        return None
+
+
+def store_cached_embedding(text: str, model_name: str, task_type: str, embedding: List[float]):
+    """Store an embedding in the persistent cache, if enabled."""
+    cache = get_embedding_cache()
+    if cache is None or not embedding:
+        return
+    try:
+        cache.put(embedding_cache_key(text, model_name, task_type), embedding, model_name, task_type)
+    except Exception as e:
+        logger.warning(f"Embedding cache write failed: {e}")
+
+
+def get_cached_embeddings(
+    texts: Sequence[str],
+    model_name: str,
+    task_type: str
+) -> Dict[str, List[float]]:
+    """
+    Look up several embeddings in the persistent cache with batched queries.
+    
+    Args:
+        texts: Texts to look up
+        model_name: Name of the embedding model
+        task_type: Embedding task type
         
     Returns:
-        List of float values representing the embedding
+        Mapping of the texts found in the cache to their embeddings
     """
+    cache = get_embedding_cache()
+    if cache is None or not texts:
+        return {}
+    keys = {embedding_cache_key(text, model_name, task_type): text for text in texts}
     try:
-        result = genai.embed_content(
-            model=model_name,
-            content=text,
-            task_type="retrieval_query",
+        found = cache.get_many(keys)
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+        return {}
+    return {keys[key]: embedding for key, embedding in found.items()}
+
+
+def store_cached_embeddings(embeddings: Dict[str, List[float]], model_name: str, task_type: str):
+    """Store several embeddings (text -> vector) in the persistent cache, if enabled."""
+    cache = get_embedding_cache()
+    if cache is None or not embeddings:
+        return
+    try:
+        cache.put_many(
+            ((embedding_cache_key(text, model_name, task_type), embedding)
+             for text, embedding in embeddings.items()),
+            model_name,
+            task_type
         )
-        return result['embedding']
     except Exception as e:
-        print(f"Error getting embedding: {str(e)}")
+        logger.warning(f"Embedding cache write failed: {e}")
+
+
+@lru_cache(maxsize=1000)
+def _embed_query(text: str, model_name: str) -> List[float]:
+    """Embed a query; raises on failure so failed requests are not memoized."""
+    provider = get_embedding_provider(model_name)
+    
+    if provider.remote:
+        cached = get_cached_embedding(text, model_name, QUERY_TASK_TYPE)
+        if cached:
+            return cached
+        
+    embedding = provider.embed([text], QUERY_TASK_TYPE)[0]
+    if not embedding:
+        raise ValueError(f"{model_name} returned an empty embedding")
+    if provider.remote:
+        store_cached_embedding(text, model_name, QUERY_TASK_TYPE, embedding)
+    return embedding
+
+
+def get_embedding(text: str, model_name: Optional[str] = None) -> List[float]:
+    """
+    Get embedding for text using the configured embedding provider.
+    
+    Results from remote providers are served from the persistent embedding
+    cache when possible, so restarts and other worker processes skip the
+    network round trip. Successful results are also kept in process; failed
+    requests are retried on the next call.
+    
+    Args:
+        text: Text to embed
+        model_name: Name of the embedding model (defaults to ModelConfig.embedding_model)
+        
+    Returns:
+        List of float values representing the embedding, or an empty list
+        if the request failed
+    """
+    provider = get_embedding_provider(model_name)
+    try:
+        return _embed_query(text, provider.name)
+    except Exception as e:
+        logger.error(f"Error getting embedding: {e}")
+        return []
+
+
+def embed_batch(
+    texts: List[str],
+    model_name: Optional[str] = None,
+    task_type: str = QUERY_TASK_TYPE
+) -> List[List[float]]:
+    """
+    Embed several texts with a single batch request.
+    
+    Unlike get_embedding this does not consult the persistent cache and lets
+    provider errors propagate, so callers such as EmbeddingBatcher can retry.
+    
+    Args:
+        texts: Texts to embed (at most the API batch limit)
+        model_name: Name of the embedding model (defaults to ModelConfig.embedding_model)
+        task_type: Embedding task type
+        
+    Returns:
+        One embedding per input text, in order
+        
+    Raises:
+        ValueError: If the response does not contain one embedding per text
+    """
+    if not texts:
         return []
+        
+    return get_embedding_provider(model_name).embed(list(texts), task_type)
 
 
-def embed_and_cache(texts: List[str], model_name: str = "models/text-embedding-004") -> Dict[str, List[float]]:
+def embed_and_cache(texts: List[str], model_name: Optional[str] = None) -> Dict[str, List[float]]:
     """
     Get embeddings for multiple texts with caching.
     
@@ -84,6 +223,115 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return dot_product / (norm1 * norm2)
 
 
+def build_normalized_matrix(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Stack embedding vectors into a contiguous, row-normalized float32 matrix.
+    
+    Rows with zero norm are left as zeros so they score 0.0 against any query.
+    
+    Args:
+        vectors: Sequence of equally sized embedding vectors
+        
+    Returns:
+        C-contiguous float32 matrix of shape (len(vectors), dim)
+    """
+    if len(vectors) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+        
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if isinstance(vectors, np.ndarray) and np.may_share_memory(matrix, vectors):
+        # Never normalize the caller's (possibly read-only, memory-mapped) array in place
+        matrix = matrix.copy()
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return np.ascontiguousarray(matrix)
+
+
+def top_k_cosine(
+    matrix: np.ndarray,
+    query_embedding: Sequence[float],
+    top_k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score a query against a row-normalized matrix and select the top-k rows.
+    
+    Args:
+        matrix: Row-normalized matrix from build_normalized_matrix
+        query_embedding: Query vector (normalized here)
+        top_k: Number of rows to return
+        
+    Returns:
+        Tuple of (row indices, cosine similarities), best match first
+    """
+    if top_k <= 0 or matrix.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm == 0 or query.shape[0] != matrix.shape[1]:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        
+    scores = matrix @ (query / norm)
+    
+    if top_k < scores.shape[0]:
+        rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        rows = np.arange(scores.shape[0])
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return rows, scores[rows]
+
+
+def top_k_cosine_many(
+    matrix: np.ndarray,
+    query_embeddings: Sequence[Sequence[float]],
+    top_k: int
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Score several queries against a row-normalized matrix with one
+    matrix-matrix product and select the top-k rows of each.
+    
+    Args:
+        matrix: Row-normalized matrix from build_normalized_matrix
+        query_embeddings: Query vectors (normalized here); empty or
+            mismatched vectors get no results
+        top_k: Number of rows to return per query
+        
+    Returns:
+        One (row indices, cosine similarities) pair per query, best match first
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+    results = [empty] * len(query_embeddings)
+    if top_k <= 0 or matrix.ndim != 2 or matrix.shape[0] == 0:
+        return results
+        
+    valid = [
+        i for i, q in enumerate(query_embeddings)
+        if q is not None and len(q) == matrix.shape[1]
+    ]
+    if not valid:
+        return results
+    queries = np.asarray([query_embeddings[i] for i in valid], dtype=np.float32)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    np.divide(queries, norms, out=queries, where=norms > 0)
+    
+    # (rows, queries) scores in one product
+    scores = matrix @ queries.T
+    top_k = min(top_k, scores.shape[0])
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[0])[:, None], scores.shape)
+        
+    for column, i in enumerate(valid):
+        if norms[column, 0] == 0:
+            continue
+        rows = candidates[:, column]
+        column_scores = scores[rows, column]
+        order = np.argsort(-column_scores, kind="stable")
+        results[i] = (np.asarray(rows[order], dtype=np.int64), column_scores[order])
+    return results
+
+
 def find_similar_texts(
     query: str,
     candidates: List[Dict[str, Any]],
@@ -95,6 +343,12 @@ def find_similar_texts(
     """
     Find similar texts from candidates based on query.
     
+    Candidates without a pre-computed embedding are looked up in the
+    persistent embedding cache and the misses are embedded together in
+    batch requests, so re-ranking N candidates costs at most one request
+    per API batch instead of one per candidate. Scoring, thresholding and
+    top-k selection are a single matrix operation.
+    
     Args:
         query: Query text
         candidates: List of candidate dictionaries
@@ -107,32 +361,48 @@ def find_similar_texts(
         List of similar candidates sorted by similarity
     """
     query_embedding = get_embedding(query)
-    if not query_embedding:
+    if not query_embedding or not candidates or top_k <= 0:
         return []
+    dim = len(query_embedding)
     
-    scored_candidates = []
-    
-    for candidate in candidates:
-        # Get candidate embedding
+    embeddings: List[Optional[Sequence[float]]] = [None] * len(candidates)
+    missing: Dict[str, List[int]] = {}
+    for i, candidate in enumerate(candidates):
         if embedding_field and embedding_field in candidate:
-            candidate_embedding = candidate[embedding_field]
+            embeddings[i] = candidate[embedding_field]
         else:
             text = candidate.get(text_field, "")
-            candidate_embedding = get_embedding(text)
-            
-        if not candidate_embedding:
-            continue
-            
-        # Calculate similarity
-        similarity = cosine_similarity(query_embedding, candidate_embedding)
+            if text:
+                missing.setdefault(text, []).append(i)
+                
+    if missing:
+        # Imported here: the batcher builds on this module
+        from .embedding_batcher import EmbeddingBatcher
         
-        if similarity >= threshold:
-            scored_candidates.append({
-                **candidate,
-                "similarity_score": similarity
-            })
+        texts = list(missing)
+        for text, embedding in zip(texts, EmbeddingBatcher().embed(texts)):
+            for i in missing[text]:
+                embeddings[i] = embedding
+                
+    rows = [
+        i for i, embedding in enumerate(embeddings)
+        if embedding is not None and len(embedding) == dim
+    ]
+    if not rows:
+        return []
+        
+    matrix = build_normalized_matrix([embeddings[i] for i in rows])
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(query_vector)
+    if norm == 0:
+        return []
+    scores = matrix @ (query_vector / norm)
     
-    # Sort by similarity score
-    scored_candidates.sort(key=lambda x: x["similarity_score"], reverse=True)
+    # Zero-norm candidates score 0.0, as with cosine_similarity
+    passing = np.flatnonzero(scores >= threshold)
+    passing = passing[np.argsort(-scores[passing], kind="stable")][:top_k]
     
-    return scored_candidates[:top_k]
\ No newline at end of file
+    return [
+        {**candidates[rows[j]], "similarity_score": float(scores[j])}
+        for j in passing
+    ]
@@ -0,0 +1,139 @@
+"""
+Rank fusion for hybrid (vector + lexical) search.
+
+Each retriever produces a ranked list of (record id, score). The lists are
+merged either by weighted score fusion, where scores are min-max normalized
+per retriever before weighting, or by weighted reciprocal rank fusion (RRF),
+which only uses ranks and so needs no score calibration.
+
+merge_query_hits applies the same RRF to the hits of several queries
+against one index (multi-query search), so every record appears once.
+"""
+
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+RankedList = Sequence[Tuple[Hashable, float]]
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def weighted_fusion(
+    ranked_lists: Dict[str, RankedList],
+    weights: Dict[str, float]
+) -> Dict[Hashable, float]:
+    """
+    Combine min-max normalized scores with per-retriever weights.
+
+    Args:
+        ranked_lists: Retriever name -> ranked (id, score) list
+        weights: Retriever name -> weight (missing retrievers get 1.0)
+
+    Returns:
+        Mapping of id to fused score
+    """
+    fused: Dict[Hashable, float] = defaultdict(float)
+    for name, ranked in ranked_lists.items():
+        if not ranked:
+            continue
+        scores = [score for _, score in ranked]
+        low, high = min(scores), max(scores)
+        span = high - low
+        weight = weights.get(name, 1.0)
+        for item_id, score in ranked:
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[item_id] += weight * normalized
+    return fused
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Dict[str, RankedList],
+    weights: Dict[str, float],
+    rrf_k: int = 60
+) -> Dict[Hashable, float]:
+    """
+    Combine ranks with weighted reciprocal rank fusion.
+
+    Args:
+        ranked_lists: Retriever name -> ranked (id, score) list, best first
+        weights: Retriever name -> weight (missing retrievers get 1.0)
+        rrf_k: Rank offset damping the influence of top ranks
+
+    Returns:
+        Mapping of id to fused score
+    """
+    fused: Dict[Hashable, float] = defaultdict(float)
+    for name, ranked in ranked_lists.items():
+        weight = weights.get(name, 1.0)
+        for rank, (item_id, _) in enumerate(ranked, start=1):
+            fused[item_id] += weight / (rrf_k + rank)
+    return fused
+
+
+def fuse_rankings(
+    ranked_lists: Dict[str, RankedList],
+    top_k: int,
+    method: str = "rrf",
+    weights: Optional[Dict[str, float]] = None,
+    rrf_k: int = 60
+) -> List[Tuple[Hashable, float]]:
+    """
+    Fuse ranked lists and return the top-k ids.
+
+    Args:
+        ranked_lists: Retriever name -> ranked (id, score) list, best first
+        top_k: Number of results to return
+        method: "rrf" or "weighted"
+        weights: Retriever name -> weight
+        rrf_k: RRF rank offset
+
+    Returns:
+        List of (id, fused score), best first; ties keep first-seen order
+
+    Raises:
+        ValueError: If the fusion method is unknown
+    """
+    weights = weights or {}
+    if method == "rrf":
+        fused = reciprocal_rank_fusion(ranked_lists, weights, rrf_k)
+    elif method == "weighted":
+        fused = weighted_fusion(ranked_lists, weights)
+    else:
+        raise ValueError(f"Unknown fusion method: {method} (expected one of {FUSION_METHODS})")
+
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return ordered[:max(0, top_k)]
+
+
+def merge_query_hits(
+    hits_per_query: Sequence[RankedList],
+    rrf_k: int = 60
+) -> List[Tuple[Hashable, float, List[int]]]:
+    """
+    Deduplicate the hits of several queries against the same index.
+
+    Records are ordered by reciprocal rank fusion over the queries, so
+    agreement between phrasings counts: a record ranked second by two
+    queries (2 / (k + 2)) comes before one ranked first by a single query
+    (1 / (k + 1)).
+
+    Args:
+        hits_per_query: Ranked (id, similarity) list of each query, best first
+        rrf_k: RRF rank offset
+
+    Returns:
+        List of (id, best similarity, indices of the queries that found it),
+        in fused order
+    """
+    best: Dict[Hashable, float] = {}
+    matched: Dict[Hashable, List[int]] = defaultdict(list)
+    for query_index, hits in enumerate(hits_per_query):
+        for item_id, score in hits:
+            if item_id not in best or score > best[item_id]:
+                best[item_id] = score
+            matched[item_id].append(query_index)
+
+    ranked_lists = {str(i): hits for i, hits in enumerate(hits_per_query)}
+    fused = reciprocal_rank_fusion(ranked_lists, {}, rrf_k)
+    ordered = sorted(fused, key=lambda item_id: fused[item_id], reverse=True)
+    return [(item_id, best[item_id], matched[item_id]) for item_id in ordered]
@@ -0,0 +1,510 @@
+"""
+Streaming ingestion of KB records.
+
+Records are parsed, normalized and validated one at a time by a generator
+pipeline, so memory stays bounded by the compact KBRecordStore being
+built rather than by the parsed file:
+
+    parse (JSON array / JSONL) -> normalize_record -> validate_record -> store
+
+A KB can live in one of three layouts (KnowledgeBaseConfig.local_kb_path),
+or in a bundle together with its indexes (see kb.bundle):
+
+- ``feynman_kb.json``: a JSON array, read in chunks instead of json.load
+- ``feynman_kb.jsonl``: one record per line
+- a directory of shards (``shard-00000.jsonl``, ...) described by a
+  ``manifest.json`` with each shard's record count and content hash.
+  ShardedKBRecordStore parses a shard only when one of its records is
+  first accessed.
+"""
+
+import bisect
+import json
+import os
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import logging
+
+from ...shared_libraries.config import config
+from .records import KBRecord, KBRecordStore, RecordView, compute_records_hash
+from .vector_store import compute_content_hash
+
+logger = logging.getLogger(__name__)
+
+#: Fields every ingested record must have
+REQUIRED_FIELDS = ("topic", "description", "tikz")
+
+#: Name of the manifest in a shard directory
+SHARD_MANIFEST = "manifest.json"
+SHARD_FORMAT_VERSION = 1
+
+# Characters read at a time from JSON array files
+_READ_CHUNK = 1 << 20
+
+# Invalid records logged individually before only counting them
+_MAX_LOGGED_ERRORS = 20
+
+_JSONL_SUFFIXES = (".jsonl", ".ndjson")
+
+
+def validate_record(
+    record: Any,
+    position: int,
+    required_fields: Sequence[str] = REQUIRED_FIELDS
+) -> List[str]:
+    """
+    Validate the format of one KB record.
+
+    Args:
+        record: Parsed record
+        position: Record position, used in the messages
+        required_fields: Fields that must be present
+
+    Returns:
+        List of validation errors (empty if valid)
+    """
+    if not isinstance(record, Mapping):
+        return [f"Example {position}: must be an object, got {type(record).__name__}"]
+
+    errors = []
+    for field in required_fields:
+        if field not in record:
+            errors.append(f"Example {position}: Missing required field '{field}'")
+
+    if "id" in record and not isinstance(record["id"], (str, int)):
+        errors.append(f"Example {position}: 'id' must be string or int")
+    for field in ("topic", "description", "tikz", "reaction"):
+        if field in record and not isinstance(record[field], str):
+            errors.append(f"Example {position}: '{field}' must be string")
+    if "particles" in record and not isinstance(record["particles"], (list, tuple)):
+        errors.append(f"Example {position}: 'particles' must be list")
+    return errors
+
+
+def normalize_record(record: Any) -> Any:
+    """
+    Normalize a harvested record into the KB schema.
+
+    Well-formed records are returned unchanged, so their content hash (and
+    any index built over them) is stable. Null fields are dropped and a
+    comma-separated particles string is split into a list.
+
+    Args:
+        record: Parsed record
+
+    Returns:
+        The normalized record (non-objects are returned as-is for validation)
+    """
+    if not isinstance(record, dict):
+        return record
+    if any(value is None for value in record.values()):
+        record = {key: value for key, value in record.items() if value is not None}
+    particles = record.get("particles")
+    if isinstance(particles, str):
+        record = {**record, "particles": [p.strip() for p in particles.split(",") if p.strip()]}
+    return record
+
+
+def iter_jsonl(path: Union[str, Path]) -> Iterator[Any]:
+    """
+    Parse a JSONL file one line at a time.
+
+    Args:
+        path: File with one JSON value per line (blank lines are skipped)
+
+    Yields:
+        Parsed values
+
+    Raises:
+        json.JSONDecodeError: If a line is not valid JSON
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise json.JSONDecodeError(f"{path}:{line_number}: {e.msg}", e.doc, e.pos) from None
+
+
+def iter_json_array(path: Union[str, Path], chunk_size: int = _READ_CHUNK) -> Iterator[Any]:
+    """
+    Parse the elements of a JSON array file without loading the whole file.
+
+    The file is read in chunks and each element is decoded as soon as it is
+    complete, so memory is bounded by the chunk and the largest element.
+
+    Args:
+        path: File containing a JSON array
+        chunk_size: Characters read at a time
+
+    Yields:
+        Array elements, in order
+
+    Raises:
+        json.JSONDecodeError: If the file is not a valid JSON array
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise json.JSONDecodeError("Expected a JSON array", buffer, pos)
+        pos += 1
+
+        skip_whitespace()
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+
+        while True:
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A scalar cut by the chunk boundary can still decode ("1." as 1),
+                    # so it is complete only once the next element or the end follows
+                    following = buffer[end:].lstrip()[:1]
+                    if isinstance(value, (dict, list)) or following in (",", "]") or eof or not fill():
+                        break
+                except json.JSONDecodeError:
+                    # The element may continue in the next chunk
+                    if eof or not fill():
+                        raise
+            pos = end
+            yield value
+
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Unterminated JSON array", buffer, pos)
+            if buffer[pos] == "]":
+                return
+            if buffer[pos] != ",":
+                raise json.JSONDecodeError("Expected ',' or ']'", buffer, pos)
+            pos += 1
+
+
+def iter_kb_file(path: Union[str, Path]) -> Iterator[Any]:
+    """Parse a KB file lazily, as JSONL or as a JSON array depending on its suffix."""
+    if Path(path).suffix.lower() in _JSONL_SUFFIXES:
+        return iter_jsonl(path)
+    return iter_json_array(path)
+
+
+def stream_kb_records(
+    path: Union[str, Path],
+    validate: bool = True,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse, normalize and validate the records of a KB file in one pass.
+
+    Invalid records are logged and skipped.
+
+    Args:
+        path: JSON array or JSONL file
+        validate: Drop records failing validate_record
+        stats: Optional dictionary updated with "read" and "skipped" counts
+
+    Yields:
+        Normalized, valid records
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("read", 0)
+    stats.setdefault("skipped", 0)
+
+    for position, record in enumerate(iter_kb_file(path)):
+        stats["read"] += 1
+        record = normalize_record(record)
+        if validate:
+            errors = validate_record(record, position)
+            if errors:
+                stats["skipped"] += 1
+                if stats["skipped"] <= _MAX_LOGGED_ERRORS:
+                    logger.warning(f"Skipping invalid KB record in {path}: {'; '.join(errors)}")
+                continue
+        yield record
+
+
+def load_kb_store(path: Union[str, Path], offset: int = 0) -> KBRecordStore:
+    """
+    Stream a KB file into a record store.
+
+    Args:
+        path: JSON array or JSONL file
+        offset: Position of the first record (for shards)
+
+    Returns:
+        The record store
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        json.JSONDecodeError: If the file is not valid JSON
+    """
+    stats: Dict[str, int] = {}
+    store = KBRecordStore(stream_kb_records(path, stats=stats), source=str(path), offset=offset)
+    if stats["skipped"]:
+        logger.warning(f"Skipped {stats['skipped']} invalid records in {path}")
+    logger.info(f"Loaded {len(store)} KB records from {path}")
+    return store
+
+
+def _shard_files(directory: Path) -> List[Path]:
+    return sorted(
+        path for path in directory.iterdir()
+        if path.name != SHARD_MANIFEST
+        and path.suffix.lower() in _JSONL_SUFFIXES + (".json",)
+    )
+
+
+def write_kb_shards(
+    records: Iterable[Dict[str, Any]],
+    directory: Union[str, Path],
+    shard_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Write records as JSONL shards with a manifest.
+
+    Records are written as they arrive, so any iterable (e.g.
+    stream_kb_records over a harvested dump) can be sharded with bounded
+    memory. Shards and manifest go through temporary files; the manifest is
+    replaced last, so readers never see a half-written KB.
+
+    Args:
+        records: Records to write, in order
+        directory: Shard directory (created if missing)
+        shard_size: Records per shard (defaults to KnowledgeBaseConfig.kb_shard_size)
+
+    Returns:
+        The manifest that was written
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    shard_size = max(1, shard_size or config.knowledge_base.kb_shard_size)
+    shards: List[Dict[str, Any]] = []
+    pending: List[Path] = []
+
+    def flush(batch: List[Dict[str, Any]]):
+        name = f"shard-{len(shards):05d}.jsonl"
+        tmp = directory / f"{name}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in batch:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        pending.append(tmp)
+        shards.append({"file": name, "count": len(batch), "content_hash": compute_records_hash(batch)})
+
+    try:
+        batch: List[Dict[str, Any]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= shard_size:
+                flush(batch)
+                batch = []
+        if batch or not shards:
+            flush(batch)
+
+        manifest = {
+            "format_version": SHARD_FORMAT_VERSION,
+            "count": sum(shard["count"] for shard in shards),
+            "shards": shards,
+        }
+        for tmp, shard in zip(pending, shards):
+            os.replace(tmp, directory / shard["file"])
+        tmp_manifest = directory / f"{SHARD_MANIFEST}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_manifest, directory / SHARD_MANIFEST)
+    finally:
+        for tmp in pending:
+            if tmp.exists():
+                tmp.unlink()
+
+    # Shards left over from a larger previous KB are no longer referenced
+    current = {shard["file"] for shard in shards}
+    for path in _shard_files(directory):
+        if path.name not in current and path.name.startswith("shard-"):
+            path.unlink()
+
+    logger.info(f"Wrote {manifest['count']} records in {len(shards)} shards to {directory}")
+    return manifest
+
+
+def read_shard_manifest(directory: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Read the manifest of a shard directory.
+
+    Directories without a manifest (e.g. shards copied in by hand) are
+    scanned once, streaming each shard to count and hash it.
+
+    Args:
+        directory: Shard directory
+
+    Returns:
+        Manifest with the shard files, record counts and content hashes
+
+    Raises:
+        FileNotFoundError: If the directory has no shards
+    """
+    directory = Path(directory)
+    manifest_path = directory / SHARD_MANIFEST
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") == SHARD_FORMAT_VERSION:
+            return manifest
+        logger.warning(f"Unsupported shard manifest format in {directory}, rescanning")
+
+    files = _shard_files(directory)
+    if not files:
+        raise FileNotFoundError(f"No KB shards found in {directory}")
+
+    shards = []
+    for path in files:
+        records = list(stream_kb_records(path))
+        shards.append({"file": path.name, "count": len(records), "content_hash": compute_records_hash(records)})
+    logger.info(f"Scanned {len(shards)} KB shards in {directory} (no manifest)")
+    return {
+        "format_version": SHARD_FORMAT_VERSION,
+        "count": sum(shard["count"] for shard in shards),
+        "shards": shards,
+    }
+
+
+class ShardedKBRecordStore(Sequence):
+    """
+    KB record sequence over a directory of shards, parsed on first access.
+
+    Length, positions and the content hash come from the manifest, so
+    opening the store reads no records; each shard is streamed into its
+    own KBRecordStore when one of its records is first needed.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """
+        Open a shard directory.
+
+        Args:
+            directory: Directory with shards and (optionally) a manifest
+        """
+        self.directory = Path(directory)
+        self.source = str(self.directory)
+        manifest = read_shard_manifest(self.directory)
+        self._shards = manifest["shards"]
+        self._starts = [0]
+        for shard in self._shards:
+            self._starts.append(self._starts[-1] + shard["count"])
+        self._stores: List[Optional[KBRecordStore]] = [None] * len(self._shards)
+        self._lock = threading.Lock()
+        self.content_hash = compute_content_hash(shard["content_hash"] for shard in self._shards)
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+
+    @property
+    def loaded_shards(self) -> int:
+        """Number of shards parsed so far."""
+        return sum(store is not None for store in self._stores)
+
+    def shard(self, number: int) -> KBRecordStore:
+        """Get a shard's records, parsing the shard on first use."""
+        store = self._stores[number]
+        if store is not None:
+            return store
+
+        with self._lock:
+            store = self._stores[number]
+            if store is None:
+                info = self._shards[number]
+                store = load_kb_store(self.directory / info["file"], offset=self._starts[number])
+                if len(store) != info["count"]:
+                    raise ValueError(
+                        f"Shard {info['file']} has {len(store)} records, manifest says {info['count']}"
+                    )
+                self._stores[number] = store
+        return store
+
+    def _locate(self, position: int):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("KB record position out of range")
+        number = bisect.bisect_right(self._starts, position) - 1
+        return self.shard(number), position - self._starts[number]
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    def __getitem__(self, position: Union[int, slice]) -> Union[KBRecord, List[KBRecord]]:
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        store, index = self._locate(position)
+        return store[index]
+
+    def __iter__(self) -> Iterator[KBRecord]:
+        for number in range(len(self._shards)):
+            yield from self.shard(number)
+
+    def __repr__(self) -> str:
+        return (
+            f"ShardedKBRecordStore({len(self)} records in {self.shard_count} shards "
+            f"from {self.source}, {self.loaded_shards} loaded)"
+        )
+
+    def view(self, position: int, **extra: Any) -> RecordView:
+        """Get a search hit for a record (see KBRecordStore.view)."""
+        store, index = self._locate(position)
+        return store.view(index, **extra)
+
+
+def open_kb(path: Union[str, Path]) -> Union[KBRecordStore, ShardedKBRecordStore]:
+    """
+    Open a KB in any supported layout.
+
+    Args:
+        path: JSON array file, JSONL file, shard directory or KB bundle
+
+    Returns:
+        KBRecordStore for a single file (a BundleRecordStore for a bundle),
+        ShardedKBRecordStore for a directory
+
+    Raises:
+        FileNotFoundError: If the path doesn't exist
+        json.JSONDecodeError: If a file is not valid JSON
+    """
+    path = Path(path)
+    if path.is_dir():
+        store = ShardedKBRecordStore(path)
+        logger.info(f"Opened {len(store)} KB records in {store.shard_count} shards at {path}")
+        return store
+
+    from .bundle import KBBundle, is_kb_bundle
+    if is_kb_bundle(path):
+        bundle = KBBundle(path)
+        logger.info(f"Opened KB bundle with {bundle.count} records at {path}")
+        return bundle.records
+    return load_kb_store(path)
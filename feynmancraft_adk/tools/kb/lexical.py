@@ -0,0 +1,378 @@
+"""
+BM25 inverted index for lexical KB search.
+
+Records are tokenized with a LaTeX-aware tokenizer, so a reaction such as
+``Z^0 \\to l^+ l^-`` yields the terms ``z^0``, ``z``, ``l^+``, ``l^-`` and
+``l`` and a query for "Z boson" or "l^+" finds it. Common particle commands
+are also indexed under their English names (``\\gamma`` -> ``photon``);
+single-letter symbols (``t`` -> ``top``) only in reactions, particle lists
+and sub- or superscripted terms, since in prose they are too ambiguous
+("t-channel", colour labels).
+
+Scores use BM25 over weighted fields (reaction, topic, particles,
+description), and top-k results are selected with a heap instead of sorting
+every match.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import logging
+
+import numpy as np
+
+from .packed import PackedLists, pack_lists
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELD_WEIGHTS: Dict[str, float] = {
+    "reaction": 3.0,
+    "topic": 2.0,
+    "particles": 2.0,
+    "description": 1.0,
+}
+
+_BAR_RE = re.compile(r"\\(?:bar|overline|tilde)\s*\{\s*\\?([A-Za-z]+)\s*\}|\\(?:bar|overline|tilde)\s+\\?([A-Za-z]+)")
+_TOKEN_RE = re.compile(
+    r"\\?[a-z]+(?:\s*[\^_]\s*(?:\{[^{}]*\}|\\?[a-z]+|[0-9]+|[+\-*]))*"
+    r"|[0-9]+(?:\.[0-9]+)?"
+)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# LaTeX layout commands and English filler words carrying no signal
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from",
+    "in", "into", "is", "it", "of", "on", "or", "the", "this", "to", "via",
+    "with", "rightarrow", "longrightarrow", "mathrm", "text", "left", "right",
+})
+
+# Particle spellings mapped to the word used in topics and descriptions
+ALIASES: Dict[str, str] = {
+    "gamma": "photon",
+    "e^+": "positron",
+    "e^-": "electron",
+    "mu": "muon",
+    "tau": "tau",
+    "nu": "neutrino",
+    "g": "gluon",
+    "h": "higgs",
+    "pi": "pion",
+    "k": "kaon",
+    "t": "top",
+    "b": "bottom",
+}
+
+# Fields written in LaTeX or particle notation, where single letters are particle symbols
+MATH_FIELDS = frozenset({"reaction", "particles"})
+
+# LaTeX commands mangled by unescaped JSON strings ("\bar" -> backspace + "ar",
+# "\to" -> tab + "o", "\nu" -> newline + "u"); restored in math fields
+_JSON_ESCAPES = str.maketrans({"\b": "\\b", "\t": "\\t", "\f": "\\f", "\r": "\\r", "\n": "\\n"})
+
+
+def _normalize_term(term: str) -> str:
+    """Strip braces, whitespace and plural endings from a raw term."""
+    term = term.replace("{", "").replace("}", "").replace(" ", "").lstrip("\\")
+    if "^" not in term and "_" not in term and len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        term = term[:-1]
+    return term
+
+
+def tokenize(text: str, math: bool = False) -> List[str]:
+    """
+    Split text into index terms.
+
+    Args:
+        text: Plain text or LaTeX reaction string
+        math: The text is a reaction or particle list, so single-letter
+            terms are particle symbols and get their aliases
+
+    Returns:
+        List of normalized terms (with repeats, for term frequencies)
+    """
+    if not text:
+        return []
+
+    if math:
+        text = text.translate(_JSON_ESCAPES)
+    text = _BAR_RE.sub(lambda m: f"{(m.group(1) or m.group(2))}bar", text)
+    text = text.lower().replace("e.g.", " ").replace("i.e.", " ")
+    terms = []
+    for match in _TOKEN_RE.finditer(text):
+        term = _normalize_term(match.group(0))
+        if not term or term in STOPWORDS:
+            continue
+        terms.append(term)
+
+        base = re.split(r"[\^_]", term, maxsplit=1)[0]
+        if base != term and base and base not in STOPWORDS:
+            terms.append(base)
+        alias = ALIASES.get(term) or ALIASES.get(base)
+        if alias and len(base) == 1 and not math and base == term:
+            alias = None
+        if alias and alias != term:
+            terms.append(alias)
+    return terms
+
+
+def _field_text(record: Dict[str, Any], field: str) -> str:
+    value = record.get(field, "")
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return value if isinstance(value, str) else str(value)
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring over weighted record fields."""
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        field_weights: Optional[Dict[str, float]] = None,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        """
+        Build the index.
+
+        Args:
+            records: KB records; results refer to positions in this sequence
+            field_weights: Weight of each indexed field (defaults to DEFAULT_FIELD_WEIGHTS)
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalization
+        """
+        self.field_weights = dict(field_weights or DEFAULT_FIELD_WEIGHTS)
+        self.k1 = k1
+        self.b = b
+        self.size = len(records)
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.idf: Dict[str, float] = {}
+        self.doc_lengths: List[float] = []
+        # Raw lowercase words per field, for substring filters
+        self.field_words: Dict[str, Dict[str, Set[int]]] = {}
+
+        postings = defaultdict(list)
+        field_words = {field: defaultdict(set) for field in self.field_weights}
+
+        for doc_id, record in enumerate(records):
+            term_freqs: Dict[str, float] = defaultdict(float)
+            length = 0.0
+            for field, weight in self.field_weights.items():
+                text = _field_text(record, field)
+                for word in _WORD_RE.findall(text.lower()):
+                    field_words[field][word].add(doc_id)
+                for term in tokenize(text, math=field in MATH_FIELDS):
+                    term_freqs[term] += weight
+                    length += weight
+            for term, tf in term_freqs.items():
+                postings[term].append((doc_id, tf))
+            self.doc_lengths.append(length)
+
+        self.postings = dict(postings)
+        self.field_words = {field: dict(words) for field, words in field_words.items()}
+        self.avg_doc_length = (sum(self.doc_lengths) / self.size) if self.size else 0.0
+        for term, docs in self.postings.items():
+            df = len(docs)
+            self.idf[term] = math.log(1.0 + (self.size - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Dict[int, float]:
+        """
+        Compute BM25 scores of every record matching at least one query term.
+
+        Args:
+            query: Query text
+
+        Returns:
+            Mapping of record position to score
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        if not self.size:
+            return scores
+
+        avgdl = self.avg_doc_length or 1.0
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs:
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[doc_id] / avgdl)
+                scores[doc_id] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int = 5, allowed: Optional[Sequence[bool]] = None) -> List[Tuple[int, float]]:
+        """
+        Find the top-k records for a query.
+
+        Args:
+            query: Query text
+            k: Number of results
+            allowed: Optional boolean mask over record positions; other
+                records are dropped before the top-k is selected
+
+        Returns:
+            List of (record position, score), best first
+        """
+        if k <= 0:
+            return []
+        scores = self.score(query)
+        items = scores.items()
+        if allowed is not None:
+            items = [(doc_id, score) for doc_id, score in items if allowed[doc_id]]
+        return heapq.nlargest(k, items, key=lambda item: (item[1], -item[0]))
+
+    def substring_candidates(self, field: str, text: str) -> Optional[Set[int]]:
+        """
+        Get records whose field may contain text as a substring.
+
+        Every alphanumeric run of the text must lie inside some word of the
+        field, so only the field's vocabulary is scanned. The result is a
+        superset of the true matches; callers confirm each candidate.
+
+        Args:
+            field: Indexed field name
+            text: Substring to look for
+
+        Returns:
+            Candidate record positions, or None if the text has no words
+            (every record is then a candidate)
+        """
+        words = _WORD_RE.findall(text.lower())
+        vocabulary = self.field_words.get(field)
+        if not words or vocabulary is None:
+            return None
+
+        candidates: Optional[Set[int]] = None
+        for fragment in sorted(set(words), key=len, reverse=True):
+            matches: Set[int] = set()
+            for word in vocabulary:
+                if fragment in word:
+                    matches |= vocabulary[word]
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return set()
+        return candidates
+
+    def pack(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """
+        Flatten the index into JSON-serializable metadata and arrays.
+
+        Returns:
+            Tuple of (metadata, arrays) accepted by from_packed
+        """
+        terms, offsets, docs = pack_lists(
+            {term: [doc_id for doc_id, _ in docs] for term, docs in self.postings.items()}, np.int32
+        )
+        _, _, tfs = pack_lists(
+            {term: [tf for _, tf in docs] for term, docs in self.postings.items()}, np.float32
+        )
+        meta = {
+            "field_weights": self.field_weights,
+            "k1": self.k1,
+            "b": self.b,
+            "size": self.size,
+            "avg_doc_length": self.avg_doc_length,
+            "terms": terms,
+            "words": {},
+        }
+        arrays = {
+            "postings_offsets": offsets,
+            "postings_docs": docs,
+            "postings_tfs": tfs,
+            "idf": np.asarray([self.idf[term] for term in terms], dtype=np.float64),
+            "doc_lengths": np.asarray(self.doc_lengths, dtype=np.float64),
+        }
+        for field, words in self.field_words.items():
+            keys, word_offsets, word_docs = pack_lists(
+                {word: sorted(docs) for word, docs in words.items()}, np.int32
+            )
+            meta["words"][field] = keys
+            arrays[f"words_{field}_offsets"] = word_offsets
+            arrays[f"words_{field}_docs"] = word_docs
+        return meta, arrays
+
+    @classmethod
+    def from_packed(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> "BM25Index":
+        """
+        Rebuild an index from pack() output without tokenizing any record.
+
+        Posting lists are decoded from the (possibly memory-mapped) arrays
+        when a query term first looks them up.
+
+        Args:
+            meta: Metadata from pack()
+            arrays: Arrays from pack()
+
+        Returns:
+            BM25Index equivalent to the packed one
+        """
+        index = cls.__new__(cls)
+        index.field_weights = dict(meta["field_weights"])
+        index.k1 = meta["k1"]
+        index.b = meta["b"]
+        index.size = meta["size"]
+        index.avg_doc_length = meta["avg_doc_length"]
+
+        docs, tfs = arrays["postings_docs"], arrays["postings_tfs"]
+        index.postings = PackedLists(
+            meta["terms"],
+            arrays["postings_offsets"],
+            lambda start, end: list(zip(docs[start:end].tolist(), tfs[start:end].tolist())),
+        )
+        index.idf = dict(zip(meta["terms"], arrays["idf"].tolist()))
+        index.doc_lengths = arrays["doc_lengths"].tolist()
+        index.field_words = {
+            field: PackedLists(
+                words,
+                arrays[f"words_{field}_offsets"],
+                lambda start, end, docs=arrays[f"words_{field}_docs"]: set(docs[start:end].tolist()),
+            )
+            for field, words in meta["words"].items()
+        }
+        return index
+
+
+_index_cache: Dict[int, Tuple[Sequence[Dict[str, Any]], int, BM25Index]] = {}
+_index_cache_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 8
+
+
+def get_lexical_index(records: Sequence[Dict[str, Any]]) -> BM25Index:
+    """
+    Get the BM25 index for a record list, building it on first use.
+
+    Indexes are cached by list identity and size, so the loaded KB is
+    indexed once and reused by every search and filter.
+
+    Args:
+        records: KB records
+
+    Returns:
+        BM25Index over the records
+    """
+    key = id(records)
+    entry = _index_cache.get(key)
+    if entry is not None and entry[0] is records and entry[1] == len(records):
+        return entry[2]
+
+    index = BM25Index(records)
+    set_lexical_index(records, index)
+    logger.info(f"Built BM25 index over {len(records)} records ({len(index.postings)} terms)")
+    return index
+
+
+def set_lexical_index(records: Sequence[Dict[str, Any]], index: BM25Index):
+    """
+    Register a prebuilt BM25 index (e.g. one read from a KB bundle) for a record list.
+
+    Args:
+        records: KB records the index was built over
+        index: Their BM25 index
+    """
+    with _index_cache_lock:
+        if len(_index_cache) >= _INDEX_CACHE_SIZE:
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[id(records)] = (records, len(records), index)
@@ -1,306 +1,959 @@
-"""Local knowledge base tool with vector search using Annoy index."""
+"""Local knowledge base tool with vector search using a pluggable ANN index."""
 
-import json
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import numpy as np
-from annoy import AnnoyIndex
-import google.generativeai as genai
-from dotenv import load_dotenv
 import logging
 
+from ...shared_libraries.config import config
+from .data_loader import load_kb_examples
+from .embedding_manager import KBEmbeddingManager, get_kb_manager
+from .embedding_providers import default_embedding_model, get_embedding_provider
+from .embeddings import QUERY_TASK_TYPE, get_cached_embedding, get_embedding
+from .fusion import fuse_rankings
+from .lexical import get_lexical_index
+from .metadata import get_metadata_index
+from .records import KBRecordStore, compute_records_hash, materialize
+from .vector_index import (
+    VectorIndex,
+    create_vector_index,
+    load_vector_index,
+    read_vector_index_manifest,
+    save_vector_index,
+)
+
 logger = logging.getLogger(__name__)
 
 # Configuration
-EMB_DIM = 768  # Dimension for text-embedding-004
-DEFAULT_EMBEDDING_MODEL = "text-embedding-004"
-KB_JSON_PATH = Path(__file__).parent.parent / "data" / "feynman_kb.json"
-ANN_INDEX_PATH = Path(__file__).parent.parent / "data" / "feynman_kb.ann"
-ID_MAPPING_PATH = Path(__file__).parent.parent / "data" / "feynman_kb_id_map.json"
+EMB_DIM = config.models.embedding_dim
+DEFAULT_EMBEDDING_MODEL = config.models.embedding_model
+KB_JSON_PATH = config.knowledge_base.local_kb_path
+INDEX_STEM = config.knowledge_base.index_stem(default_embedding_model())
+
+# Candidates fetched from each retriever per requested hybrid result
+_FUSION_DEPTH = 3
+
+# Runs vector retrieval next to keyword retrieval in hybrid_search
+_retriever_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="kb-retriever")
+
+# Version of the KB metadata stored in the vector index manifest
+ID_MAP_VERSION = 3
+
+
+
+@dataclass(frozen=True)
+class KBSnapshot:
+    """
+    One version of the loaded KB: the records and the vector index built for them.
+    
+    Records are the shared, immutable store, so row positions stay stable
+    for the life of a snapshot. Searches read the current snapshot once and
+    use it throughout; a reload swaps in a new snapshot, and searches
+    already running finish on the one they started with.
+    """
+    version: int
+    records: KBRecordStore
+    content_hash: Optional[str]
+    index: Optional[VectorIndex] = None
+    id_map: Optional[Dict[str, Any]] = None
+    loaded_at: float = field(default_factory=time.time)
+
+
+# Global cache of the current snapshot
+_snapshot: Optional[KBSnapshot] = None
+
+# Guards loading and swapping of the snapshot
+_state_lock = threading.RLock()
+# Reloads prepare their snapshot one at a time, outside _state_lock
+_reload_lock = threading.Lock()
+_api_configured = False
+
+# Index builds run one at a time, in the caller's or a background thread
+_build_lock = threading.Lock()
+_build_thread_lock = threading.Lock()
+_build_state_lock = threading.Lock()
+_build_thread: Optional[threading.Thread] = None
+_build_state: Dict[str, Any] = {
+    "status": "idle",
+    "done": 0,
+    "total": 0,
+    "error": None,
+    "started_at": None,
+    "finished_at": None,
+    "content_hash": None,
+    "model_name": None,
+}
+
+
+def _reset_after_fork():
+    """Give a forked child its own retriever threads; the parent's do not survive fork."""
+    global _retriever_executor, _build_thread
+    
+    _retriever_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="kb-retriever")
+    _build_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
-# Global cache
-_kb_data_cache: Optional[List[Dict[str, Any]]] = None
-_annoy_index_cache: Optional[AnnoyIndex] = None
-_id_map_cache: Optional[List[str]] = None
-_embeddings_cache: Optional[Dict[str, List[float]]] = None
+def _set_build_state(**updates):
+    """Update the index build state shown to operators."""
+    with _build_state_lock:
+        _build_state.update(updates)
+
+
+def get_index_build_state() -> Dict[str, Any]:
+    """
+    Get the state of the most recent index build.
+    
+    Returns:
+        Dictionary with status (idle, queued, embedding, indexing, saving,
+        ready or failed), records embedded so far (done/total), the last
+        error, start/finish timestamps and the KB content hash and embedding
+        model the build was for
+    """
+    with _build_state_lock:
+        state = dict(_build_state)
+    state["in_progress"] = index_build_in_progress()
+    return state
+
+
+def current_snapshot() -> Optional[KBSnapshot]:
+    """Get the loaded KB snapshot, or None before the KB is first loaded."""
+    return _snapshot
+
+
+def index_build_in_progress() -> bool:
+    """Check whether a background index build is running."""
+    return _build_thread is not None and _build_thread.is_alive()
+
+
+def configure_api() -> Optional[str]:
+    """
+    Configure the Gemini client once per process.
+    
+    Environment variables are loaded by shared_libraries.config at import,
+    so this only reads the key from config.
+    
+    Returns:
+        The API key, or None if not set
+    """
+    global _api_configured
+    
+    api_key = config.api.google_api_key
+    if not _api_configured:
+        with _state_lock:
+            if not _api_configured:
+                if api_key:
+                    # Imported on first use: the Gemini SDK is slow to import
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                _api_configured = True
+    return api_key
+
+
+def compute_kb_hash(records: Sequence[Dict[str, Any]]) -> str:
+    """Hash the KB records in row order, so an index can be matched to them."""
+    if isinstance(records, KBRecordStore):
+        return records.content_hash
+    return compute_records_hash(records)
+
+
+def index_metadata(content_hash: Optional[str], count: int, model_name: str) -> Dict[str, Any]:
+    """
+    KB metadata stored in the vector index manifest (the "id map").
+    
+    Args:
+        content_hash: Hash of the indexed KB records
+        count: Number of KB records
+        model_name: Embedding model of the indexed vectors
+        
+    Returns:
+        Metadata checked by LocalKBTool before an index is used
+    """
+    return {
+        'version': ID_MAP_VERSION,
+        'content_hash': content_hash,
+        'model_name': model_name,
+        'dim': EMB_DIM,
+        'count': count,
+    }
 
 
 class LocalKBTool:
     """Local knowledge base tool with vector search capabilities."""
     
     def __init__(self):
-        """Initialize the local KB tool."""
-        load_dotenv()
-        self.api_key = os.getenv("GOOGLE_API_KEY")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
+        """
+        Initialize the local KB tool.
+        
+        The KB data, indexes and API client are process-wide, so creating
+        a tool after the first one is cheap; long-lived callers should still
+        prefer the shared KBService (see service.get_kb_service).
+        """
+        self.api_key = configure_api()
         self._load_kb_data()
     
     def _load_kb_data(self):
-        """Load knowledge base data from JSON file."""
-        global _kb_data_cache
+        """
+        Load knowledge base data from JSON file.
         
-        if _kb_data_cache is not None:
+        Records come from the shared store (see data_loader.load_kb_examples),
+        so the file is parsed once per process.
+        """
+        global _snapshot
+        
+        if _snapshot is not None:
             return
         
+        with _state_lock:
+            if _snapshot is not None:
+                return
+            
+            loaded = self._read_records(reload=False)
+            if loaded is None:
+                loaded = KBRecordStore((), source=str(KB_JSON_PATH)), None
+            _snapshot = KBSnapshot(version=1, records=loaded[0], content_hash=loaded[1])
+    
+    def _read_records(self, reload: bool) -> Optional[Tuple[KBRecordStore, Optional[str]]]:
+        """
+        Load the KB records and build their lexical and metadata indexes.
+        
+        Args:
+            reload: Re-read the file instead of using the shared store
+            
+        Returns:
+            Tuple of (records, content hash), or None if the KB could not be read
+        """
         try:
-            with open(KB_JSON_PATH, 'r', encoding='utf-8') as f:
-                _kb_data_cache = json.load(f)
-            logger.info(f"Loaded {len(_kb_data_cache)} records from {KB_JSON_PATH}")
+            records = load_kb_examples(str(KB_JSON_PATH), reload=reload)
+            get_lexical_index(records)
+            get_metadata_index(records)
+            return records, records.content_hash
         except Exception as e:
             logger.error(f"Failed to load KB data: {e}")
-            _kb_data_cache = []
-    
-    def get_embedding(self, text: str) -> Optional[List[float]]:
-        """Generate embedding for text using Gemini API."""
-        if not self.api_key:
-            logger.warning("No API key available for embeddings")
             return None
-        
-        try:
-            model_name = f"models/{DEFAULT_EMBEDDING_MODEL}"
-            response = genai.embed_content(
-                model=model_name,
-                content=text,
-                task_type="RETRIEVAL_DOCUMENT"
-            )
+    
+    def snapshot(self) -> KBSnapshot:
+        """Get the current KB snapshot; hold on to it for the length of one search."""
+        self._load_kb_data()
+        return _snapshot
+    
+    def reload(self, build_index: bool = True) -> bool:
+        """
+        Re-read the KB file and swap in a new snapshot once it is ready.
+        
+        Everything the new snapshot needs is prepared in the calling thread:
+        the records with their lexical and metadata indexes, a reloaded KB
+        embedding manager (embedding only new or changed records) and the
+        vector index, loaded if a current one is on disk and built otherwise.
+        Searches keep using the current snapshot meanwhile, and those still
+        running after the swap finish on it.
+        
+        Args:
+            build_index: Build a missing vector index before the swap; if
+                False the new snapshot starts without one and it is built
+                in the background on first use
             
-            embedding = response.get("embedding")
-            if embedding and len(embedding) == EMB_DIM:
-                return embedding
-            else:
-                logger.warning(f"Unexpected embedding dimension: {len(embedding) if embedding else 0}")
+        Returns:
+            True if a new snapshot was swapped in, False if the KB is
+            unchanged or could not be read (the current one is kept)
+        """
+        global _snapshot
+        
+        with _reload_lock:
+            current = self.snapshot()
+            loaded = self._read_records(reload=True)
+            if loaded is None:
+                return False
+            records, content_hash = loaded
+            if current.records and content_hash == current.content_hash:
+                logger.info("KB content unchanged; keeping the loaded snapshot")
+                return False
+            
+            start = time.perf_counter()
+            try:
+                manager = KBEmbeddingManager.reload(records)
+                index, id_map = self._open_index(records, content_hash)
+                if index is None and build_index and records:
+                    with _build_lock:
+                        index, id_map = self._index_records(records, content_hash, manager)
+            except Exception as e:
+                logger.error(f"KB reload failed, keeping the loaded snapshot: {e}")
+                _set_build_state(status="failed", error=str(e), finished_at=time.time())
+                return False
+            
+            with _state_lock:
+                _snapshot = KBSnapshot(
+                    version=_snapshot.version + 1,
+                    records=records,
+                    content_hash=content_hash,
+                    index=index,
+                    id_map=id_map,
+                )
+            logger.info(
+                f"Swapped in KB snapshot v{_snapshot.version} with {len(records)} records "
+                f"after {time.perf_counter() - start:.2f}s"
+            )
+            return True
+    
+    def get_embedding(self, text: str) -> Optional[List[float]]:
+        """Generate a query embedding with the model used for the KB vector store."""
+        provider = get_embedding_provider(get_kb_manager().model_name)
+        if provider.remote and not self.api_key:
+            # Serve cached query embeddings, but never call the API without a key
+            embedding = get_cached_embedding(text, provider.name, QUERY_TASK_TYPE)
+            if embedding is None:
+                logger.warning("No API key available for embeddings")
                 return None
-                
-        except Exception as e:
-            logger.error(f"Failed to generate embedding: {e}")
+        else:
+            embedding = get_embedding(text, provider.name)
+        if embedding and len(embedding) == EMB_DIM:
+            return embedding
+        
+        logger.warning(f"Unexpected embedding dimension: {len(embedding) if embedding else 0}")
+        return None
+    
+    def _id_map_is_valid(
+        self,
+        id_map: Any,
+        records: Optional[Sequence[Dict[str, Any]]] = None,
+        content_hash: Optional[str] = None
+    ) -> bool:
+        """
+        Check that index metadata describes the KB (the loaded one by default)
+        and the current embedding model.
+        """
+        if records is None:
+            snapshot = self.snapshot()
+            records, content_hash = snapshot.records, snapshot.content_hash
+        if not isinstance(id_map, dict) or id_map.get('version') != ID_MAP_VERSION:
+            logger.warning("Index metadata uses an old format")
+            return False
+        if id_map.get('content_hash') != content_hash or id_map.get('count') != len(records):
+            logger.warning("Index does not match the KB content")
+            return False
+        if id_map.get('model_name') != get_kb_manager().model_name or id_map.get('dim') != EMB_DIM:
+            logger.warning("Index was built with a different embedding model")
+            return False
+        return True
+    
+    def index_is_current(self) -> bool:
+        """Check whether the index on disk matches the loaded KB and embedding model."""
+        return self._id_map_is_valid(self._read_id_map())
+    
+    def _bundled_index(self, records: Optional[Sequence[Dict[str, Any]]] = None):
+        """
+        Get the KB bundle the records (the loaded ones by default) were
+        loaded from, if it carries an index for the current embedding model
+        (see kb.bundle).
+        """
+        if records is None:
+            records = self.snapshot().records
+        bundle = getattr(records, 'bundle', None)
+        if bundle is None or bundle.index_manifest is None:
+            return None
+        metadata = bundle.index_manifest.get('metadata') or {}
+        if metadata.get('model_name') != get_kb_manager().model_name or metadata.get('dim') != EMB_DIM:
+            return None
+        return bundle
+    
+    def _read_id_map(self, records: Optional[Sequence[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Read the KB metadata from the index manifest, or None if missing.
+        
+        An index bundled with the records (the loaded ones by default) is
+        preferred over the separate index files.
+        """
+        bundle = self._bundled_index(records)
+        if bundle is not None:
+            return bundle.index_manifest.get('metadata')
+        manifest = read_vector_index_manifest(INDEX_STEM)
+        if manifest is None:
             return None
+        return manifest.get('metadata')
     
     def build_index(self, force_rebuild: bool = False):
-        """Build Annoy index for vector search."""
-        global _annoy_index_cache, _id_map_cache, _embeddings_cache
+        """
+        Build the vector index, blocking until it is ready.
+        
+        The KB embeddings store is refreshed first, so only new or changed
+        records are embedded, and the index is then rebuilt from it with the
+        configured engine (KnowledgeBaseConfig.vector_index_engine). Index
+        ids are KB row positions; the manifest records the KB content hash
+        and embedding model so a stale index is detected at load time.
+        Files are written to temporary paths and swapped in atomically, so
+        processes that have the old index mapped keep working.
+        """
+        with _build_lock:
+            self._build_index(force_rebuild)
+    
+    def start_background_build(self, force_rebuild: bool = True) -> bool:
+        """
+        Build the index in a background thread unless a build is running.
+        
+        Queries arriving meanwhile are answered from the lexical index and
+        flagged with reduced_recall; progress is exposed through
+        get_index_build_state().
+        
+        Args:
+            force_rebuild: Rebuild even if a valid index exists on disk
+            
+        Returns:
+            True if a new build was started
+        """
+        global _build_thread
+        
+        with _build_thread_lock:
+            if _build_thread is not None and _build_thread.is_alive():
+                return False
+            _set_build_state(status="queued", done=0, total=0, error=None,
+                             started_at=time.time(), finished_at=None)
+            _build_thread = threading.Thread(
+                target=self.build_index,
+                args=(force_rebuild,),
+                name="kb-index-build",
+                daemon=True,
+            )
+            _build_thread.start()
+        logger.info("Started background index build")
+        return True
+    
+    def _build_index(self, force_rebuild: bool):
+        global _snapshot
         
-        if not force_rebuild and ANN_INDEX_PATH.exists() and ID_MAPPING_PATH.exists():
+        # Build for the current snapshot; a concurrent reload only
+        # invalidates the result, it never mixes two KB versions
+        snapshot = self.snapshot()
+        records, content_hash = snapshot.records, snapshot.content_hash
+        _set_build_state(content_hash=content_hash, model_name=get_kb_manager().model_name)
+        
+        if (not force_rebuild
+                and self._id_map_is_valid(self._read_id_map(records), records, content_hash)):
             logger.info("Index already exists. Use force_rebuild=True to rebuild.")
+            _set_build_state(status="ready", finished_at=time.time())
             return
         
-        if not _kb_data_cache:
+        if not records:
             logger.error("No KB data loaded")
+            _set_build_state(status="failed", error="No KB data loaded", finished_at=time.time())
             return
         
-        logger.info("Building Annoy index...")
+        try:
+            index, id_map = self._index_records(records, content_hash)
+            
+            # Cache results, unless a new snapshot was swapped in while building
+            with _state_lock:
+                if _snapshot.content_hash == content_hash:
+                    _snapshot = replace(_snapshot, index=index, id_map=id_map)
+                else:
+                    logger.warning("KB changed during index build; the new index is already stale")
+            
+        except Exception as e:
+            logger.error(f"Index build failed: {e}")
+            _set_build_state(status="failed", error=str(e), finished_at=time.time())
+    
+    def _index_records(
+        self,
+        records: KBRecordStore,
+        content_hash: Optional[str],
+        manager: Optional[KBEmbeddingManager] = None
+    ) -> Tuple[VectorIndex, Dict[str, Any]]:
+        """
+        Build and save the vector index for the given records.
+        
+        Args:
+            records: KB records to index
+            content_hash: Hash of the records
+            manager: KB embedding manager already holding the records'
+                embeddings; by default the shared manager's embeddings are
+                refreshed for them first
+            
+        Returns:
+            Tuple of (index, id map)
+            
+        Raises:
+            RuntimeError: If no KB embeddings are available
+        """
+        _set_build_state(status="embedding", done=0, total=len(records), error=None,
+                         started_at=time.time(), finished_at=None)
+        
+        def log_progress(done: int, total: int):
+            logger.info(f"Embedded {done}/{total} records")
+            _set_build_state(done=done, total=total)
+        
+        if manager is None:
+            manager = get_kb_manager()
+            stats = manager.refresh_embeddings(records, progress_callback=log_progress)
+            logger.info(f"KB embeddings refreshed: {stats}")
+        
+        if manager.embedding_matrix is None:
+            raise RuntimeError("No KB embeddings available")
+        
+        _set_build_state(status="indexing")
+        index = create_vector_index(dim=EMB_DIM)
+        logger.info(f"Building {index.engine} index...")
+        index.build(manager.embedding_matrix, manager.matrix_rows)
+        
+        id_map = index_metadata(content_hash, len(records), manager.model_name)
+        
+        # Saved through temporary files that are swapped in atomically
+        _set_build_state(status="saving")
+        save_vector_index(index, INDEX_STEM, metadata=id_map)
+        
+        _set_build_state(status="ready", done=len(records), finished_at=time.time())
+        logger.info(f"Index built and saved. Indexed {len(manager.matrix_rows)} items.")
+        return index, id_map
+    
+    def _load_index(
+        self,
+        snapshot: Optional[KBSnapshot] = None
+    ) -> Tuple[Optional[VectorIndex], Optional[Dict[str, Any]]]:
+        """
+        Load the vector index of a snapshot (the current one by default)
+        and its KB metadata.
+        
+        If they are missing or stale a background rebuild is started and
+        (None, None) is returned until it finishes.
+        """
+        snapshot = snapshot or self.snapshot()
+        if snapshot.index is not None and snapshot.id_map is not None:
+            return snapshot.index, snapshot.id_map
+        if index_build_in_progress():
+            return None, None
         
-        # Create index
-        index = AnnoyIndex(EMB_DIM, 'angular')
-        id_map = []
-        embeddings = {}
+        with _state_lock:
+            return self._load_index_locked(snapshot)
+    
+    def _load_index_locked(
+        self,
+        snapshot: KBSnapshot
+    ) -> Tuple[Optional[VectorIndex], Optional[Dict[str, Any]]]:
+        global _snapshot
+        
+        if _snapshot.content_hash != snapshot.content_hash:
+            # A newer snapshot was swapped in; let its searches load the index
+            return None, None
+        if _snapshot.index is not None and _snapshot.id_map is not None:
+            return _snapshot.index, _snapshot.id_map
         
-        for i, record in enumerate(_kb_data_cache):
-            # Generate text for embedding
-            text = f"{record.get('topic', '')}: {record.get('description', '')} {record.get('reaction', '')}"
-            
-            # Get embedding
-            embedding = self.get_embedding(text)
-            if embedding:
-                index.add_item(i, embedding)
-                reaction_id = record.get('reaction', f'item_{i}')
-                id_map.append(reaction_id)
-                embeddings[reaction_id] = embedding
-                
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i + 1}/{len(_kb_data_cache)} records")
-        
-        # Build and save index
-        logger.info("Building index tree...")
-        index.build(10)  # 10 trees
-        
-        # Save index and mappings
-        index.save(str(ANN_INDEX_PATH))
-        
-        with open(ID_MAPPING_PATH, 'w') as f:
-            json.dump(id_map, f)
-        
-        # Cache results
-        _annoy_index_cache = index
-        _id_map_cache = id_map
-        _embeddings_cache = embeddings
-        
-        logger.info(f"Index built and saved. Indexed {len(id_map)} items.")
-    
-    def _load_index(self) -> Tuple[Optional[AnnoyIndex], Optional[List[str]]]:
-        """Load Annoy index and ID mapping."""
-        global _annoy_index_cache, _id_map_cache
-        
-        if _annoy_index_cache is not None and _id_map_cache is not None:
-            return _annoy_index_cache, _id_map_cache
-        
-        if not ANN_INDEX_PATH.exists() or not ID_MAPPING_PATH.exists():
-            logger.warning("Index not found. Building it now...")
-            self.build_index()
-            return _annoy_index_cache, _id_map_cache
+        id_map = self._read_id_map(snapshot.records)
+        if id_map is None:
+            if self._start_automatic_build(snapshot, force_rebuild=False):
+                logger.warning("Index not found. Building it in the background...")
+            return None, None
         
         try:
-            # Load index
-            index = AnnoyIndex(EMB_DIM, 'angular')
-            index.load(str(ANN_INDEX_PATH))
-            _annoy_index_cache = index
+            if not self._id_map_is_valid(id_map, snapshot.records, snapshot.content_hash):
+                if self._start_automatic_build(snapshot, force_rebuild=True):
+                    logger.warning("Index is stale. Rebuilding it in the background...")
+                return None, None
             
-            # Load ID mapping
-            with open(ID_MAPPING_PATH, 'r') as f:
-                _id_map_cache = json.load(f)
+            index, id_map = self._open_index(snapshot.records, snapshot.content_hash)
+            if index is None:
+                raise RuntimeError(f"Could not open vector index at {INDEX_STEM}")
+            _snapshot = replace(_snapshot, index=index, id_map=id_map)
             
-            return _annoy_index_cache, _id_map_cache
+            return index, id_map
             
         except Exception as e:
             logger.error(f"Failed to load index: {e}")
             return None, None
     
-    def vector_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Perform vector similarity search."""
-        index, id_map = self._load_index()
+    def _start_automatic_build(self, snapshot: KBSnapshot, force_rebuild: bool) -> bool:
+        """
+        Start a background build for a missing or stale index.
+        
+        If the last build for the same KB content and embedding model failed,
+        no new one is started until KnowledgeBaseConfig.index_build_retry_seconds
+        have passed, so queries don't keep retrying a failing provider.
+        Explicit build_index calls are not affected.
+        
+        Returns:
+            True if a new build was started
+        """
+        state = get_index_build_state()
+        if (state["status"] == "failed"
+                and state["content_hash"] == snapshot.content_hash
+                and state["model_name"] == get_kb_manager().model_name
+                and time.time() - (state["finished_at"] or 0) < config.knowledge_base.index_build_retry_seconds):
+            return False
+        return self.start_background_build(force_rebuild)
+    
+    def _open_index(
+        self,
+        records: KBRecordStore,
+        content_hash: Optional[str]
+    ) -> Tuple[Optional[VectorIndex], Optional[Dict[str, Any]]]:
+        """
+        Open the index bundled with the records or saved on disk, if it is
+        current for them.
+        
+        Returns:
+            Tuple of (index, id map), or (None, None) if there is no current index
+        """
+        id_map = self._read_id_map(records)
+        if id_map is None or not self._id_map_is_valid(id_map, records, content_hash):
+            return None, None
+        
+        bundle = self._bundled_index(records)
+        if bundle is not None:
+            index = bundle.vector_index()
+        else:
+            loaded = load_vector_index(INDEX_STEM)
+            index = loaded[0] if loaded is not None else None
+        if index is None:
+            return None, None
+        return index, id_map
+    
+    def _filter_mask(
+        self,
+        where: Optional[Dict[str, Any]],
+        snapshot: KBSnapshot
+    ) -> Optional[np.ndarray]:
+        """
+        Resolve a metadata filter to a boolean mask over KB record positions.
+        
+        Args:
+            where: Filter such as {"process_type": "decay", "particles_any": ["W"]}
+                (see metadata.MetadataIndex.mask); None for no filter
+            snapshot: KB snapshot the search runs on
+            
+        Returns:
+            Mask of the matching records, or None if there is no filter
+            
+        Raises:
+            ValueError: If the filter has an unknown key
+        """
+        if not where:
+            return None
+        return get_metadata_index(snapshot.records).mask(where)
+    
+    def _vector_candidates(
+        self,
+        query: str,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        snapshot: Optional[KBSnapshot] = None
+    ) -> Optional[List[Tuple[int, float]]]:
+        """
+        Get (record position, cosine similarity) pairs from the vector index.
+        
+        With an allowed mask, only matching records are considered and the
+        index over-fetches as needed to still return k of them.
+        
+        Returns None if vector retrieval is unavailable (index not built yet
+        or no query embedding). Positions refer to the given snapshot (the
+        current one by default).
+        """
+        snapshot = snapshot or self.snapshot()
+        index, id_map = self._load_index(snapshot)
         if not index or not id_map:
-            return []
+            return None
         
         # Get query embedding
         query_embedding = self.get_embedding(query)
         if not query_embedding:
             logger.warning("Could not generate query embedding")
+            return None
+        
+        # Index ids are KB row positions
+        if allowed is None:
+            ids, scores = index.search(query_embedding, k)
+        else:
+            ids, scores = index.search_filtered(query_embedding, k, allowed)
+        return [
+            (int(idx), float(score))
+            for idx, score in zip(ids, scores)
+            if 0 <= idx < len(snapshot.records)
+        ]
+    
+    def vector_search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Perform vector similarity search.
+        
+        While the index is being built, keyword results are returned instead,
+        flagged with reduced_recall.
+        
+        Args:
+            query: Query text
+            k: Number of results
+            where: Optional metadata filter (see _filter_mask)
+        """
+        snapshot = self.snapshot()
+        allowed = self._filter_mask(where, snapshot)
+        if allowed is not None and not allowed.any():
             return []
         
         try:
-            # Search
-            indices, distances = index.get_nns_by_vector(
-                query_embedding, k, include_distances=True
-            )
-            
-            # Get results
-            results = []
-            for idx, dist in zip(indices, distances):
-                reaction_id = id_map[idx]
-                
-                # Find the record
-                for record in _kb_data_cache:
-                    if record.get('reaction') == reaction_id:
-                        result = record.copy()
-                        result['similarity_score'] = 1 - dist  # Convert distance to similarity
-                        results.append(result)
-                        break
+            hits = self._vector_candidates(query, k, allowed, snapshot)
+            if hits is None and index_build_in_progress():
+                results = self.keyword_search(query, k, where)
+                for result in results:
+                    result['reduced_recall'] = True
+                return results
             
-            return results
+            return [
+                snapshot.records.view(idx, similarity_score=similarity)
+                for idx, similarity in hits or []
+            ]
             
         except Exception as e:
             logger.error(f"Vector search failed: {e}")
             return []
     
-    def keyword_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Perform simple keyword search as fallback."""
-        if not _kb_data_cache:
+    def keyword_search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Perform BM25 keyword search over reaction, topic, particles and description.
+        
+        Args:
+            query: Query text
+            k: Number of results
+            where: Optional metadata filter (see _filter_mask)
+        """
+        snapshot = self.snapshot()
+        if not snapshot.records:
+            return []
+        
+        allowed = self._filter_mask(where, snapshot)
+        return [
+            snapshot.records.view(record_idx, keyword_score=score)
+            for record_idx, score in self._keyword_candidates(query, k, allowed, snapshot)
+        ]
+    
+    def _keyword_candidates(
+        self,
+        query: str,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        snapshot: Optional[KBSnapshot] = None
+    ) -> List[Tuple[int, float]]:
+        """Get (record position, BM25 score) pairs from the lexical index, optionally filtered."""
+        records = (snapshot or self.snapshot()).records
+        if not records:
             return []
+        return get_lexical_index(records).search(query, k, allowed)
+    
+    def _fuse_results(
+        self,
+        query: str,
+        k: int,
+        vector_hits: Optional[List[Tuple[int, float]]],
+        keyword_hits: Optional[List[Tuple[int, float]]],
+        snapshot: KBSnapshot
+    ) -> List[Dict[str, Any]]:
+        """Merge retriever hits with the configured fusion method."""
+        search_config = config.search
+        ranked_lists = {}
+        if vector_hits:
+            ranked_lists["vector"] = vector_hits
+        if keyword_hits:
+            ranked_lists["keyword"] = keyword_hits
+        
+        try:
+            fused = fuse_rankings(
+                ranked_lists,
+                k,
+                method=search_config.fusion_method,
+                weights={
+                    "vector": search_config.vector_weight,
+                    "keyword": search_config.keyword_weight,
+                },
+                rrf_k=search_config.rrf_k,
+            )
+        except ValueError as e:
+            logger.error(f"{e}; falling back to reciprocal rank fusion")
+            fused = fuse_rankings(ranked_lists, k, rrf_k=search_config.rrf_k)
         
-        query_lower = query.lower()
+        vector_scores = dict(vector_hits or [])
+        keyword_scores = dict(keyword_hits or [])
         results = []
+        for idx, score in fused:
+            result = snapshot.records.view(idx, hybrid_score=score)
+            if idx in vector_scores:
+                result['similarity_score'] = vector_scores[idx]
+            if idx in keyword_scores:
+                result['keyword_score'] = keyword_scores[idx]
+            if vector_hits is None:
+                result['reduced_recall'] = True
+            results.append(result)
+        
+        if vector_hits is None:
+            logger.warning(f"Vector retriever unavailable, keyword-only results for: {query[:50]}")
+        return results
+    
+    def hybrid_search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Perform hybrid search combining vector and keyword search.
+        
+        Both retrievers run concurrently, each fetching more candidates
+        than k, and their rankings are fused (see SearchConfig.fusion_method).
+        If the vector retriever misses its deadline, fails or has no index
+        yet, keyword results are returned alone, flagged with reduced_recall.
+        
+        Args:
+            query: Query text
+            k: Number of results
+            where: Optional metadata filter, applied inside both retrievers
+                (see _filter_mask)
+        """
+        snapshot = self.snapshot()
+        allowed = self._filter_mask(where, snapshot)
+        if allowed is not None and not allowed.any():
+            return []
         
-        for record in _kb_data_cache:
-            score = 0
-            
-            # Check different fields
-            if query_lower in record.get('reaction', '').lower():
-                score += 3
-            if query_lower in record.get('topic', '').lower():
-                score += 2
-            if query_lower in record.get('description', '').lower():
-                score += 1
-            
-            # Check particles
-            particles = record.get('particles', [])
-            for particle in particles:
-                if query_lower in particle.lower():
-                    score += 2
-            
-            if score > 0:
-                result = record.copy()
-                result['keyword_score'] = score
-                results.append(result)
-        
-        # Sort by score and return top k
-        results.sort(key=lambda x: x['keyword_score'], reverse=True)
-        return results[:k]
-    
-    def hybrid_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Perform hybrid search combining vector and keyword search."""
-        # Try vector search first
-        vector_results = self.vector_search(query, k)
-        
-        # If vector search fails or returns few results, use keyword search
-        if len(vector_results) < k:
-            keyword_results = self.keyword_search(query, k)
-            
-            # Merge results, avoiding duplicates
-            seen_reactions = {r['reaction'] for r in vector_results}
-            for kr in keyword_results:
-                if kr['reaction'] not in seen_reactions:
-                    vector_results.append(kr)
-                    if len(vector_results) >= k:
-                        break
+        depth = k * _FUSION_DEPTH
+        vector_future = _retriever_executor.submit(
+            self._vector_candidates, query, depth, allowed, snapshot
+        )
+        
+        try:
+            keyword_hits = self._keyword_candidates(query, depth, allowed, snapshot)
+        except Exception as e:
+            logger.error(f"Keyword search failed: {e}")
+            keyword_hits = None
+        
+        try:
+            vector_hits = vector_future.result(timeout=config.search.vector_timeout_seconds)
+        except FutureTimeoutError:
+            logger.warning(
+                f"Vector search exceeded {config.search.vector_timeout_seconds}s deadline"
+            )
+            vector_hits = None
+        except Exception as e:
+            logger.error(f"Vector search failed: {e}")
+            vector_hits = None
+        
+        return self._fuse_results(query, k, vector_hits, keyword_hits, snapshot)
+    
+    async def hybrid_search_async(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Async hybrid search running both retrievers concurrently off the event loop.
+        
+        Each retriever has its own deadline (SearchConfig.vector_timeout_seconds
+        and keyword_timeout_seconds); a retriever that misses it or fails is
+        left out of the fusion, so a slow embedding call degrades to
+        keyword-only results instead of stalling the caller. The abandoned
+        call keeps running in its worker thread and still warms the
+        embedding caches. where filters both retrievers like hybrid_search.
+        """
+        snapshot = self.snapshot()
+        allowed = self._filter_mask(where, snapshot)
+        if allowed is not None and not allowed.any():
+            return []
         
-        return vector_results[:k]
+        search_config = config.search
+        depth = k * _FUSION_DEPTH
+        
+        async def run(name: str, retriever, timeout: float):
+            try:
+                return await asyncio.wait_for(
+                    asyncio.to_thread(retriever, query, depth, allowed, snapshot), timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"{name} search exceeded {timeout}s deadline")
+            except Exception as e:
+                logger.error(f"{name} search failed: {e}")
+            return None
+        
+        vector_hits, keyword_hits = await asyncio.gather(
+            run("Vector", self._vector_candidates, search_config.vector_timeout_seconds),
+            run("Keyword", self._keyword_candidates, search_config.keyword_timeout_seconds),
+        )
+        return self._fuse_results(query, k, vector_hits, keyword_hits, snapshot)
     
     def search_by_particles(self, particles: List[str], k: int = 5) -> List[Dict[str, Any]]:
         """Search for diagrams containing specific particles."""
-        if not _kb_data_cache:
+        records = self.snapshot().records
+        if not records:
             return []
         
-        results = []
-        particles_lower = [p.lower() for p in particles]
+        if not particles:
+            return []
         
-        for record in _kb_data_cache:
-            record_particles = [p.lower() for p in record.get('particles', [])]
-            
-            # Count matching particles
-            matches = sum(1 for p in particles_lower if any(p in rp for rp in record_particles))
-            
-            if matches > 0:
-                result = record.copy()
-                result['particle_match_score'] = matches / len(particles)
-                results.append(result)
+        # Count matching particles from the posting lists of the distinct particle strings
+        counts = get_metadata_index(records).particle_match_counts(particles)
+        matched = np.flatnonzero(counts)
+        order = matched[np.argsort(-counts[matched], kind="stable")][:k]
         
-        # Sort by match score
-        results.sort(key=lambda x: x['particle_match_score'], reverse=True)
-        return results[:k]
+        return [
+            records.view(idx, particle_match_score=int(counts[idx]) / len(particles))
+            for idx in order
+        ]
     
     def search_by_process_type(self, process_type: str) -> List[Dict[str, Any]]:
         """Search for diagrams by process type."""
-        if not _kb_data_cache:
+        records = self.snapshot().records
+        if not records:
             return []
         
-        process_type_lower = process_type.lower()
-        results = []
-        
-        for record in _kb_data_cache:
-            if record.get('process_type', '').lower() == process_type_lower:
-                results.append(record.copy())
-        
-        return results
+        positions = get_metadata_index(records).positions('process_type', process_type)
+        return [records.view(idx) for idx in positions]
 
 
 # Convenience functions for agent use
-def search_local_kb(query: str, k: int = 5) -> List[Dict[str, Any]]:
-    """Search local knowledge base using hybrid search."""
-    tool = LocalKBTool()
-    return tool.hybrid_search(query, k)
+def search_local_kb(
+    query: str,
+    k: int = 5,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Search local knowledge base using hybrid search.
+    
+    Args:
+        query: Natural language query
+        k: Number of results
+        where: Optional filter, e.g. {"process_type": "decay",
+            "particles_any": ["W"]}; keys are process_type, source_type,
+            particles_any and particles_all
+    
+    Returns:
+        Matching records as plain dicts, best first
+    """
+    from .service import get_kb_service
+    try:
+        return materialize(get_kb_service().search(query, k, where))
+    except ValueError as e:
+        return [{"error": str(e)}]
 
 
 def search_local_kb_by_particles(particles: List[str], k: int = 5) -> List[Dict[str, Any]]:
     """Search local knowledge base by particles."""
-    tool = LocalKBTool()
-    return tool.search_by_particles(particles, k)
+    from .service import get_kb_service
+    return materialize(get_kb_service().search_by_particles(particles, k))
 
 
 def build_local_index():
     """Build the local vector search index."""
-    tool = LocalKBTool()
-    tool.build_index(force_rebuild=True)
+    from .service import get_kb_service
+    get_kb_service().build_index(force_rebuild=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,309 @@
+"""
+Metadata posting lists for filtered KB search.
+
+MetadataIndex maps each value of the filterable record fields to the sorted
+positions of the records carrying it:
+
+- ``process_type`` and ``source_type``: lowercase field value
+- ``particles``: normalized particle symbol (``W^+`` -> ``w^+``,
+  ``\\bar{\\nu}_e`` -> ``nubar_e``), its base symbol (``w``, ``nubar``) and
+  English alias (``\\gamma`` -> ``photon``)
+
+A ``where`` filter is turned into a boolean mask over record positions by
+OR-ing the posting lists of each key's values and AND-ing the keys, so
+filters cost O(matches) instead of a scan over every record. The mask is
+passed to VectorIndex.search_filtered and BM25Index.search, which apply it
+while generating candidates.
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from .lexical import ALIASES, _BAR_RE
+from .packed import PackedLists, pack_lists
+
+logger = logging.getLogger(__name__)
+
+#: Keys accepted in a where filter
+FILTER_KEYS = ("process_type", "source_type", "particles_any", "particles_all")
+
+
+def normalize_particle(particle: str) -> str:
+    """
+    Normalize a particle symbol for filtering.
+
+    Args:
+        particle: LaTeX or plain symbol, e.g. "$W^{+}$", "\\bar{u}", "photon"
+
+    Returns:
+        Lowercase symbol without $, braces, backslashes or spaces
+    """
+    # "\bar" written with a single backslash in JSON decodes to a backspace
+    text = str(particle).replace("\b", "\\b").strip().strip("$")
+    text = _BAR_RE.sub(lambda m: f"{(m.group(1) or m.group(2))}bar", text)
+    return re.sub(r"[{}\\\s$]", "", text.lower())
+
+
+def particle_keys(particle: str) -> List[str]:
+    """Posting keys of a record particle: its symbol, base symbol and alias."""
+    symbol = normalize_particle(particle)
+    if not symbol:
+        return []
+    keys = [symbol]
+    base = re.split(r"[\^_]", symbol, maxsplit=1)[0]
+    if base and base != symbol:
+        keys.append(base)
+    alias = ALIASES.get(symbol) or ALIASES.get(base)
+    if alias and alias not in keys:
+        keys.append(alias)
+    return keys
+
+
+def _as_values(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, Iterable):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+class MetadataIndex:
+    """Posting lists of record positions per process type, source type and particle."""
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        """
+        Build the posting lists.
+
+        Args:
+            records: KB records; positions refer to this sequence
+        """
+        self.size = len(records)
+        postings: Dict[str, Dict[str, List[int]]] = {
+            "process_type": defaultdict(list),
+            "source_type": defaultdict(list),
+            "particles": defaultdict(list),
+        }
+        # Raw lowercase particle strings, for substring matching
+        raw_particles: Dict[str, List[int]] = defaultdict(list)
+
+        for position, record in enumerate(records):
+            for field in ("process_type", "source_type"):
+                value = record.get(field)
+                if isinstance(value, str) and value.strip():
+                    postings[field][value.strip().lower()].append(position)
+
+            keys = set()
+            raw = set()
+            for particle in record.get("particles") or ():
+                keys.update(particle_keys(particle))
+                raw.add(str(particle).lower())
+            for key in keys:
+                postings["particles"][key].append(position)
+            for particle in raw:
+                raw_particles[particle].append(position)
+
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {
+            field: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+            for field, values in postings.items()
+        }
+        self.raw_particles: Dict[str, np.ndarray] = {
+            particle: np.asarray(rows, dtype=np.int64) for particle, rows in raw_particles.items()
+        }
+
+    def pack(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """
+        Flatten the posting lists into JSON-serializable metadata and arrays.
+
+        Returns:
+            Tuple of (metadata, arrays) accepted by from_packed
+        """
+        lists = {**{f"postings_{field}": values for field, values in self.postings.items()},
+                 "raw_particles": self.raw_particles}
+        meta: Dict[str, Any] = {"size": self.size, "keys": {}}
+        arrays: Dict[str, np.ndarray] = {}
+        for name, values in lists.items():
+            keys, offsets, rows = pack_lists(values)
+            meta["keys"][name] = keys
+            arrays[f"{name}_offsets"] = offsets
+            arrays[f"{name}_rows"] = rows
+        return meta, arrays
+
+    @classmethod
+    def from_packed(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> "MetadataIndex":
+        """
+        Rebuild an index from pack() output without reading any record.
+
+        Posting lists are slices of the (possibly memory-mapped) arrays.
+
+        Args:
+            meta: Metadata from pack()
+            arrays: Arrays from pack()
+
+        Returns:
+            MetadataIndex equivalent to the packed one
+        """
+        def lists(name: str) -> PackedLists:
+            rows = arrays[f"{name}_rows"]
+            return PackedLists(meta["keys"][name], arrays[f"{name}_offsets"],
+                               lambda start, end: rows[start:end])
+
+        index = cls.__new__(cls)
+        index.size = meta["size"]
+        index.postings = {
+            name[len("postings_"):]: lists(name)
+            for name in meta["keys"] if name.startswith("postings_")
+        }
+        index.raw_particles = lists("raw_particles")
+        return index
+
+    def values(self, field: str) -> Dict[str, int]:
+        """
+        Get the indexed values of a field with their record counts.
+
+        Args:
+            field: "process_type", "source_type" or "particles"
+
+        Returns:
+            Mapping of value to number of records
+        """
+        return {value: int(rows.shape[0]) for value, rows in self.postings.get(field, {}).items()}
+
+    def _union(self, field: str, values: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        postings = self.postings[field]
+        for value in values:
+            rows = postings.get(value)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Turn a where filter into a boolean mask over record positions.
+
+        Supported keys (all given keys must match):
+
+        - ``process_type`` / ``source_type``: a value or list of values,
+          compared case-insensitively
+        - ``particles_any``: particles of which at least one must appear
+        - ``particles_all``: particles that must all appear
+
+        Particles are matched by normalized symbol, so "W" matches W^+ and
+        W^-, and "photon" matches \\gamma.
+
+        Args:
+            where: Filter dictionary; None or empty means no filter
+
+        Returns:
+            Boolean mask of matching positions, or None for no filter
+
+        Raises:
+            ValueError: If the filter has an unknown key
+        """
+        if not where:
+            return None
+        unknown = sorted(set(where) - set(FILTER_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {unknown} (expected some of {list(FILTER_KEYS)})")
+
+        mask = np.ones(self.size, dtype=bool)
+        for key, value in where.items():
+            values = _as_values(value)
+            if key in ("process_type", "source_type"):
+                mask &= self._union(key, (v.strip().lower() for v in values))
+            elif key == "particles_any":
+                mask &= self._union("particles", (normalize_particle(v) for v in values))
+            else:
+                for particle in values:
+                    mask &= self._union("particles", [normalize_particle(particle)])
+        return mask
+
+    def positions(self, field: str, value: str) -> np.ndarray:
+        """
+        Get the positions of the records with a field value.
+
+        Args:
+            field: "process_type", "source_type" or "particles"
+            value: Value (lowercased; particles go through normalize_particle)
+
+        Returns:
+            Sorted record positions
+        """
+        if field == "particles":
+            value = normalize_particle(value)
+        else:
+            value = value.strip().lower()
+        return self.postings.get(field, {}).get(value, np.zeros(0, dtype=np.int64))
+
+    def particle_match_counts(self, particles: Sequence[str]) -> np.ndarray:
+        """
+        Count, per record, the query particles contained in one of its particles.
+
+        A query particle matches a record particle it is a (case-insensitive)
+        substring of; only the distinct particle strings are scanned.
+
+        Args:
+            particles: Query particles
+
+        Returns:
+            Match count of every record position
+        """
+        counts = np.zeros(self.size, dtype=np.int64)
+        for particle in particles:
+            needle = particle.lower()
+            matched = np.zeros(self.size, dtype=bool)
+            for raw, rows in self.raw_particles.items():
+                if needle in raw:
+                    matched[rows] = True
+            counts += matched
+        return counts
+
+
+_index_cache: Dict[int, Tuple[Sequence[Dict[str, Any]], int, MetadataIndex]] = {}
+_index_cache_lock = threading.Lock()
+_INDEX_CACHE_SIZE = 8
+
+
+def get_metadata_index(records: Sequence[Dict[str, Any]]) -> MetadataIndex:
+    """
+    Get the metadata index for a record list, building it on first use.
+
+    Indexes are cached by list identity and size, like the BM25 index.
+
+    Args:
+        records: KB records
+
+    Returns:
+        MetadataIndex over the records
+    """
+    key = id(records)
+    entry = _index_cache.get(key)
+    if entry is not None and entry[0] is records and entry[1] == len(records):
+        return entry[2]
+
+    index = MetadataIndex(records)
+    set_metadata_index(records, index)
+    logger.info(
+        f"Built metadata index over {len(records)} records "
+        f"({len(index.postings['particles'])} particle keys)"
+    )
+    return index
+
+
+def set_metadata_index(records: Sequence[Dict[str, Any]], index: MetadataIndex):
+    """
+    Register a prebuilt metadata index (e.g. one read from a KB bundle) for a record list.
+
+    Args:
+        records: KB records the index was built over
+        index: Their metadata index
+    """
+    with _index_cache_lock:
+        if len(_index_cache) >= _INDEX_CACHE_SIZE:
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[id(records)] = (records, len(records), index)
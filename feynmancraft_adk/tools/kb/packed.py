@@ -0,0 +1,78 @@
+"""
+Compressed sparse row (CSR) packing of keyed lists.
+
+Search indexes keep many small lists keyed by a string (BM25 postings per
+term, record positions per particle, ...). pack_lists() flattens them into
+one values array plus an offsets array, which can be stored as raw arrays
+(e.g. in a KB bundle) and read back without parsing. PackedLists is the
+read-only Mapping over the packed form: keys are resolved through a dict,
+and a list is only materialized when it is looked up.
+"""
+
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+
+def pack_lists(
+    lists: Mapping,
+    dtype: Any = np.int64
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Flatten keyed lists of numbers.
+
+    Args:
+        lists: Mapping of key to a sequence (or 1-d array) of numbers
+        dtype: dtype of the values array
+
+    Returns:
+        Tuple of (keys, offsets, values); the list of keys[i] is
+        values[offsets[i]:offsets[i + 1]]
+    """
+    keys = list(lists)
+    lengths = [len(lists[key]) for key in keys]
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.empty(int(offsets[-1]), dtype=dtype)
+    for key, start, end in zip(keys, offsets[:-1], offsets[1:]):
+        values[start:end] = lists[key]
+    return keys, offsets, values
+
+
+class PackedLists(Mapping):
+    """Read-only mapping of key to list over CSR-packed arrays."""
+
+    __slots__ = ("_rows", "_offsets", "_decode")
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        offsets: np.ndarray,
+        decode: Callable[[int, int], Any]
+    ):
+        """
+        Args:
+            keys: Keys in packed order
+            offsets: Offsets array from pack_lists
+            decode: Builds the value of a key from its (start, end) range
+                in the values array(s)
+        """
+        if len(offsets) != len(keys) + 1:
+            raise ValueError(f"Got {len(offsets)} offsets for {len(keys)} keys")
+        self._rows: Dict[str, int] = dict(zip(keys, range(len(keys))))
+        self._offsets = offsets
+        self._decode = decode
+
+    def __getitem__(self, key: str) -> Any:
+        row = self._rows[key]
+        return self._decode(int(self._offsets[row]), int(self._offsets[row + 1]))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
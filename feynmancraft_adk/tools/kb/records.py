@@ -0,0 +1,289 @@
+"""
+Shared, read-only store of KB records.
+
+The KB file is parsed once per process into a KBRecordStore that every
+search path (LocalKBTool, the embedding manager, the data_loader helpers)
+reads from:
+
+- records are KBRecord objects with ``__slots__``, one tuple of field values
+  each, instead of dicts
+- particle symbols and categorical fields (process type, source, ...) are
+  interned, so equal strings are stored once
+- TikZ bodies, by far the largest field, are kept UTF-8 encoded in one
+  contiguous buffer and only decoded when a caller reads ``record["tikz"]``
+
+Records are read-only Mappings. Search results wrap them in RecordView,
+a mutable mapping that layers scores and other per-hit fields over the
+shared record instead of copying it; to_dict() turns either into a plain
+dict, e.g. before JSON serialization.
+"""
+
+import json
+import sys
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import logging
+
+import numpy as np
+
+from .vector_store import ContentHasher, compute_content_hash
+
+logger = logging.getLogger(__name__)
+
+#: Field whose values are kept encoded and decoded on access
+LAZY_FIELD = "tikz"
+
+#: String fields whose values repeat across records and are interned
+INTERNED_FIELDS = ("process_type", "source_type", "source")
+
+_MISSING = object()
+# Placeholder for a value kept in the store's encoded buffer
+_LAZY = object()
+
+
+def compute_records_hash(records: Iterable[Mapping]) -> str:
+    """
+    Hash KB records in row order, so an index can be matched to them.
+
+    Args:
+        records: Record dictionaries or KBRecords
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    return compute_content_hash(record_hash_text(record) for record in records)
+
+
+def record_hash_text(record: Mapping) -> str:
+    """Canonical JSON text of a record, as hashed by compute_records_hash."""
+    return json.dumps(to_dict(record), sort_keys=True, ensure_ascii=False)
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class KBRecord(Mapping):
+    """Read-only view of one record of a KBRecordStore."""
+
+    __slots__ = ("_store", "_position", "_values")
+
+    def __init__(self, store: "KBRecordStore", position: int, values: tuple):
+        self._store = store
+        self._position = position
+        self._values = values
+
+    @property
+    def position(self) -> int:
+        """Row position of the record in its store."""
+        return self._position
+
+    def __getitem__(self, key: str) -> Any:
+        column = self._store._columns.get(key)
+        if column is None or column >= len(self._values):
+            raise KeyError(key)
+        value = self._values[column]
+        if value is _MISSING:
+            raise KeyError(key)
+        if value is _LAZY:
+            return self._store.tikz(self._position - self._store.offset)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for field, value in zip(self._store.fields, self._values):
+            if value is not _MISSING:
+                yield field
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._values if value is not _MISSING)
+
+    def __contains__(self, key: object) -> bool:
+        column = self._store._columns.get(key)
+        return (column is not None and column < len(self._values)
+                and self._values[column] is not _MISSING)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{key}={self[key]!r}" for key in self if key != LAZY_FIELD)
+        return f"KBRecord({self._position}: {fields})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialize the record as a plain dict (decoding the TikZ body)."""
+        return {
+            key: list(value) if isinstance(value, tuple) else value
+            for key, value in self.items()
+        }
+
+
+class RecordView(MutableMapping):
+    """
+    A search hit: a shared KBRecord plus per-hit fields such as scores.
+
+    Reads fall through to the record; writes go to the view, so hits never
+    modify the store. Record fields can be shadowed but not deleted.
+    """
+
+    __slots__ = ("record", "_extra")
+
+    def __init__(self, record: Mapping, **extra: Any):
+        self.record = record
+        self._extra = extra
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._extra:
+            return self._extra[key]
+        return self.record[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self._extra:
+            del self._extra[key]
+        elif key in self.record:
+            raise TypeError(f"Record field '{key}' is read-only")
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.record
+        for key in self._extra:
+            if key not in self.record:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.record) + sum(1 for key in self._extra if key not in self.record)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._extra or key in self.record
+
+    def __repr__(self) -> str:
+        return f"RecordView({self.record!r}, {self._extra!r})"
+
+    def copy(self) -> "RecordView":
+        """Another view of the same record with its own per-hit fields."""
+        return RecordView(self.record, **self._extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialize the hit as a plain dict."""
+        result = to_dict(self.record)
+        result.update(self._extra)
+        return result
+
+
+def to_dict(record: Mapping) -> Dict[str, Any]:
+    """
+    Turn a record, view or plain dict into a plain dict.
+
+    Args:
+        record: KBRecord, RecordView or dict
+
+    Returns:
+        A dict (the argument itself if it already is one)
+    """
+    if isinstance(record, dict):
+        return record
+    if isinstance(record, (KBRecord, RecordView)):
+        return record.to_dict()
+    return dict(record)
+
+
+def materialize(results: Sequence[Mapping]) -> List[Dict[str, Any]]:
+    """
+    Convert search results to plain dicts, e.g. before returning them to an agent.
+
+    Args:
+        results: Search hits (views or dicts)
+
+    Returns:
+        List of dicts
+    """
+    return [to_dict(result) for result in results]
+
+
+class KBRecordStore(Sequence):
+    """Immutable, compact sequence of KB records."""
+
+    def __init__(
+        self,
+        records: Iterable[Mapping],
+        source: Optional[str] = None,
+        offset: int = 0
+    ):
+        """
+        Build the store in one pass over the records.
+
+        Only the compact form of each record is kept, so records can be
+        streamed from a generator (see ingest.stream_kb_records) without
+        holding the parsed dicts.
+
+        Args:
+            records: Record dictionaries, in row order; consumed once
+            source: Where the records came from (for logging and stats)
+            offset: Position of the first record, when the store is one
+                shard of a larger KB
+        """
+        self.source = source
+        self.offset = offset
+        self._columns: Dict[str, int] = {}
+        self._records: List[KBRecord] = []
+        self._tikz_buffer = bytearray()
+        offsets = [0]
+        hasher = ContentHasher()
+
+        for position, record in enumerate(records, start=offset):
+            hasher.update(record_hash_text(record))
+            for key in record:
+                if key not in self._columns:
+                    self._columns[key] = len(self._columns)
+
+            values = []
+            for key in self._columns:
+                value = record.get(key, _MISSING)
+                if key == LAZY_FIELD and isinstance(value, str):
+                    self._tikz_buffer += value.encode("utf-8")
+                    value = _LAZY
+                values.append(self._compact(key, value))
+            offsets.append(len(self._tikz_buffer))
+            self._records.append(KBRecord(self, position, tuple(values)))
+
+        self.fields = tuple(self._columns)
+        self.content_hash = hasher.hexdigest()
+        self._tikz_offsets = np.asarray(offsets, dtype=np.int64)
+
+    @staticmethod
+    def _compact(key: str, value: Any) -> Any:
+        if key == "particles" and isinstance(value, list):
+            return tuple(_intern(particle) for particle in value)
+        if key in INTERNED_FIELDS:
+            return _intern(value)
+        return value
+
+    def tikz(self, index: int) -> str:
+        """Decode the TikZ body of the record at an index of this store."""
+        start, end = self._tikz_offsets[index], self._tikz_offsets[index + 1]
+        return str(self._tikz_buffer[start:end], "utf-8")
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[KBRecord, List[KBRecord]]:
+        return self._records[index]
+
+    def __iter__(self) -> Iterator[KBRecord]:
+        return iter(self._records)
+
+    def __repr__(self) -> str:
+        return f"KBRecordStore({len(self)} records from {self.source})"
+
+    def view(self, index: int, **extra: Any) -> RecordView:
+        """
+        Get a search hit for a record.
+
+        Args:
+            index: Record index
+            **extra: Per-hit fields, e.g. similarity_score=0.9
+
+        Returns:
+            RecordView over the shared record
+        """
+        return RecordView(self._records[index], **extra)
@@ -6,19 +6,31 @@ import asyncio
 from typing import List, Dict, Any, Optional
 import logging
 
+from .embedding_batcher import EmbeddingBatcher
 from .embedding_manager import get_kb_manager
-from .embeddings import get_embedding, cosine_similarity
+from .embeddings import get_embedding
+from .fusion import merge_query_hits
+from .metadata import get_metadata_index
+from .records import RecordView, materialize
+from .service import get_kb_service
 
 logger = logging.getLogger(__name__)
 
 
-async def search_local_tikz_examples(query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+async def search_local_tikz_examples(
+    query: str,
+    top_k: int = 5,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
     """
     Perform semantic search for TikZ examples in local KB.
     
     Args:
         query: Natural language query about the Feynman diagram
         top_k: Number of top results to return
+        where: Optional filter, e.g. {"process_type": "decay",
+            "particles_any": ["W"]}; keys are process_type, source_type,
+            particles_any and particles_all
         
     Returns:
         List of relevant TikZ examples sorted by similarity
@@ -28,7 +40,7 @@ async def search_local_tikz_examples(query: str, top_k: int = 5) -> List[Dict[st
         manager = get_kb_manager()
         await manager.initialize()
         
-        if not manager.kb_examples or not manager.embeddings_cache:
+        if not manager.kb_examples or manager.vector_index is None:
             return [{"error": "KB examples or embeddings are not available."}]
         
         # Get query embedding
@@ -41,32 +53,96 @@ async def search_local_tikz_examples(query: str, top_k: int = 5) -> List[Dict[st
         if not query_embedding:
             return [{"error": "Failed to get query embedding"}]
         
-        # Calculate similarities
-        similarities = []
-        for i, example in enumerate(manager.kb_examples):
-            if i in manager.embeddings_cache:
-                example_embedding = manager.embeddings_cache[i]
-                similarity = cosine_similarity(query_embedding, example_embedding)
-                similarities.append((similarity, i, example))
-        
-        # Sort by similarity and return top_k
-        similarities.sort(key=lambda x: x[0], reverse=True)
-        
-        results = []
-        for similarity, idx, example in similarities[:top_k]:
-            result = example.copy()
-            result["similarity_score"] = similarity
-            result["source_type"] = "local"
-            results.append(result)
+        # Index ids are example positions
+        if where:
+            allowed = get_metadata_index(manager.kb_examples).mask(where)
+            ids, scores = manager.vector_index.search_filtered(query_embedding, top_k, allowed)
+        else:
+            ids, scores = manager.vector_index.search(query_embedding, top_k)
+        
+        results = [
+            RecordView(manager.kb_examples[idx], similarity_score=float(similarity), source_type="local")
+            for idx, similarity in zip(ids, scores)
+        ]
             
         logger.info(f"Found {len(results)} local KB results for query: {query[:50]}...")
-        return results
+        return materialize(results)
         
     except Exception as e:
         logger.error(f"Error in local TikZ search: {e}")
         return [{"error": f"Search failed: {str(e)}"}]
 
 
+async def search_local_tikz_examples_many(
+    queries: List[str],
+    top_k: int = 5,
+    where: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Semantic search for several queries at once (e.g. phrasings of one process).
+    
+    All queries are embedded in one batch request and scored with a single
+    matrix-matrix product. The top_k hits of every query are merged so each
+    example appears once, ordered by reciprocal rank fusion.
+    
+    Args:
+        queries: Natural language queries about Feynman diagrams
+        top_k: Number of results per query
+        where: Optional filter, as for search_local_tikz_examples
+        
+    Returns:
+        Deduplicated TikZ examples with their best similarity_score and the
+        matched_queries that found them
+    """
+    queries = [q for q in dict.fromkeys(queries or []) if q and q.strip()]
+    if not queries:
+        return [{"error": "No queries given"}]
+        
+    try:
+        manager = get_kb_manager()
+        await manager.initialize()
+        
+        if not manager.kb_examples or manager.vector_index is None:
+            return [{"error": "KB examples or embeddings are not available."}]
+            
+        embeddings = await EmbeddingBatcher(manager.model_name).aembed(queries)
+        if not any(embeddings):
+            return [{"error": "Failed to get query embeddings"}]
+            
+        # Index ids are example positions
+        index = manager.vector_index
+        if where:
+            allowed = get_metadata_index(manager.kb_examples).mask(where)
+            searches = [
+                index.search_filtered(e, top_k, allowed) if e else ([], [])
+                for e in embeddings
+            ]
+        else:
+            searches = index.search_many(embeddings, top_k)
+            
+        merged = merge_query_hits([
+            [(int(idx), float(score)) for idx, score in zip(ids, scores)]
+            for ids, scores in searches
+        ])
+        
+        results = [
+            RecordView(
+                manager.kb_examples[idx],
+                similarity_score=similarity,
+                matched_queries=[queries[i] for i in query_indices],
+                source_type="local",
+            )
+            for idx, similarity, query_indices in merged
+        ]
+            
+        logger.info(f"Found {len(results)} local KB results for {len(queries)} queries")
+        return materialize(results)
+        
+    except Exception as e:
+        logger.error(f"Error in multi-query local TikZ search: {e}")
+        return [{"error": f"Search failed: {str(e)}"}]
+
+
 def search_tikz_examples(query: str, use_bigquery: bool = False, k: int = 5) -> List[Dict[str, Any]]:
     """
     Search interface for TikZ examples using local KB only.
@@ -83,13 +159,10 @@ def search_tikz_examples(query: str, use_bigquery: bool = False, k: int = 5) ->
     
     # Use local search only
     try:
-        from . import LocalKBTool
-        
         logger.info("Using local KB search...")
-        local_tool = LocalKBTool()
         
         # Try hybrid search first
-        results = local_tool.hybrid_search(query, k=k)
+        results = materialize(get_kb_service().search(query, k=k))
         
         if results:
             logger.info(f"Found {len(results)} results from local KB tool")
@@ -141,15 +214,9 @@ async def search_tikz_examples_async(query: str, use_bigquery: bool = False, k:
     
     # Use local search only
     try:
-        from . import LocalKBTool
-        
         logger.info("Using local KB search...")
         
-        def local_kb_search():
-            local_tool = LocalKBTool()
-            return local_tool.hybrid_search(query, k=k)
-        
-        results = await asyncio.to_thread(local_kb_search)
+        results = materialize(await get_kb_service().search_async(query, k=k))
         
         if results:
             logger.info(f"Found {len(results)} results from local KB tool")
@@ -0,0 +1,259 @@
+"""
+Long-lived local KB service shared by the agent tools.
+
+KBService owns one LocalKBTool for the life of the process, so per-query
+calls skip construction (environment loading, API client setup, KB
+parsing) entirely. It has an explicit lifecycle:
+
+- open(): configure the API client and load the KB records
+- warm(): additionally load the vector, lexical and metadata indexes
+- reload(): re-read the KB file and swap in a new snapshot of the
+  records and indexes once it is fully built (see LocalKBTool.reload)
+- close(): drop the tool; the next call reopens it
+
+stats() reports lifecycle timings, per-operation call counts and
+latencies, and the progress of any background index build.
+"""
+
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+import logging
+
+from .lexical import get_lexical_index
+from .metadata import get_metadata_index
+
+if TYPE_CHECKING:
+    from .local import LocalKBTool
+
+logger = logging.getLogger(__name__)
+
+
+class KBService:
+    """Thread-safe owner of the local KB search tool."""
+
+    def __init__(self):
+        self._tool = None
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._timings: Dict[str, float] = {}
+        self._operations: Dict[str, Dict[str, float]] = {}
+        self.opened_at: Optional[float] = None
+        self.reloads = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._tool is not None
+
+    def open(self) -> "LocalKBTool":
+        """
+        Open the service if it isn't already.
+
+        Callers use the returned tool rather than re-reading it from the
+        service, so a concurrent close() cannot pull it from under them.
+
+        Returns:
+            The service's LocalKBTool
+        """
+        tool = self._tool
+        if tool is not None:
+            return tool
+
+        with self._lock:
+            if self._tool is None:
+                from .local import LocalKBTool
+
+                start = time.perf_counter()
+                self._tool = LocalKBTool()
+                self._timings["open_seconds"] = time.perf_counter() - start
+                self.opened_at = time.time()
+                logger.info(f"KB service opened in {self._timings['open_seconds']:.3f}s")
+            return self._tool
+
+    def warm(self, build_missing: bool = True) -> "KBService":
+        """
+        Open the service and load every index, so the first query is fast.
+
+        Args:
+            build_missing: Start a background build if the vector index is
+                missing or stale; otherwise only a current index is loaded
+
+        Returns:
+            self, for chaining
+        """
+        tool = self.open()
+        with self._lock:
+            start = time.perf_counter()
+            if build_missing or tool.index_is_current():
+                tool._load_index()
+            else:
+                logger.warning("KB vector index is missing or stale; not building it while warming")
+            records = tool.snapshot().records
+            if records:
+                get_lexical_index(records)
+                get_metadata_index(records)
+            self._timings["warm_seconds"] = time.perf_counter() - start
+        logger.info(f"KB service warmed in {self._timings['warm_seconds']:.3f}s")
+        return self
+
+    def reload(self, build_index: bool = True) -> bool:
+        """
+        Re-read the KB file and swap in new records and indexes.
+
+        The new snapshot is prepared in the calling thread, so call this
+        off the request path; searches keep being served from the previous
+        snapshot until it is swapped in, and those already running finish
+        on it.
+
+        Args:
+            build_index: Build a missing vector index before the swap
+                rather than in the background after it
+
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        tool = self.open()
+        start = time.perf_counter()
+        swapped = tool.reload(build_index)
+        with self._stats_lock:
+            if swapped:
+                self.reloads += 1
+            self._timings["reload_seconds"] = time.perf_counter() - start
+        return swapped
+
+    def close(self):
+        """Release the tool; the next call reopens the service."""
+        with self._lock:
+            self._tool = None
+            self.opened_at = None
+
+    def _call(self, operation: str, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a tool method, recording its latency."""
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._record(operation, time.perf_counter() - start)
+
+    def _record(self, operation: str, elapsed: float):
+        with self._stats_lock:
+            entry = self._operations.setdefault(
+                operation, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            entry["calls"] += 1
+            entry["total_seconds"] += elapsed
+            entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Hybrid (vector + keyword) search, optionally filtered by metadata."""
+        return self._call("search", self.open().hybrid_search, query, k, where)
+
+    async def search_async(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Async hybrid search with per-retriever deadlines."""
+        tool = self._tool or await asyncio.to_thread(self.open)
+        start = time.perf_counter()
+        try:
+            return await tool.hybrid_search_async(query, k, where)
+        finally:
+            self._record("search_async", time.perf_counter() - start)
+
+    def vector_search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Vector similarity search, optionally filtered by metadata."""
+        return self._call("vector_search", self.open().vector_search, query, k, where)
+
+    def keyword_search(
+        self,
+        query: str,
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """BM25 keyword search, optionally filtered by metadata."""
+        return self._call("keyword_search", self.open().keyword_search, query, k, where)
+
+    def search_by_particles(self, particles: List[str], k: int = 5) -> List[Dict[str, Any]]:
+        """Search for diagrams containing specific particles."""
+        return self._call("search_by_particles", self.open().search_by_particles, particles, k)
+
+    def search_by_process_type(self, process_type: str) -> List[Dict[str, Any]]:
+        """Search for diagrams by process type."""
+        return self._call("search_by_process_type", self.open().search_by_process_type, process_type)
+
+    def build_index(self, force_rebuild: bool = False, background: bool = False):
+        """
+        Build the vector index.
+
+        Args:
+            force_rebuild: Rebuild even if a valid index exists
+            background: Return immediately and build in a worker thread
+        """
+        tool = self.open()
+        if background:
+            return tool.start_background_build(force_rebuild)
+        return self._call("build_index", tool.build_index, force_rebuild)
+
+    def index_build_state(self) -> Dict[str, Any]:
+        """Get the state and progress of the most recent index build."""
+        from .local import get_index_build_state
+        return get_index_build_state()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get lifecycle timings and per-operation latency statistics.
+
+        Returns:
+            Dictionary with open/warm/reload timings, record and index state,
+            and calls, total, mean and max seconds per operation
+        """
+        from . import local
+
+        snapshot = local.current_snapshot()
+        with self._stats_lock:
+            operations = {
+                name: {
+                    **entry,
+                    "mean_seconds": entry["total_seconds"] / entry["calls"] if entry["calls"] else 0.0,
+                }
+                for name, entry in self._operations.items()
+            }
+        return {
+            "open": self.is_open,
+            "opened_at": self.opened_at,
+            "reloads": self.reloads,
+            "snapshot_version": snapshot.version if snapshot else None,
+            "records": len(snapshot.records) if snapshot else 0,
+            "index_loaded": snapshot is not None and snapshot.index is not None,
+            "index_build": local.get_index_build_state(),
+            **self._timings,
+            "operations": operations,
+        }
+
+
+_service: Optional[KBService] = None
+_service_lock = threading.Lock()
+
+
+def get_kb_service() -> KBService:
+    """Get the process-wide KB service (opened lazily on first use)."""
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = KBService()
+    return _service
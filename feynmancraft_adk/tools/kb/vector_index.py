@@ -0,0 +1,1264 @@
+"""
+Vector index abstraction with interchangeable engines.
+
+Every engine indexes row-normalized float32 vectors under integer ids and
+answers cosine-similarity top-k queries, optionally restricted to a set of
+allowed ids (search_filtered):
+
+- ``exact``: brute-force matrix-vector product; perfect recall, O(N) per query
+- ``annoy``: Annoy random-projection forest; ``n_trees`` and ``search_k``
+  trade build size and latency against recall
+- ``hnsw``: in-project hierarchical navigable small world graph; ``m``,
+  ``ef_construction`` and ``ef_search`` trade build time and latency
+  against recall
+- ``int8`` / ``pq``: scalar or product quantized codes (4x / up to 32x
+  smaller) scanned per query, with a shortlist of ``k * rerank`` reranked
+  against full-precision vectors read lazily from a memory map
+
+Indexes share one on-disk format, written atomically:
+
+- ``<stem>.index.json``: format version, engine, dimension, count, engine
+  parameters, caller metadata (content hash, model name, ...) and the
+  prefix ``<stem>.<version>`` of the payload files
+- ``<stem>.<version>.ids.npy``: external id of each indexed vector
+- engine payload: ``.vectors.npy`` (exact, hnsw, int8, pq), ``.graph.npz``
+  (hnsw), ``.ann`` (annoy) or ``.codes.npy`` and ``.quantizer.npz`` (int8,
+  pq) under the same prefix; arrays are memory-mapped on load
+
+Every save writes its payload under a new version and then replaces the
+manifest, so readers see either the old or the new index as a whole, and
+processes that mapped the old payload keep reading it. Manifests without
+a payload prefix refer to the unversioned ``<stem>.*`` files of earlier
+releases.
+
+Embedding stores can also be searched through a quantized index (see
+open_store_index), which references the store's matrix file instead of
+copying it.
+"""
+
+import heapq
+import json
+import math
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
+import logging
+
+import numpy as np
+
+from ...shared_libraries.config import config
+from .embeddings import build_normalized_matrix, top_k_cosine, top_k_cosine_many
+from .vector_store import read_manifest, store_matrix_path
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_FORMAT_VERSION = 1
+
+SearchResult = Tuple[np.ndarray, np.ndarray]
+
+
+def _empty_result() -> SearchResult:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+
+def _normalize_query(query: Sequence[float], dim: int) -> Optional[np.ndarray]:
+    """Normalize a query vector, or return None if it is unusable."""
+    query = np.asarray(query, dtype=np.float32)
+    if query.ndim != 1 or query.shape[0] != dim:
+        return None
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return None
+    return query / norm
+
+
+# Filters matching at most this fraction of an index are answered by scoring
+# the matching vectors directly instead of searching the whole index
+_FILTER_SCAN_FRACTION = 0.05
+
+# First over-fetch of engines that filter their results, relative to the
+# number of hits expected at the filter's selectivity; doubled until k
+# allowed hits are found
+_FILTER_OVERFETCH = 2.0
+
+
+def _allowed_ids(allowed: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Look up ids in a boolean mask indexed by id (ids outside it are not allowed)."""
+    keep = np.zeros(ids.shape[0], dtype=bool)
+    in_range = (ids >= 0) & (ids < allowed.shape[0])
+    keep[in_range] = allowed[ids[in_range]]
+    return keep
+
+
+def _masked_top_k(
+    vectors: np.ndarray,
+    query: np.ndarray,
+    k: int,
+    mask: np.ndarray,
+    matches: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k over the rows of vectors selected by mask.
+
+    Selective masks score only the matching rows; broad ones score every
+    row and drop the rest, which avoids a large gather.
+
+    Returns:
+        Tuple of (row positions, cosine similarities), best match first
+    """
+    if matches * 2 <= mask.shape[0]:
+        rows = np.flatnonzero(mask)
+        scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+    else:
+        rows = np.arange(mask.shape[0])
+        scores = np.asarray(vectors, dtype=np.float32) @ query
+        scores[~mask] = -np.inf
+
+    k = min(k, matches)
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return rows[top], scores[top].astype(np.float32)
+
+
+def _path(stem: Path, suffix: str) -> Path:
+    return stem.with_name(stem.name + suffix)
+
+
+# Files written under a payload prefix, by any engine
+_PAYLOAD_SUFFIXES = (".ids.npy", ".vectors.npy", ".graph.npz", ".ann", ".codes.npy", ".quantizer.npz")
+
+
+def _payload_stem(stem: Path, manifest: Optional[Dict[str, Any]]) -> Path:
+    """Prefix of the payload files a manifest points to."""
+    if manifest and manifest.get("payload"):
+        return stem.with_name(manifest["payload"])
+    return stem
+
+
+def _remove_payload(payload_stem: Path):
+    """Remove superseded payload files; readers that mapped them keep their pages."""
+    for suffix in _PAYLOAD_SUFFIXES:
+        path = _path(payload_stem, suffix)
+        if not path.exists():
+            continue
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove superseded vector index file {path}: {e}")
+
+
+def _tmp(path: Path) -> Path:
+    return path.with_name(path.name + f".{os.getpid()}.tmp")
+
+
+class IndexPayload:
+    """
+    Reads the payload files of a saved index (see save_vector_index).
+
+    Engines load through this interface, so an index can also be read from
+    a container that packs the same files (see kb.bundle.KBBundle).
+    """
+
+    def __init__(self, stem: Union[str, Path]):
+        self.stem = Path(stem)
+
+    def array(self, suffix: str) -> np.ndarray:
+        """Memory-map a ``.npy`` payload file."""
+        return np.load(_path(self.stem, suffix), mmap_mode="r")
+
+    def arrays(self, suffix: str) -> Dict[str, np.ndarray]:
+        """Read every array of a ``.npz`` payload file."""
+        with np.load(_path(self.stem, suffix)) as data:
+            return {name: data[name] for name in data.files}
+
+    def path(self, suffix: str) -> Path:
+        """Path of a payload file, for engines that open it themselves."""
+        return _path(self.stem, suffix)
+
+    def sibling(self, name: str) -> Path:
+        """Path of a file next to the index (e.g. a referenced vector store)."""
+        return self.stem.parent / name
+
+
+class VectorIndex(ABC):
+    """Cosine top-k index over row-normalized vectors."""
+
+    #: Engine name stored in the manifest
+    engine: str = ""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        """Engine parameters recorded in the manifest."""
+        return {}
+
+    @abstractmethod
+    def build(self, matrix: np.ndarray, ids: Optional[Sequence[int]] = None):
+        """
+        Index a matrix of vectors.
+
+        Args:
+            matrix: Matrix of shape (count, dim); rows are normalized here if needed
+            ids: External id of each row (defaults to row positions)
+        """
+
+    @abstractmethod
+    def search(self, query: Sequence[float], k: int) -> SearchResult:
+        """
+        Find the k most similar vectors.
+
+        Args:
+            query: Query vector
+            k: Number of results
+
+        Returns:
+            Tuple of (ids, cosine similarities), best match first
+        """
+
+    def search_many(self, queries: Sequence[Sequence[float]], k: int) -> List[SearchResult]:
+        """
+        Find the k most similar vectors for each of several queries.
+
+        Engines that can score a batch at once (exact search: one
+        matrix-matrix product) override this; others search one by one.
+
+        Args:
+            queries: Query vectors
+            k: Number of results per query
+
+        Returns:
+            One (ids, cosine similarities) pair per query, best match first
+        """
+        return [self.search(query, k) for query in queries]
+
+    def search_filtered(self, query: Sequence[float], k: int, allowed: np.ndarray) -> SearchResult:
+        """
+        Find the k most similar vectors among those whose id is allowed.
+
+        The filter is applied while candidates are generated, so k results
+        are returned whenever at least k allowed vectors exist (up to the
+        engine's recall).
+
+        Args:
+            query: Query vector
+            k: Number of results
+            allowed: Boolean mask indexed by id (e.g. from MetadataIndex.mask)
+
+        Returns:
+            Tuple of (ids, cosine similarities), best match first
+        """
+        count = len(self)
+        if k <= 0 or count == 0:
+            return _empty_result()
+        allowed = np.asarray(allowed, dtype=bool)
+        mask = _allowed_ids(allowed, np.asarray(self.ids))
+        matches = int(mask.sum())
+        if matches == 0:
+            return _empty_result()
+        if matches == count:
+            return self.search(query, k)
+        return self._search_filtered(query, min(k, matches), allowed, mask, matches)
+
+    def _search_filtered(
+        self,
+        query: Sequence[float],
+        k: int,
+        allowed: np.ndarray,
+        mask: np.ndarray,
+        matches: int
+    ) -> SearchResult:
+        """
+        Filtered search for engines that cannot skip vectors while searching.
+
+        Fetches enough unfiltered results to expect k allowed ones at the
+        filter's selectivity and doubles the fetch until k are found or
+        the whole index has been returned.
+
+        Args:
+            query: Query vector
+            k: Number of results (at most matches)
+            allowed: Boolean mask indexed by id
+            mask: Boolean mask indexed by row position
+            matches: Number of allowed rows
+        """
+        count = len(self)
+        fetch = min(count, int(math.ceil(k * count / matches * _FILTER_OVERFETCH)))
+        while True:
+            ids, scores = self.search(query, fetch)
+            keep = _allowed_ids(allowed, ids)
+            if int(keep.sum()) >= k or fetch >= count:
+                return ids[keep][:k], scores[keep][:k]
+            fetch = min(count, fetch * 2)
+
+    def _set_ids(self, count: int, ids: Optional[Sequence[int]]):
+        if ids is None:
+            self.ids = np.arange(count, dtype=np.int64)
+        else:
+            self.ids = np.asarray(ids, dtype=np.int64)
+        if self.ids.shape[0] != count:
+            raise ValueError(f"Got {self.ids.shape[0]} ids for {count} vectors")
+
+    @abstractmethod
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        """Write engine files to temporary paths; return (tmp, final) pairs."""
+
+    @abstractmethod
+    def _load_payload(self, payload: IndexPayload):
+        """Load engine files written by _save_payload."""
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force cosine search with one matrix-vector product."""
+
+    engine = "exact"
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, ids: Optional[Sequence[int]] = None) -> "ExactIndex":
+        """
+        Wrap an already row-normalized float32 matrix without copying it.
+
+        Args:
+            matrix: Row-normalized matrix (a memory map is kept as is)
+            ids: External id of each row (defaults to row positions)
+        """
+        index = cls(int(matrix.shape[1]) if matrix.ndim == 2 else 0)
+        index.matrix = matrix
+        index._set_ids(int(matrix.shape[0]), ids)
+        return index
+
+    def build(self, matrix: np.ndarray, ids: Optional[Sequence[int]] = None):
+        self.matrix = build_normalized_matrix(matrix)
+        self._set_ids(int(self.matrix.shape[0]), ids)
+
+    def search(self, query: Sequence[float], k: int) -> SearchResult:
+        if k <= 0 or len(self) == 0:
+            return _empty_result()
+        rows, scores = top_k_cosine(self.matrix, query, k)
+        return self.ids[rows], scores
+
+    def search_many(self, queries: Sequence[Sequence[float]], k: int) -> List[SearchResult]:
+        if k <= 0 or len(self) == 0:
+            return [_empty_result() for _ in queries]
+        return [
+            (self.ids[rows], scores)
+            for rows, scores in top_k_cosine_many(self.matrix, queries, k)
+        ]
+
+    def _search_filtered(self, query, k, allowed, mask, matches) -> SearchResult:
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+        rows, scores = _masked_top_k(self.matrix, query, k, mask, matches)
+        return self.ids[rows], scores
+
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        final = _path(stem, ".vectors.npy")
+        tmp = _tmp(final)
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        return [(tmp, final)]
+
+    def _load_payload(self, payload: IndexPayload):
+        self.matrix = payload.array(".vectors.npy")
+
+
+class AnnoyVectorIndex(VectorIndex):
+    """Annoy forest over angular distance."""
+
+    engine = "annoy"
+
+    def __init__(self, dim: int, n_trees: int = 10, search_k: int = -1):
+        super().__init__(dim)
+        self.n_trees = n_trees
+        self.search_k = search_k
+        self._index = None
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {"n_trees": self.n_trees, "search_k": self.search_k}
+
+    def _new_index(self):
+        from annoy import AnnoyIndex
+        return AnnoyIndex(self.dim, "angular")
+
+    def build(self, matrix: np.ndarray, ids: Optional[Sequence[int]] = None):
+        self._set_ids(int(matrix.shape[0]), ids)
+        index = self._new_index()
+        for position in range(matrix.shape[0]):
+            index.add_item(position, matrix[position])
+        index.build(self.n_trees)
+        self._index = index
+
+    def search(self, query: Sequence[float], k: int) -> SearchResult:
+        if k <= 0 or self._index is None or len(self) == 0:
+            return _empty_result()
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+
+        positions, distances = self._index.get_nns_by_vector(
+            query, k, search_k=self.search_k, include_distances=True
+        )
+        positions = np.asarray(positions, dtype=np.int64)
+        distances = np.asarray(distances, dtype=np.float32)
+        # Angular distance d = sqrt(2 - 2cos)
+        return self.ids[positions], 1.0 - distances * distances / 2.0
+
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        final = _path(stem, ".ann")
+        tmp = _tmp(final)
+        self._index.save(str(tmp))
+        return [(tmp, final)]
+
+    def _load_payload(self, payload: IndexPayload):
+        index = self._new_index()
+        index.load(str(payload.path(".ann")))
+        self._index = index
+
+
+class HNSWIndex(VectorIndex):
+    """
+    Hierarchical navigable small world graph (Malkov & Yashunin).
+
+    Each vector is inserted at a random level; upper levels hold few nodes
+    with long-range links and are descended greedily, and the bottom level
+    is searched with a beam of width ``ef``. Neighbor lists are capped at
+    ``m`` (``2m`` on the bottom level), keeping the most similar links.
+    """
+
+    engine = "hnsw"
+
+    def __init__(
+        self,
+        dim: int,
+        m: int = 16,
+        ef_construction: int = 100,
+        ef_search: int = 64,
+        seed: int = 42
+    ):
+        super().__init__(dim)
+        self.m = max(2, m)
+        self.ef_construction = max(ef_construction, self.m)
+        self.ef_search = ef_search
+        self.seed = seed
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.levels = np.zeros(0, dtype=np.int32)
+        # graph[level][node] -> neighbor nodes
+        self.graph: List[Dict[int, List[int]]] = []
+        self.entry_point = -1
+        self.max_level = -1
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "seed": self.seed,
+        }
+
+    def build(self, matrix: np.ndarray, ids: Optional[Sequence[int]] = None):
+        self.vectors = build_normalized_matrix(matrix)
+        count = int(self.vectors.shape[0])
+        self._set_ids(count, ids)
+
+        rng = np.random.default_rng(self.seed)
+        level_mult = 1.0 / math.log(self.m)
+        uniform = 1.0 - rng.random(count)
+        self.levels = np.floor(-np.log(uniform) * level_mult).astype(np.int32)
+        self.graph = [dict() for _ in range(int(self.levels.max()) + 1 if count else 0)]
+        self.entry_point = -1
+        self.max_level = -1
+
+        for node in range(count):
+            self._insert(node)
+
+    def _insert(self, node: int):
+        query = self.vectors[node]
+        level = int(self.levels[node])
+        for lvl in range(level + 1):
+            self.graph[lvl][node] = []
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry = self.entry_point
+        for lvl in range(self.max_level, level, -1):
+            entry = self._greedy_search(query, entry, lvl)
+
+        entries = [entry]
+        for lvl in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(query, entries, self.ef_construction, lvl)
+            neighbors = [n for _, n in candidates[:self.m]]
+            self.graph[lvl][node] = neighbors
+
+            max_links = 2 * self.m if lvl == 0 else self.m
+            for neighbor in neighbors:
+                links = self.graph[lvl][neighbor]
+                links.append(node)
+                if len(links) > max_links:
+                    sims = self.vectors[links] @ self.vectors[neighbor]
+                    keep = np.argsort(-sims, kind="stable")[:max_links]
+                    self.graph[lvl][neighbor] = [links[i] for i in keep]
+            entries = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def _greedy_search(self, query: np.ndarray, entry: int, level: int) -> int:
+        """Walk to the most similar node on a level, one best neighbor at a time."""
+        best = entry
+        best_sim = float(self.vectors[entry] @ query)
+        improved = True
+        while improved:
+            improved = False
+            neighbors = self.graph[level].get(best, [])
+            if not neighbors:
+                break
+            sims = self.vectors[neighbors] @ query
+            top = int(np.argmax(sims))
+            if sims[top] > best_sim:
+                best, best_sim = neighbors[top], float(sims[top])
+                improved = True
+        return best
+
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entries: List[int],
+        ef: int,
+        level: int,
+        allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        Beam search on one level; returns (similarity, node) best first.
+
+        With an allowed mask (by node), every node is traversed but only
+        allowed ones enter the results, so the beam keeps widening until
+        ef allowed nodes have been found.
+        """
+        visited = set(entries)
+        sims = self.vectors[entries] @ query
+        candidates = [(-float(s), n) for s, n in zip(sims, entries)]
+        heapq.heapify(candidates)
+        results = [
+            (float(s), n) for s, n in zip(sims, entries)
+            if allowed is None or allowed[n]
+        ]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        layer = self.graph[level]
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+            neighbors = [n for n in layer.get(node, ()) if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for sim, neighbor in zip(self.vectors[neighbors] @ query, neighbors):
+                sim = float(sim)
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    if allowed is not None and not allowed[neighbor]:
+                        continue
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted(results, reverse=True)
+
+    def search(self, query: Sequence[float], k: int) -> SearchResult:
+        return self._search_graph(query, k)
+
+    def _search_filtered(self, query, k, allowed, mask, matches) -> SearchResult:
+        if matches > len(self) * _FILTER_SCAN_FRACTION:
+            return self._search_graph(query, k, mask)
+        # Too few matches for the graph to reach them; score them directly
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+        rows, scores = _masked_top_k(self.vectors, query, k, mask, matches)
+        return self.ids[rows], scores
+
+    def _search_graph(self, query: Sequence[float], k: int, mask: Optional[np.ndarray] = None) -> SearchResult:
+        if k <= 0 or self.entry_point < 0:
+            return _empty_result()
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+
+        entry = self.entry_point
+        for lvl in range(self.max_level, 0, -1):
+            entry = self._greedy_search(query, entry, lvl)
+        found = self._search_layer(query, [entry], max(self.ef_search, k), 0, mask)[:k]
+
+        nodes = np.asarray([n for _, n in found], dtype=np.int64)
+        scores = np.asarray([s for s, _ in found], dtype=np.float32)
+        return self.ids[nodes], scores
+
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        vectors_path = _path(stem, ".vectors.npy")
+        graph_path = _path(stem, ".graph.npz")
+        tmp_vectors, tmp_graph = _tmp(vectors_path), _tmp(graph_path)
+
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+
+        # Each level as CSR: sorted nodes, offsets into a flat neighbor array
+        arrays = {
+            "levels": self.levels,
+            "entry": np.asarray([self.entry_point, self.max_level], dtype=np.int64),
+        }
+        for lvl, layer in enumerate(self.graph):
+            nodes = np.asarray(sorted(layer), dtype=np.int64)
+            lengths = [len(layer[n]) for n in nodes]
+            arrays[f"nodes_{lvl}"] = nodes
+            arrays[f"offsets_{lvl}"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            arrays[f"links_{lvl}"] = np.asarray(
+                [link for n in nodes for link in layer[n]], dtype=np.int64
+            )
+        with open(tmp_graph, "wb") as f:
+            np.savez(f, **arrays)
+
+        return [(tmp_vectors, vectors_path), (tmp_graph, graph_path)]
+
+    def _load_payload(self, payload: IndexPayload):
+        self.vectors = payload.array(".vectors.npy")
+        data = payload.arrays(".graph.npz")
+        self.levels = data["levels"]
+        self.entry_point, self.max_level = (int(v) for v in data["entry"])
+        self.graph = []
+        lvl = 0
+        while f"nodes_{lvl}" in data:
+            nodes = data[f"nodes_{lvl}"].tolist()
+            offsets = data[f"offsets_{lvl}"].tolist()
+            links = data[f"links_{lvl}"].tolist()
+            self.graph.append({
+                node: links[offsets[i]:offsets[i + 1]] for i, node in enumerate(nodes)
+            })
+            lvl += 1
+
+
+# Rows processed at a time when encoding or scanning, bounding temporary memory
+_CHUNK_ROWS = 16384
+
+
+def _row_chunks(count: int):
+    for start in range(0, count, _CHUNK_ROWS):
+        yield start, min(start + _CHUNK_ROWS, count)
+
+
+def _as_normalized(matrix: np.ndarray) -> np.ndarray:
+    """Return the matrix as is if its rows are already unit length (e.g. a store), else a normalized copy."""
+    if not isinstance(matrix, np.ndarray) or matrix.ndim != 2 or matrix.dtype not in (np.float32, np.float16):
+        return build_normalized_matrix(matrix)
+    for start, end in _row_chunks(matrix.shape[0]):
+        norms = np.linalg.norm(matrix[start:end].astype(np.float32), axis=1)
+        if np.any(np.abs(norms[norms > 0] - 1.0) > 1e-2):
+            return build_normalized_matrix(matrix)
+    return matrix
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Compressed codes scanned per query, with an exact rerank of a shortlist.
+
+    Approximate scores are computed from the codes for every vector; the
+    best ``k * rerank`` are rescored against the full-precision vectors,
+    which are typically a memory map, so only the shortlisted rows are read.
+    With ``vectors_file`` set, the full-precision vectors are an existing
+    file (such as an embedding store) next to the index instead of a copy.
+    """
+
+    def __init__(self, dim: int, rerank: int = 16, vectors_file: Optional[str] = None):
+        super().__init__(dim)
+        self.rerank = max(1, rerank)
+        self.vectors_file = vectors_file
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {"rerank": self.rerank, "vectors_file": self.vectors_file}
+
+    @property
+    @abstractmethod
+    def code_bytes(self) -> int:
+        """Bytes held by the codes and quantizer (what a query scans)."""
+
+    def build(self, matrix: np.ndarray, ids: Optional[Sequence[int]] = None):
+        self.vectors = _as_normalized(matrix)
+        self._set_ids(int(self.vectors.shape[0]), ids)
+        self._train()
+        self._encode_all()
+
+    @abstractmethod
+    def _train(self):
+        """Fit the quantizer to self.vectors."""
+
+    @abstractmethod
+    def _encode_all(self):
+        """Encode every row of self.vectors."""
+
+    @abstractmethod
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate cosine similarity of the normalized query to every vector."""
+
+    def search(self, query: Sequence[float], k: int) -> SearchResult:
+        count = len(self)
+        if k <= 0 or count == 0:
+            return _empty_result()
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+
+        return self._rerank(query, k, self._approximate_scores(query), count)
+
+    def _search_filtered(self, query, k, allowed, mask, matches) -> SearchResult:
+        query = _normalize_query(query, self.dim)
+        if query is None:
+            return _empty_result()
+        approx = self._approximate_scores(query)
+        approx[~mask] = -np.inf
+        return self._rerank(query, k, approx, matches)
+
+    def _rerank(self, query: np.ndarray, k: int, approx: np.ndarray, matches: int) -> SearchResult:
+        """Rescore the best k * rerank approximate scores exactly; matches counts the finite ones."""
+        shortlist = min(matches, k * self.rerank)
+        if shortlist < approx.shape[0]:
+            candidates = np.argpartition(-approx, shortlist - 1)[:shortlist]
+        else:
+            candidates = np.arange(approx.shape[0])
+        # Sorted positions read the memory-mapped vectors sequentially
+        candidates.sort()
+
+        exact = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        order = np.argsort(-exact, kind="stable")[:k]
+        return self.ids[candidates[order]], exact[order]
+
+    def _save_vectors(self, stem: Path) -> List[Tuple[Path, Path]]:
+        if self.vectors_file:
+            return []
+        final = _path(stem, ".vectors.npy")
+        tmp = _tmp(final)
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        return [(tmp, final)]
+
+    def _load_vectors(self, payload: IndexPayload):
+        if self.vectors_file:
+            self.vectors = np.load(payload.sibling(self.vectors_file), mmap_mode="r")
+        else:
+            self.vectors = payload.array(".vectors.npy")
+
+
+class Int8Index(QuantizedIndex):
+    """
+    Scalar quantization to int8 (4x smaller than float32).
+
+    Each dimension is scaled by its largest absolute value over the indexed
+    vectors, so the full int8 range is used per dimension.
+    """
+
+    engine = "int8"
+
+    def __init__(self, dim: int, rerank: int = 16, vectors_file: Optional[str] = None):
+        super().__init__(dim, rerank, vectors_file)
+        self.scale = np.ones(dim, dtype=np.float32)
+        self.codes = np.zeros((0, dim), dtype=np.int8)
+
+    @property
+    def code_bytes(self) -> int:
+        return int(self.codes.nbytes + self.scale.nbytes)
+
+    def _train(self):
+        max_abs = np.zeros(self.dim, dtype=np.float32)
+        for start, end in _row_chunks(self.vectors.shape[0]):
+            chunk = np.abs(np.asarray(self.vectors[start:end], dtype=np.float32))
+            np.maximum(max_abs, chunk.max(axis=0), out=max_abs)
+        self.scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+
+    def _encode_all(self):
+        codes = np.empty((self.vectors.shape[0], self.dim), dtype=np.int8)
+        for start, end in _row_chunks(codes.shape[0]):
+            chunk = np.asarray(self.vectors[start:end], dtype=np.float32) / self.scale
+            codes[start:end] = np.clip(np.rint(chunk), -127, 127)
+        self.codes = codes
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        scaled = (query * self.scale).astype(np.float32)
+        scores = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start, end in _row_chunks(scores.shape[0]):
+            scores[start:end] = self.codes[start:end].astype(np.float32) @ scaled
+        return scores
+
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        codes_path, quantizer_path = _path(stem, ".codes.npy"), _path(stem, ".quantizer.npz")
+        tmp_codes, tmp_quantizer = _tmp(codes_path), _tmp(quantizer_path)
+        with open(tmp_codes, "wb") as f:
+            np.save(f, self.codes)
+        with open(tmp_quantizer, "wb") as f:
+            np.savez(f, scale=self.scale)
+        return [(tmp_codes, codes_path), (tmp_quantizer, quantizer_path)] + self._save_vectors(stem)
+
+    def _load_payload(self, payload: IndexPayload):
+        self.codes = payload.array(".codes.npy")
+        self.scale = payload.arrays(".quantizer.npz")["scale"]
+        self._load_vectors(payload)
+
+
+class PQIndex(QuantizedIndex):
+    """
+    Product quantization (Jegou et al.).
+
+    Vectors are split into ``m`` sub-vectors, each replaced by the nearest
+    of 256 k-means centroids learned for its subspace, so a vector costs
+    ``m`` bytes (``dim * 4 / m`` times smaller; 32x with the default
+    ``m = dim / 8``). Queries score all codes with one lookup table per
+    subspace (asymmetric distance computation).
+    """
+
+    engine = "pq"
+
+    def __init__(
+        self,
+        dim: int,
+        m: int = 0,
+        rerank: int = 16,
+        vectors_file: Optional[str] = None,
+        iterations: int = 10,
+        train_size: int = 8192,
+        seed: int = 42
+    ):
+        super().__init__(dim, rerank, vectors_file)
+        m = m or max(1, dim // 8)
+        # Sub-vectors must tile the dimension
+        self.m = next(d for d in range(min(m, dim), 0, -1) if dim % d == 0)
+        self.dsub = dim // self.m
+        self.ksub = 256
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.codebooks = np.zeros((self.m, self.ksub, self.dsub), dtype=np.float32)
+        # Subspace-major (m, count), so each table lookup reads contiguous codes
+        self.codes = np.zeros((self.m, 0), dtype=np.uint8)
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {
+            **super().params,
+            "m": self.m,
+            "iterations": self.iterations,
+            "train_size": self.train_size,
+            "seed": self.seed,
+        }
+
+    @property
+    def code_bytes(self) -> int:
+        return int(self.codes.nbytes + self.codebooks.nbytes)
+
+    @staticmethod
+    def _kmeans(points: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+        centroids = points[rng.choice(points.shape[0], k, replace=False)].copy()
+        for _ in range(iterations):
+            distances = (centroids * centroids).sum(axis=1) - 2.0 * points @ centroids.T
+            labels = np.argmin(distances, axis=1)
+            counts = np.bincount(labels, minlength=k)
+            for d in range(points.shape[1]):
+                centroids[:, d] = np.bincount(labels, weights=points[:, d], minlength=k)
+            empty = counts == 0
+            centroids[~empty] /= counts[~empty, None]
+            # Restart empty clusters from random points
+            if empty.any():
+                centroids[empty] = points[rng.choice(points.shape[0], int(empty.sum()))]
+        return centroids
+
+    def _train(self):
+        count = self.vectors.shape[0]
+        rng = np.random.default_rng(self.seed)
+        sample_rows = np.sort(rng.choice(count, min(count, self.train_size), replace=False))
+        sample = np.asarray(self.vectors[sample_rows], dtype=np.float32)
+
+        ksub = min(self.ksub, sample.shape[0])
+        codebooks = np.zeros((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            sub = np.ascontiguousarray(sample[:, j * self.dsub:(j + 1) * self.dsub])
+            codebooks[j, :ksub] = self._kmeans(sub, ksub, self.iterations, rng)
+            # Unused centroids (tiny KBs) repeat the first one and are never chosen
+            codebooks[j, ksub:] = codebooks[j, 0]
+        self.codebooks = codebooks
+
+    def _encode_all(self):
+        count = self.vectors.shape[0]
+        codes = np.empty((self.m, count), dtype=np.uint8)
+        sq_norms = (self.codebooks * self.codebooks).sum(axis=2)
+        for start, end in _row_chunks(count):
+            chunk = np.asarray(self.vectors[start:end], dtype=np.float32)
+            for j in range(self.m):
+                sub = chunk[:, j * self.dsub:(j + 1) * self.dsub]
+                distances = sq_norms[j] - 2.0 * sub @ self.codebooks[j].T
+                codes[j, start:end] = np.argmin(distances, axis=1)
+        self.codes = codes
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        # tables[j, c] = <query sub-vector j, centroid c of subspace j>
+        tables = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(self.m, self.dsub))
+        scores = np.zeros(self.codes.shape[1], dtype=np.float32)
+        for j in range(self.m):
+            scores += tables[j].take(self.codes[j])
+        return scores
+
+    def _save_payload(self, stem: Path) -> List[Tuple[Path, Path]]:
+        codes_path, quantizer_path = _path(stem, ".codes.npy"), _path(stem, ".quantizer.npz")
+        tmp_codes, tmp_quantizer = _tmp(codes_path), _tmp(quantizer_path)
+        with open(tmp_codes, "wb") as f:
+            np.save(f, self.codes)
+        with open(tmp_quantizer, "wb") as f:
+            np.savez(f, codebooks=self.codebooks)
+        return [(tmp_codes, codes_path), (tmp_quantizer, quantizer_path)] + self._save_vectors(stem)
+
+    def _load_payload(self, payload: IndexPayload):
+        self.codes = payload.array(".codes.npy")
+        self.codebooks = payload.arrays(".quantizer.npz")["codebooks"]
+        self._load_vectors(payload)
+
+
+VECTOR_INDEX_ENGINES: Dict[str, Type[VectorIndex]] = {
+    ExactIndex.engine: ExactIndex,
+    AnnoyVectorIndex.engine: AnnoyVectorIndex,
+    HNSWIndex.engine: HNSWIndex,
+    Int8Index.engine: Int8Index,
+    PQIndex.engine: PQIndex,
+}
+
+
+def _config_params(engine: str) -> Dict[str, Any]:
+    """Engine parameters from KnowledgeBaseConfig."""
+    kb_config = config.knowledge_base
+    if engine == "annoy":
+        return {"n_trees": kb_config.annoy_n_trees, "search_k": kb_config.annoy_search_k}
+    if engine == "hnsw":
+        return {
+            "m": kb_config.hnsw_m,
+            "ef_construction": kb_config.hnsw_ef_construction,
+            "ef_search": kb_config.hnsw_ef_search,
+        }
+    if engine == "int8":
+        return {"rerank": kb_config.quantization_rerank}
+    if engine == "pq":
+        return {"m": kb_config.pq_subvectors, "rerank": kb_config.quantization_rerank}
+    return {}
+
+
+def _query_config_params(engine: str) -> Dict[str, Any]:
+    """Query-time parameters from KnowledgeBaseConfig, applied when loading."""
+    kb_config = config.knowledge_base
+    if engine == "annoy":
+        return {"search_k": kb_config.annoy_search_k}
+    if engine == "hnsw":
+        return {"ef_search": kb_config.hnsw_ef_search}
+    if engine in ("int8", "pq"):
+        return {"rerank": kb_config.quantization_rerank}
+    return {}
+
+
+def create_vector_index(dim: int, engine: Optional[str] = None, **params) -> VectorIndex:
+    """
+    Create an empty index for the configured (or given) engine.
+
+    Args:
+        dim: Vector dimension
+        engine: Engine name (defaults to KnowledgeBaseConfig.vector_index_engine)
+        **params: Engine parameters overriding the configured ones
+
+    Returns:
+        Unbuilt VectorIndex
+
+    Raises:
+        ValueError: If the engine is unknown
+    """
+    engine = (engine or config.knowledge_base.vector_index_engine).lower()
+    if engine not in VECTOR_INDEX_ENGINES:
+        raise ValueError(
+            f"Unknown vector index engine: {engine} (expected one of {sorted(VECTOR_INDEX_ENGINES)})"
+        )
+    merged = {**_config_params(engine), **params}
+    return VECTOR_INDEX_ENGINES[engine](dim, **merged)
+
+
+def save_vector_index(
+    index: VectorIndex,
+    stem: Union[str, Path],
+    metadata: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Atomically write an index and its manifest.
+
+    Payload files are written under a new versioned prefix; replacing the
+    manifest then publishes them, and the superseded payload is removed.
+
+    Args:
+        index: Built index
+        stem: Path without extension
+        metadata: Caller data stored in the manifest (content hash, model, ...)
+
+    Returns:
+        The manifest that was written
+    """
+    stem = Path(stem)
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path = _path(stem, ".index.json")
+    previous = read_vector_index_manifest(stem) if manifest_path.exists() else None
+    payload_stem = _path(stem, f".{uuid.uuid4().hex[:12]}")
+
+    manifest = {
+        "format_version": VECTOR_INDEX_FORMAT_VERSION,
+        "engine": index.engine,
+        "dim": index.dim,
+        "count": len(index),
+        "metric": "cosine",
+        "params": index.params,
+        "metadata": dict(metadata or {}),
+        "created_at": time.time(),
+        "payload": payload_stem.name,
+    }
+
+    ids_path = _path(payload_stem, ".ids.npy")
+    pending: List[Tuple[Path, Path]] = []
+    published = False
+    try:
+        pending.extend(index._save_payload(payload_stem))
+        tmp_ids = _tmp(ids_path)
+        pending.append((tmp_ids, ids_path))
+        with open(tmp_ids, "wb") as f:
+            np.save(f, index.ids)
+        tmp_manifest = _tmp(manifest_path)
+        pending.append((tmp_manifest, manifest_path))
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        # The manifest names the payload prefix, so its rename is the publish
+        for tmp, final in pending:
+            os.replace(tmp, final)
+        published = True
+    finally:
+        for tmp, _ in pending:
+            if tmp.exists():
+                tmp.unlink()
+        if not published:
+            _remove_payload(payload_stem)
+
+    previous_stem = _payload_stem(stem, previous)
+    if previous_stem != payload_stem:
+        _remove_payload(previous_stem)
+    return manifest
+
+
+def read_vector_index_manifest(stem: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """
+    Read an index manifest without loading the index.
+
+    Args:
+        stem: Path without extension
+
+    Returns:
+        Manifest dictionary, or None if missing, unreadable or unsupported
+    """
+    manifest_path = _path(Path(stem), ".index.json")
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.error(f"Failed to read vector index manifest {manifest_path}: {e}")
+        return None
+
+    if manifest.get("format_version") != VECTOR_INDEX_FORMAT_VERSION:
+        logger.warning(f"Vector index format {manifest.get('format_version')} is not supported")
+        return None
+    return manifest
+
+
+def load_vector_index(
+    stem: Union[str, Path],
+    **param_overrides
+) -> Optional[Tuple[VectorIndex, Dict[str, Any]]]:
+    """
+    Load an index saved with save_vector_index.
+
+    Args:
+        stem: Path without extension
+        **param_overrides: Query-time parameters to change (e.g. search_k,
+            ef_search); by default the configured values are used
+
+    Returns:
+        Tuple of (index, manifest), or None if missing or corrupt
+    """
+    stem = Path(stem)
+    manifest = read_vector_index_manifest(stem)
+    if manifest is None:
+        return None
+
+    index = load_index_payload(manifest, IndexPayload(_payload_stem(stem, manifest)), **param_overrides)
+    if index is None:
+        # A concurrent save may have replaced the index between the two reads
+        latest = read_vector_index_manifest(stem)
+        if latest is None or latest.get("payload") == manifest.get("payload"):
+            return None
+        manifest = latest
+        index = load_index_payload(manifest, IndexPayload(_payload_stem(stem, manifest)), **param_overrides)
+        if index is None:
+            return None
+    return index, manifest
+
+
+def load_index_payload(
+    manifest: Dict[str, Any],
+    payload: IndexPayload,
+    **param_overrides
+) -> Optional[VectorIndex]:
+    """
+    Load an index from its manifest and payload files.
+
+    Args:
+        manifest: Manifest written by save_vector_index
+        payload: Reader of the payload files
+        **param_overrides: Query-time parameters to change (see load_vector_index)
+
+    Returns:
+        The index, or None if its engine is unknown or its payload is corrupt
+    """
+    engine_cls = VECTOR_INDEX_ENGINES.get(manifest.get("engine"))
+    if engine_cls is None:
+        logger.warning(f"Unknown vector index engine in manifest: {manifest.get('engine')}")
+        return None
+
+    try:
+        params = {
+            **manifest.get("params", {}),
+            **_query_config_params(manifest["engine"]),
+            **param_overrides,
+        }
+        index = engine_cls(manifest["dim"], **params)
+        index._load_payload(payload)
+        index.ids = payload.array(".ids.npy")
+    except Exception as e:
+        logger.error(f"Failed to load vector index {payload.stem}: {e}")
+        return None
+
+    if len(index) != manifest["count"]:
+        logger.warning(f"Vector index {payload.stem} does not match its manifest")
+        return None
+    return index
+
+
+def delete_vector_index(stem: Union[str, Path]):
+    """Remove every file of an index if present."""
+    stem = Path(stem)
+    manifest = read_vector_index_manifest(stem)
+    # Unpublish first so readers never see a manifest without its payload
+    manifest_path = _path(stem, ".index.json")
+    if manifest_path.exists():
+        manifest_path.unlink()
+    for payload_stem in {_payload_stem(stem, manifest), stem}:
+        _remove_payload(payload_stem)
+
+
+QUANTIZATION_METHODS = ("none", Int8Index.engine, PQIndex.engine)
+
+
+def quantized_index_stem(store: Union[str, Path], method: str) -> Path:
+    """Stem of the quantized index kept next to an embedding store."""
+    store = Path(store)
+    return store.with_name(f"{store.name}.{method}")
+
+
+def open_store_index(
+    matrix: np.ndarray,
+    ids: Optional[Sequence[int]],
+    store: Union[str, Path],
+    method: Optional[str] = None
+) -> VectorIndex:
+    """
+    Index an embedding store's matrix with the configured quantization.
+
+    Without quantization the matrix is wrapped in an ExactIndex. Otherwise,
+    if the matrix is the store's own memory map, the codes are loaded from
+    (or built and saved to) ``<store>.<method>.*``, referencing the store's
+    matrix file for the rerank, and rebuilt whenever the store is rewritten.
+    An in-memory matrix (e.g. freshly generated embeddings) gets an
+    unsaved quantized index.
+
+    Args:
+        matrix: Row-normalized matrix of the store
+        ids: External id of each row (defaults to row positions)
+        store: Vector store stem
+        method: "none", "int8" or "pq" (defaults to
+            KnowledgeBaseConfig.embedding_quantization)
+
+    Returns:
+        Index over the matrix
+    """
+    method = (method or config.knowledge_base.embedding_quantization).lower()
+    if method not in QUANTIZATION_METHODS:
+        logger.warning(f"Unknown embedding quantization {method}, using exact search")
+        method = "none"
+    if method == "none":
+        return ExactIndex.from_matrix(matrix, ids)
+
+    matrix_file = store_matrix_path(store)
+    mapped = getattr(matrix, "filename", None)
+    if not mapped or Path(mapped).resolve() != matrix_file.resolve():
+        index = create_vector_index(int(matrix.shape[1]), method)
+        index.build(matrix, ids)
+        return index
+
+    stem = quantized_index_stem(store, method)
+    store_manifest = read_manifest(store)
+    source = {
+        "store_content_hash": store_manifest.content_hash if store_manifest else None,
+        "store_created_at": store_manifest.created_at if store_manifest else None,
+    }
+    wanted = create_vector_index(int(matrix.shape[1]), method, vectors_file=matrix_file.name)
+
+    manifest = read_vector_index_manifest(stem)
+    if (manifest is not None
+            and manifest.get("engine") == method
+            and manifest.get("count") == matrix.shape[0]
+            and manifest.get("metadata") == source
+            and manifest.get("params", {}).get("m") == wanted.params.get("m")):
+        loaded = load_vector_index(stem)
+        if loaded is not None:
+            return loaded[0]
+
+    start = time.perf_counter()
+    wanted.build(matrix, ids)
+    logger.info(
+        f"Built {method} index over {len(wanted)} vectors of {store} in "
+        f"{time.perf_counter() - start:.2f}s ({wanted.code_bytes} bytes of codes)"
+    )
+    try:
+        save_vector_index(wanted, stem, metadata=source)
+    except Exception as e:
+        logger.error(f"Failed to save {method} index for {store}: {e}")
+    return wanted
@@ -0,0 +1,323 @@
+"""
+Versioned, memory-mappable on-disk storage for embedding matrices.
+
+A vector store is a pair of files sharing a stem:
+
+- ``<stem>.<version>.npy``: row-normalized float32 (or float16) matrix in
+  NumPy format, opened with ``np.load(mmap_mode="r")`` so startup does no
+  unpickling and several worker processes share the same pages.
+- ``<stem>.manifest.json``: format version, model name, dimension, record
+  count, on-disk dtype, the key of each row, a content hash of the
+  texts that were embedded, optionally a hash per row so stores can be
+  refreshed incrementally, and the name of the matrix file.
+
+Every save writes a new matrix file and then replaces the manifest, so a
+reader sees either the old or the new store, never the new manifest with
+the old matrix. Manifests without a matrix file name refer to the
+unversioned ``<stem>.npy`` of earlier releases.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple, Union
+import logging
+
+import numpy as np
+
+from ...shared_libraries.config import model_slug
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+@dataclass
+class VectorStoreManifest:
+    """Metadata describing a saved embedding matrix."""
+    model_name: str
+    dim: int
+    count: int
+    keys: List[Any]
+    content_hash: str
+    dtype: str = "float32"
+    record_hashes: List[str] = field(default_factory=list)
+    format_version: int = VECTOR_STORE_FORMAT_VERSION
+    created_at: float = field(default_factory=time.time)
+    matrix_file: str = ""
+
+
+class ContentHasher:
+    """Incremental form of compute_content_hash, for texts produced one at a time."""
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def update(self, text: str):
+        """Add the next text."""
+        encoded = text.encode("utf-8")
+        self._digest.update(len(encoded).to_bytes(8, "little"))
+        self._digest.update(encoded)
+
+    def hexdigest(self) -> str:
+        """Hex SHA-256 digest of the texts added so far."""
+        return self._digest.hexdigest()
+
+
+def compute_content_hash(texts: Iterable[str]) -> str:
+    """
+    Compute a stable hash over the texts that were embedded, in row order.
+
+    Args:
+        texts: Source texts, one per row
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    hasher = ContentHasher()
+    for text in texts:
+        hasher.update(text)
+    return hasher.hexdigest()
+
+
+def store_stem(directory: Union[str, Path], name: str, model_name: str) -> Path:
+    """
+    Build the stem of a model-specific vector store.
+    
+    Each embedding model gets its own files, so switching providers never
+    overwrites vectors that were expensive to generate.
+    
+    Args:
+        directory: Directory holding the vector stores
+        name: Store name, e.g. "kb_embeddings"
+        model_name: Embedding model name, e.g. "models/text-embedding-004"
+        
+    Returns:
+        Path such as ``<directory>/kb_embeddings.text-embedding-004``
+    """
+    return Path(directory) / f"{name}.{model_slug(model_name)}"
+
+
+def _matrix_path(stem: Path, manifest: Optional[VectorStoreManifest] = None) -> Path:
+    if manifest is not None and manifest.matrix_file:
+        return stem.with_name(manifest.matrix_file)
+    return stem.with_name(stem.name + ".npy")
+
+
+def store_matrix_path(stem: Union[str, Path]) -> Path:
+    """Path of the matrix file a vector store's manifest currently points to."""
+    stem = Path(stem)
+    return _matrix_path(stem, read_manifest(stem))
+
+
+def _manifest_path(stem: Path) -> Path:
+    return stem.with_name(stem.name + ".manifest.json")
+
+
+def vector_store_exists(stem: Union[str, Path]) -> bool:
+    """Check whether both files of a vector store exist."""
+    stem = Path(stem)
+    return _manifest_path(stem).exists() and store_matrix_path(stem).exists()
+
+
+def save_vector_store(
+    stem: Union[str, Path],
+    matrix: np.ndarray,
+    keys: List[Any],
+    model_name: str,
+    content_hash: str,
+    dtype: str = "float32",
+    record_hashes: Optional[List[str]] = None
+) -> VectorStoreManifest:
+    """
+    Atomically write an embedding matrix and its manifest.
+
+    The matrix goes to a new versioned file; replacing the manifest then
+    publishes it, and the superseded matrix file is removed.
+
+    Args:
+        stem: Path without extension, e.g. ``data/embeddings/kb_embeddings.text-embedding-004``
+        matrix: Row-normalized matrix of shape (len(keys), dim)
+        keys: Key of each row (example index, rule number, ...)
+        model_name: Embedding model that produced the vectors
+        content_hash: Hash of the embedded texts (see compute_content_hash)
+        dtype: On-disk dtype, "float32" or "float16"
+        record_hashes: Optional hash of each row's source text
+
+    Returns:
+        The manifest that was written
+
+    Raises:
+        ValueError: If the dtype is unsupported or keys don't match the matrix
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported vector store dtype: {dtype}")
+    if matrix.ndim != 2 or matrix.shape[0] != len(keys):
+        raise ValueError(
+            f"Matrix shape {matrix.shape} does not match {len(keys)} keys"
+        )
+    if record_hashes is not None and len(record_hashes) != len(keys):
+        raise ValueError(
+            f"Got {len(record_hashes)} record hashes for {len(keys)} keys"
+        )
+
+    stem = Path(stem)
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path = _manifest_path(stem)
+    previous = read_manifest(stem) if manifest_path.exists() else None
+
+    manifest = VectorStoreManifest(
+        model_name=model_name,
+        dim=int(matrix.shape[1]),
+        count=int(matrix.shape[0]),
+        keys=list(keys),
+        content_hash=content_hash,
+        dtype=dtype,
+        record_hashes=list(record_hashes or []),
+        matrix_file=f"{stem.name}.{uuid.uuid4().hex[:12]}.npy",
+    )
+    matrix_path = _matrix_path(stem, manifest)
+
+    tmp_matrix = matrix_path.with_name(matrix_path.name + f".{os.getpid()}.tmp")
+    tmp_manifest = manifest_path.with_name(manifest_path.name + f".{os.getpid()}.tmp")
+    published = False
+    try:
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=dtype))
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f)
+        os.replace(tmp_matrix, matrix_path)
+        # The manifest names its matrix file, so this swap is the publish
+        os.replace(tmp_manifest, manifest_path)
+        published = True
+    finally:
+        for tmp in (tmp_matrix, tmp_manifest):
+            if tmp.exists():
+                tmp.unlink()
+        if not published and matrix_path.exists():
+            matrix_path.unlink()
+
+    _remove_matrix(_matrix_path(stem, previous), keep=matrix_path)
+    return manifest
+
+
+def _remove_matrix(path: Path, keep: Optional[Path] = None):
+    """Remove a superseded matrix file; readers that mapped it keep their pages."""
+    if path == keep or not path.exists():
+        return
+    try:
+        path.unlink()
+    except OSError as e:
+        logger.warning(f"Could not remove superseded vector store matrix {path}: {e}")
+
+
+def read_manifest(stem: Union[str, Path]) -> Optional[VectorStoreManifest]:
+    """
+    Read a vector store manifest without touching the matrix.
+
+    Args:
+        stem: Path without extension
+
+    Returns:
+        Parsed manifest, or None if missing or unreadable
+    """
+    manifest_path = _manifest_path(Path(stem))
+    if not manifest_path.exists():
+        return None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return VectorStoreManifest(**data)
+    except Exception as e:
+        logger.error(f"Failed to read vector store manifest {manifest_path}: {e}")
+        return None
+
+
+def load_vector_store(
+    stem: Union[str, Path],
+    model_name: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    count: Optional[int] = None,
+    upcast: bool = True
+) -> Optional[Tuple[np.ndarray, VectorStoreManifest]]:
+    """
+    Open a vector store, validating its manifest.
+
+    float32 stores are returned as a read-only memory map; float16 stores
+    are upcast to an in-memory float32 matrix unless upcast is False.
+
+    Args:
+        stem: Path without extension
+        model_name: Expected embedding model, if it should be checked
+        content_hash: Expected content hash, if it should be checked
+        count: Expected number of records, if it should be checked
+        upcast: Convert float16 stores to float32 in memory; callers that
+            only read a few rows at a time (quantized search) pass False
+
+    Returns:
+        Tuple of (matrix, manifest), or None if missing, stale or corrupt
+    """
+    stem = Path(stem)
+    if not _manifest_path(stem).exists():
+        logger.info(f"No vector store found at {stem}")
+        return None
+
+    manifest = read_manifest(stem)
+    if manifest is None:
+        return None
+
+    try:
+        matrix = np.load(_matrix_path(stem, manifest), mmap_mode="r")
+    except FileNotFoundError:
+        # A concurrent save replaced the store between the two reads
+        manifest = read_manifest(stem)
+        if manifest is None:
+            return None
+        try:
+            matrix = np.load(_matrix_path(stem, manifest), mmap_mode="r")
+        except Exception as e:
+            logger.error(f"Failed to open vector store {stem}: {e}")
+            return None
+    except Exception as e:
+        logger.error(f"Failed to open vector store {stem}: {e}")
+        return None
+
+    if manifest.format_version != VECTOR_STORE_FORMAT_VERSION:
+        logger.warning(f"Vector store format {manifest.format_version} is not supported")
+        return None
+    if model_name is not None and manifest.model_name != model_name:
+        logger.warning("Model name mismatch in vector store")
+        return None
+    if count is not None and manifest.count != count:
+        logger.warning("Vector store size mismatch")
+        return None
+    if content_hash is not None and manifest.content_hash != content_hash:
+        logger.warning("Vector store content hash mismatch")
+        return None
+
+    if (matrix.shape != (manifest.count, manifest.dim)
+            or len(manifest.keys) != manifest.count
+            or (manifest.record_hashes and len(manifest.record_hashes) != manifest.count)):
+        logger.warning(f"Vector store {stem} does not match its manifest")
+        return None
+
+    if upcast and matrix.dtype != np.float32:
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    return matrix, manifest
+
+
+def delete_vector_store(stem: Union[str, Path]):
+    """Remove both files of a vector store if they exist."""
+    stem = Path(stem)
+    matrix_path = store_matrix_path(stem)
+    # Unpublish first so readers never see a manifest without its matrix
+    for path in (_manifest_path(stem), matrix_path, _matrix_path(stem)):
+        if path.exists():
+            path.unlink()
@@ -17,6 +17,7 @@ from .physics_tools import (
 )
 from .search import (
     search_physics_rules,
+    search_physics_rules_many,
     filter_rules_by_type,
     rank_rules,
     search_rules_by_particles,
@@ -53,6 +54,7 @@ __all__ = [
     
     # Rules search
     'search_physics_rules',
+    'search_physics_rules_many',
     'filter_rules_by_type',
     'rank_rules',
     'search_rules_by_particles',
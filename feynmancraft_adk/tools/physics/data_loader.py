@@ -3,10 +3,11 @@ Data loading utilities for Physics Rules.
 """
 
 import json
-import os
 from typing import List, Dict, Any, Optional
 import logging
 
+from ...shared_libraries.config import config
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,12 +16,9 @@ def get_rules_data_path() -> str:
     Get the path to the physics rules data file.
     
     Returns:
-        Absolute path to pprules.json
+        Absolute path to pprules.json (ValidationConfig.physics_rules_path)
     """
-    # Navigate from tools/physics to data directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(current_dir, "..", "..", "data", "pprules.json")
-    return os.path.normpath(data_path)
+    return str(config.validation.physics_rules_path)
 
 
 def load_physics_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -2,16 +2,25 @@
 Physics Rules Embedding Manager with singleton pattern.
 """
 
-import os
-import json
-import pickle
 import asyncio
+import threading
 from typing import List, Dict, Any, Optional
 import logging
 from pathlib import Path
 
+from ...shared_libraries.config import config
 from .data_loader import load_physics_rules
-from ..kb.embeddings import get_embedding
+from ..kb.embedding_batcher import EmbeddingBatcher
+from ..kb.embedding_providers import default_embedding_model
+from ..kb.embeddings import build_normalized_matrix
+from ..kb.vector_index import delete_vector_index, open_store_index, quantized_index_stem
+from ..kb.vector_store import (
+    compute_content_hash,
+    delete_vector_store,
+    load_vector_store,
+    save_vector_store,
+    store_stem,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,36 +34,92 @@ class RulesEmbeddingManager:
     """
     
     _instance = None
+    # Created on first use; threads may race to create it
+    _instance_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            # Initialize instance variables
-            cls._instance.physics_rules = []
-            cls._instance.embeddings_cache = {}
-            cls._instance.model_name = "models/text-embedding-004"
-            cls._instance.is_initialized = False
-            cls._instance._lock = asyncio.Lock()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls._create()
         return cls._instance
     
+    @classmethod
+    def _create(cls) -> "RulesEmbeddingManager":
+        """Create a manager with empty state, without making it the singleton."""
+        instance = super().__new__(cls)
+        # Initialize instance variables
+        instance.physics_rules = []
+        instance.embeddings_cache = {}
+        instance.embedding_matrix = None
+        instance._vector_index = None
+        instance._index_lock = threading.Lock()
+        instance.matrix_rule_numbers = []
+        instance.rule_number_to_row = {}
+        instance._rules_by_number = {}
+        instance.model_name = default_embedding_model()
+        instance.is_initialized = False
+        instance._lock = asyncio.Lock()
+        return instance
+    
+    @classmethod
+    def reload(cls) -> "RulesEmbeddingManager":
+        """
+        Re-read the physics rules and swap in a new manager for them.
+        
+        The new manager loads the stored embeddings (or generates them if
+        the store does not match the rules) and builds its vector index
+        before it replaces the singleton; searches holding the previous
+        manager finish on it. Blocks while embedding and must not be called
+        from a running event loop.
+        
+        Returns:
+            The current manager; the previous one if the rules are unchanged
+        """
+        current = cls._instance
+        fresh = cls._create()
+        if current is not None:
+            fresh.model_name = current.model_name
+        fresh._load_rules()
+        
+        if (current is not None and current.is_initialized
+                and fresh.physics_rules == current.physics_rules):
+            logger.info("Physics rules unchanged; keeping the loaded manager")
+            return current
+            
+        if not fresh.load_embeddings():
+            asyncio.run(fresh.generate_embeddings())
+            fresh._build_matrix()
+            fresh.save_embeddings()
+        # Build the search index now rather than on the first query
+        fresh.vector_index
+        fresh.is_initialized = True
+        with cls._instance_lock:
+            cls._instance = fresh
+        logger.info(f"Swapped in physics rules manager with {len(fresh.physics_rules)} rules")
+        return fresh
+    
     @property
     def cache_dir(self) -> Path:
         """Get the cache directory for storing embeddings."""
-        # Navigate from tools/physics to data/embeddings
-        current_dir = Path(__file__).parent
-        cache_dir = current_dir.parent.parent / "data" / "embeddings"
+        cache_dir = config.knowledge_base.embeddings_dir
         cache_dir.mkdir(parents=True, exist_ok=True)
         return cache_dir
     
     @property
-    def cache_file(self) -> Path:
-        """Get the cache file path."""
-        return self.cache_dir / "rules_embeddings.pkl"
+    def store_path(self) -> Path:
+        """Get the vector store path (without extension)."""
+        return store_stem(self.cache_dir, "rules_embeddings", self.model_name)
     
     def reset(self):
         """Reset the manager state. Useful for testing."""
         self.physics_rules = []
         self.embeddings_cache = {}
+        self.embedding_matrix = None
+        self._vector_index = None
+        self.matrix_rule_numbers = []
+        self.rule_number_to_row = {}
+        self._rules_by_number = {}
         self.is_initialized = False
     
     async def initialize(self, force_regenerate: bool = False):
@@ -71,7 +136,7 @@ class RulesEmbeddingManager:
             logger.info("Initializing Physics Rules Embedding Manager...")
             
             # Load physics rules
-            self.physics_rules = load_physics_rules()
+            self._load_rules()
             logger.info(f"Loaded {len(self.physics_rules)} physics rules")
             
             # Try to load cached embeddings
@@ -81,6 +146,7 @@ class RulesEmbeddingManager:
                 
             # Generate embeddings
             await self.generate_embeddings()
+            self._build_matrix()
             
             # Save to cache
             self.save_embeddings()
@@ -88,50 +154,108 @@ class RulesEmbeddingManager:
             self.is_initialized = True
             logger.info("Physics Rules Embedding Manager initialized successfully")
     
-    async def generate_embeddings(self):
-        """Generate embeddings for all physics rules."""
+    def load(self) -> bool:
+        """
+        Load the physics rules and the stored embeddings without generating any.
+        
+        Used to preload a server's master process, where no embedding
+        requests or threads should be started before workers fork.
+        
+        Returns:
+            True if the embeddings store was current and is now loaded
+        """
+        self._load_rules()
+        self.is_initialized = self.load_embeddings()
+        return self.is_initialized
+    
+    def _load_rules(self):
+        """Read the physics rules file and index the rules by number."""
+        self.physics_rules = load_physics_rules()
+        self._rules_by_number = {
+            rule.get("rule_number"): rule for rule in self.physics_rules
+        }
+    
+    async def generate_embeddings(self, progress_callback=None):
+        """
+        Generate embeddings for all physics rules through batched requests.
+        
+        Args:
+            progress_callback: Optional callable receiving (done, total)
+        """
         logger.info("Generating embeddings for physics rules...")
         self.embeddings_cache = {}
         
-        # Create tasks for parallel embedding generation
-        tasks = []
-        for rule in self.physics_rules:
-            rule_number = rule.get("rule_number")
-            content = rule.get("content", "")
-            if rule_number and content:
-                tasks.append(self._generate_single_embedding(rule_number, content))
-        
-        # Execute tasks with concurrency limit
-        semaphore = asyncio.Semaphore(10)  # Limit concurrent API calls
+        embeddable = [
+            rule for rule in self.physics_rules
+            if rule.get("rule_number") and rule.get("content")
+        ]
+        texts = [rule["content"] for rule in embeddable]
+        batcher = EmbeddingBatcher(self.model_name, progress_callback=progress_callback)
+        embeddings = await batcher.aembed(texts)
         
-        async def limited_task(task):
-            async with semaphore:
-                return await task
+        for rule, embedding in zip(embeddable, embeddings):
+            if embedding:
+                self.embeddings_cache[rule["rule_number"]] = embedding
                 
-        limited_tasks = [limited_task(task) for task in tasks]
-        results = await asyncio.gather(*limited_tasks, return_exceptions=True)
+        logger.info(
+            f"Generated {len(self.embeddings_cache)}/{len(embeddable)} rule embeddings "
+            f"in {batcher.requests_sent} requests"
+        )
+    
+    def _content_hash(self) -> str:
+        """Hash the numbers and contents of the embeddable rules, in order."""
+        return compute_content_hash(
+            f"{rule.get('rule_number')}\n{rule.get('content', '')}"
+            for rule in self.physics_rules
+            if rule.get("rule_number") and rule.get("content")
+        )
+    
+    @property
+    def vector_index(self):
+        """
+        Search index over the embedding matrix, built on first use.
         
-        # Process results
-        success_count = 0
-        for result in results:
-            if isinstance(result, tuple) and not isinstance(result, Exception):
-                rule_number, embedding = result
-                if embedding:
-                    self.embeddings_cache[rule_number] = embedding
-                    success_count += 1
-            elif isinstance(result, Exception):
-                logger.error(f"Error generating embedding: {result}")
-                
-        logger.info(f"Generated {success_count}/{len(tasks)} rule embeddings successfully")
+        With KnowledgeBaseConfig.embedding_quantization set, this is an int8
+        or PQ index whose codes are kept next to the vector store and whose
+        rerank reads the store's memory-mapped matrix.
+        """
+        if self._vector_index is None and self.embedding_matrix is not None:
+            with self._index_lock:
+                if self._vector_index is None and self.embedding_matrix is not None:
+                    # Index ids are matrix rows; matrix_rule_numbers maps them to rules
+                    self._vector_index = open_store_index(
+                        self.embedding_matrix, None, self.store_path
+                    )
+        return self._vector_index
     
-    async def _generate_single_embedding(self, rule_number: Any, content: str) -> tuple:
-        """Generate embedding for a single rule."""
-        try:
-            embedding = await asyncio.to_thread(get_embedding, content, self.model_name)
-            return (rule_number, embedding)
-        except Exception as e:
-            logger.error(f"Failed to generate embedding for rule {rule_number}: {e}")
-            return (rule_number, None)
+    def _set_matrix(self, matrix, rule_numbers: List[Any]):
+        """Install a normalized matrix and its row <-> rule_number mappings."""
+        self.embedding_matrix = matrix
+        self.matrix_rule_numbers = rule_numbers
+        self.rule_number_to_row = {
+            rule_number: row for row, rule_number in enumerate(rule_numbers)
+        }
+        self._vector_index = None
+    
+    def _build_matrix(self):
+        """
+        Pack freshly generated rule embeddings into a normalized matrix.
+        
+        The per-rule lists in embeddings_cache are released afterwards.
+        """
+        rule_numbers = [
+            rule_number for rule_number in self._rules_by_number
+            if self.embeddings_cache.get(rule_number)
+        ]
+        vectors = [self.embeddings_cache[rule_number] for rule_number in rule_numbers]
+        
+        if vectors and len({len(v) for v in vectors}) != 1:
+            logger.error("Inconsistent rule embedding dimensions, vector search disabled")
+            rule_numbers, vectors = [], []
+            
+        self._set_matrix(build_normalized_matrix(vectors) if vectors else None, rule_numbers)
+        self.embeddings_cache = {}
+        logger.info(f"Built rule embedding matrix with {len(rule_numbers)} rows")
     
     def get_embedding(self, rule_number: Any) -> Optional[List[float]]:
         """
@@ -143,11 +267,17 @@ class RulesEmbeddingManager:
         Returns:
             Embedding vector or None if not found
         """
-        return self.embeddings_cache.get(rule_number)
+        row = self.rule_number_to_row.get(rule_number)
+        if row is None:
+            return None
+        return self.embedding_matrix[row].tolist()
     
     def get_all_embeddings(self) -> Dict[Any, List[float]]:
         """Get all cached rule embeddings."""
-        return self.embeddings_cache.copy()
+        return {
+            rule_number: self.get_embedding(rule_number)
+            for rule_number in self.matrix_rule_numbers
+        }
     
     def get_rule_by_number(self, rule_number: Any) -> Optional[Dict[str, Any]]:
         """
@@ -159,6 +289,9 @@ class RulesEmbeddingManager:
         Returns:
             Rule dictionary or None if not found
         """
+        if self._rules_by_number:
+            return self._rules_by_number.get(rule_number)
+            
         for rule in self.physics_rules:
             if rule.get("rule_number") == rule_number:
                 return rule
@@ -166,22 +299,31 @@ class RulesEmbeddingManager:
     
     def save_embeddings(self) -> bool:
         """
-        Save embeddings to disk.
+        Save the rule embedding matrix to the on-disk vector store.
         
         Returns:
             True if successful, False otherwise
         """
+        if self.embedding_matrix is None:
+            logger.warning("No rule embeddings to save")
+            return False
+            
         try:
-            cache_data = {
-                'embeddings': self.embeddings_cache,
-                'model_name': self.model_name,
-                'num_rules': len(self.physics_rules)
-            }
+            save_vector_store(
+                self.store_path,
+                self.embedding_matrix,
+                keys=self.matrix_rule_numbers,
+                model_name=self.model_name,
+                content_hash=self._content_hash(),
+                dtype=config.knowledge_base.embedding_storage_dtype,
+            )
+            logger.info(f"Saved rule embeddings to {self.store_path}")
             
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-                
-            logger.info(f"Saved rule embeddings to {self.cache_file}")
+            if config.knowledge_base.embedding_quantization != "none":
+                # Serve the rerank from the store's memory map instead of RAM
+                loaded = load_vector_store(self.store_path, upcast=False)
+                if loaded is not None:
+                    self._set_matrix(loaded[0], self.matrix_rule_numbers)
             return True
         except Exception as e:
             logger.error(f"Failed to save rule embeddings: {e}")
@@ -189,30 +331,32 @@ class RulesEmbeddingManager:
     
     def load_embeddings(self) -> bool:
         """
-        Load embeddings from disk.
+        Load rule embeddings from the on-disk vector store.
+        
+        The store is rejected if its model name or content hash do not
+        match the loaded physics rules.
         
         Returns:
             True if successful, False otherwise
         """
-        if not self.cache_file.exists():
-            logger.info("No rule embeddings cache file found")
-            return False
-            
         try:
-            with open(self.cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-                
-            # Validate cache
-            if cache_data.get('num_rules') != len(self.physics_rules):
-                logger.warning("Rules cache size mismatch, regenerating embeddings")
+            loaded = load_vector_store(
+                self.store_path,
+                model_name=self.model_name,
+                content_hash=self._content_hash(),
+                upcast=config.knowledge_base.embedding_quantization == "none",
+            )
+            if loaded is None:
+                logger.info("No usable rule embeddings store, regenerating embeddings")
                 return False
                 
-            if cache_data.get('model_name') != self.model_name:
-                logger.warning("Model name mismatch, regenerating embeddings")
+            matrix, manifest = loaded
+            if any(rule_number not in self._rules_by_number for rule_number in manifest.keys):
+                logger.warning("Rule embeddings store has unknown rules, regenerating embeddings")
                 return False
                 
-            self.embeddings_cache = cache_data['embeddings']
-            logger.info(f"Loaded {len(self.embeddings_cache)} rule embeddings from cache")
+            self._set_matrix(matrix, list(manifest.keys))
+            logger.info(f"Loaded {manifest.count} rule embeddings from {self.store_path}")
             return True
             
         except Exception as e:
@@ -222,14 +366,16 @@ class RulesEmbeddingManager:
     def clear_cache(self):
         """Clear the embeddings cache from memory and disk."""
         self.embeddings_cache = {}
+        self._set_matrix(None, [])
         self.is_initialized = False
         
-        if self.cache_file.exists():
-            try:
-                self.cache_file.unlink()
-                logger.info("Deleted rule embeddings cache file")
-            except Exception as e:
-                logger.error(f"Failed to delete cache file: {e}")
+        try:
+            delete_vector_store(self.store_path)
+            for method in ("int8", "pq"):
+                delete_vector_index(quantized_index_stem(self.store_path, method))
+            logger.info("Deleted rule embeddings store")
+        except Exception as e:
+            logger.error(f"Failed to delete rule embeddings store: {e}")
     
     def get_rules_by_category(self, category: str) -> List[Dict[str, Any]]:
         """
@@ -270,10 +416,6 @@ class RulesEmbeddingManager:
         return matching_rules
 
 
-# Convenience functions for backward compatibility
-_manager = RulesEmbeddingManager()
-
-
 async def embed_and_cache_rules(force_regenerate: bool = False):
     """
     Generate and cache embeddings for all physics rules.
@@ -281,9 +423,14 @@ async def embed_and_cache_rules(force_regenerate: bool = False):
     Args:
         force_regenerate: If True, regenerate embeddings even if cache exists
     """
-    await _manager.initialize(force_regenerate)
+    await get_rules_manager().initialize(force_regenerate)
 
 
 def get_rules_manager() -> RulesEmbeddingManager:
-    """Get the singleton rules embedding manager instance."""
-    return _manager
\ No newline at end of file
+    """
+    Get the singleton rules embedding manager instance.
+    
+    The instance changes when RulesEmbeddingManager.reload() swaps in a new
+    one, so callers should get it once per operation rather than keep it.
+    """
+    return RulesEmbeddingManager()
\ No newline at end of file
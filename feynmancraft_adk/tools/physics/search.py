@@ -7,7 +7,9 @@ from typing import List, Dict, Any, Optional
 import logging
 
 from .embedding_manager import get_rules_manager
-from ..kb.embeddings import get_embedding, cosine_similarity
+from ..kb.embedding_batcher import EmbeddingBatcher
+from ..kb.embeddings import get_embedding
+from ..kb.fusion import merge_query_hits
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,7 @@ async def search_physics_rules(query: str, top_k: int = 5) -> List[Dict[str, Any
         manager = get_rules_manager()
         await manager.initialize()
         
-        if not manager.physics_rules or not manager.embeddings_cache:
+        if not manager.physics_rules or manager.vector_index is None:
             return [{"error": "Physics rules or embeddings are not available."}]
         
         # Get query embedding
@@ -41,22 +43,14 @@ async def search_physics_rules(query: str, top_k: int = 5) -> List[Dict[str, Any
         if not query_embedding:
             return [{"error": "Failed to get query embedding"}]
         
-        # Calculate similarities
-        similarities = []
-        for rule in manager.physics_rules:
-            rule_number = rule.get("rule_number")
-            if rule_number in manager.embeddings_cache:
-                rule_embedding = manager.embeddings_cache[rule_number]
-                similarity = cosine_similarity(query_embedding, rule_embedding)
-                similarities.append((similarity, rule))
-        
-        # Sort by similarity and return top_k
-        similarities.sort(key=lambda x: x[0], reverse=True)
+        # Score all rules through the exact index, copy only the top_k
+        rows, scores = manager.vector_index.search(query_embedding, top_k)
         
         results = []
-        for similarity, rule in similarities[:top_k]:
+        for row, similarity in zip(rows, scores):
+            rule = manager.get_rule_by_number(manager.matrix_rule_numbers[row])
             result = rule.copy()
-            result["similarity_score"] = similarity
+            result["similarity_score"] = float(similarity)
             results.append(result)
             
         logger.info(f"Found {len(results)} physics rules for query: {query[:50]}...")
@@ -67,6 +61,60 @@ async def search_physics_rules(query: str, top_k: int = 5) -> List[Dict[str, Any
         return [{"error": f"Search failed: {str(e)}"}]
 
 
+async def search_physics_rules_many(queries: List[str], top_k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Semantic search for several physics rule queries at once.
+    
+    All queries (e.g. one per particle or conservation law) are embedded in
+    one batch request and scored with a single matrix-matrix product. The
+    top_k hits of every query are merged so each rule appears once, ordered
+    by reciprocal rank fusion.
+    
+    Args:
+        queries: Natural language queries about physics rules
+        top_k: Number of results per query
+        
+    Returns:
+        Deduplicated physics rules with their best similarity_score and the
+        matched_queries that found them
+    """
+    queries = [q for q in dict.fromkeys(queries or []) if q and q.strip()]
+    if not queries:
+        return [{"error": "No queries given"}]
+        
+    try:
+        manager = get_rules_manager()
+        await manager.initialize()
+        
+        if not manager.physics_rules or manager.vector_index is None:
+            return [{"error": "Physics rules or embeddings are not available."}]
+            
+        embeddings = await EmbeddingBatcher(manager.model_name).aembed(queries)
+        if not any(embeddings):
+            return [{"error": "Failed to get query embeddings"}]
+            
+        # Index ids are matrix rows
+        merged = merge_query_hits([
+            [(int(row), float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in manager.vector_index.search_many(embeddings, top_k)
+        ])
+        
+        results = []
+        for row, similarity, query_indices in merged:
+            rule = manager.get_rule_by_number(manager.matrix_rule_numbers[row])
+            result = rule.copy()
+            result["similarity_score"] = similarity
+            result["matched_queries"] = [queries[i] for i in query_indices]
+            results.append(result)
+            
+        logger.info(f"Found {len(results)} physics rules for {len(queries)} queries")
+        return results
+        
+    except Exception as e:
+        logger.error(f"Error in multi-query physics rules search: {e}")
+        return [{"error": f"Search failed: {str(e)}"}]
+
+
 def filter_rules_by_type(rules: List[Dict[str, Any]], rule_type: str) -> List[Dict[str, Any]]:
     """
     Filter rules by type based on content analysis.
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Keep indexes and caches written by the code under test out of the bundled data directory
+os.environ.setdefault("FEYNMAN_DATA_DIR", tempfile.mkdtemp(prefix="feynman-tests-"))
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from feynmancraft_adk.tools.kb.ingest import iter_json_array
+
+
+@pytest.mark.parametrize("text", [
+    "[]",
+    "[1.5]",
+    "[ 12345 ,\n 6.0 ]",
+    '[1.5, 2e10, -3, "ab,c", true, null, {"a": [1, 2.25]}, [3.75]]',
+])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 64])
+def test_iter_json_array_across_chunk_boundaries(tmp_path, text, chunk_size):
+    path = tmp_path / "kb.json"
+    path.write_text(text, encoding="utf-8")
+    assert list(iter_json_array(path, chunk_size=chunk_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", ["[1 2]", "[1,", "[1.5", "{}"])
+def test_iter_json_array_rejects_invalid(tmp_path, text):
+    path = tmp_path / "kb.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(path, chunk_size=1))
@@ -0,0 +1,83 @@
+import pytest
+
+from feynmancraft_adk.tools.kb.lexical import BM25Index, tokenize
+
+LATEX_RECORDS = [
+    {
+        "reaction": r"e^+ e^- \to \mu^+ \mu^-",
+        "topic": "QED annihilation",
+        "particles": ["electron", "positron", "muon"],
+        "description": "Electron-positron annihilation into a muon pair via a virtual photon.",
+    },
+    {
+        "reaction": r"Z^0 \to l^+ l^-",
+        "topic": "Electroweak decay",
+        "particles": ["Z boson", "lepton"],
+        "description": "Leptonic decay of the Z boson.",
+    },
+    {
+        "reaction": r"g g \to H",
+        "topic": "Higgs production",
+        "particles": ["gluon", "Higgs boson"],
+        "description": "Gluon fusion through a top quark loop.",
+    },
+    {
+        "reaction": r"\pi^0 \to \gamma \gamma",
+        "topic": "Meson decay",
+        "particles": ["pion", "photon"],
+        "description": "Neutral pion decay into two photons.",
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def bm25():
+    return BM25Index(LATEX_RECORDS)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Z boson", 1),
+    ("l^+", 1),
+    ("muon pair", 0),
+    (r"e^+ e^-", 0),
+    ("higgs gluon fusion", 2),
+    (r"\pi^0 decay", 3),
+    ("photon pion", 3),
+])
+def test_bm25_ranks_latex_documents(bm25, query, expected):
+    results = bm25.search(query, k=4)
+    assert results[0][0] == expected
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_bm25_respects_allowed_mask(bm25):
+    results = bm25.search("decay", k=4, allowed=[True, False, False, True])
+    assert [position for position, _ in results] == [3]
+
+
+def test_bm25_no_match(bm25):
+    assert bm25.search("supersymmetry", k=4) == []
+
+
+def test_single_letter_aliases_only_in_math():
+    assert "top" not in tokenize("t-channel photon exchange")
+    assert "top" in tokenize(r"t \bar t", math=True)
+    assert "gluon" in tokenize(r"g_{r\bar{b}}")
+
+
+def test_mangled_json_escapes_in_math_fields():
+    # "\bar" and "\to" written unescaped in JSON arrive as control characters
+    terms = tokenize("g_{r\bar{b}} \to u_b", math=True)
+    assert "bottom" not in terms
+    assert "u_b" in terms
+
+
+def test_colour_labels_do_not_match_bottom():
+    records = LATEX_RECORDS + [{
+        "reaction": "q_r q_b \\to q_b q_r",
+        "topic": "Color charge exchange",
+        "particles": ["q_r", "q_b", "g_{r\bar{b}}"],
+        "description": "Quark scattering with a t-channel gluon.",
+    }]
+    assert BM25Index(records).search("bottom", k=5) == []
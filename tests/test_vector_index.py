@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from feynmancraft_adk.tools.kb.vector_index import (
+    AnnoyVectorIndex,
+    ExactIndex,
+    HNSWIndex,
+    Int8Index,
+    PQIndex,
+    load_vector_index,
+    save_vector_index,
+)
+
+DIM = 32
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    """Clustered vectors and queries; closer to real embeddings than isotropic noise."""
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(20, DIM))
+    matrix = centers[rng.integers(0, 20, 1000)] + 0.5 * rng.normal(size=(1000, DIM))
+    queries = centers[rng.integers(0, 20, 50)] + 0.5 * rng.normal(size=(50, DIM))
+    return matrix.astype(np.float32), queries.astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def exact(vectors):
+    index = ExactIndex(DIM)
+    index.build(vectors[0])
+    return index
+
+
+def _recall(index, exact, queries, k=10):
+    hits = [
+        len(set(index.search(query, k)[0]) & set(exact.search(query, k)[0]))
+        for query in queries
+    ]
+    return sum(hits) / (k * len(queries))
+
+
+@pytest.mark.parametrize("index, min_recall", [
+    (AnnoyVectorIndex(DIM, n_trees=20), 0.9),
+    (HNSWIndex(DIM), 0.85),
+    (PQIndex(DIM, m=8), 0.9),
+    (Int8Index(DIM), 0.95),
+])
+def test_recall_against_exact(vectors, exact, index, min_recall):
+    matrix, queries = vectors
+    index.build(matrix)
+    assert _recall(index, exact, queries) >= min_recall
+
+
+@pytest.mark.parametrize("index", [
+    ExactIndex(DIM), AnnoyVectorIndex(DIM), HNSWIndex(DIM), PQIndex(DIM, m=8)
+])
+def test_save_load_round_trip(vectors, tmp_path, index):
+    matrix, queries = vectors
+    ids = np.arange(len(matrix)) + 100
+    index.build(matrix, ids)
+    stem = tmp_path / "index"
+
+    saved = save_vector_index(index, stem, metadata={"content_hash": "abc"})
+    loaded, manifest = load_vector_index(stem)
+
+    assert manifest == saved
+    assert manifest["engine"] == index.engine
+    assert manifest["count"] == len(matrix)
+    assert manifest["dim"] == DIM
+    assert manifest["metadata"] == {"content_hash": "abc"}
+    assert type(loaded) is type(index)
+    np.testing.assert_array_equal(loaded.ids, ids)
+    for query in queries[:5]:
+        np.testing.assert_array_equal(loaded.search(query, 5)[0], index.search(query, 5)[0])
+
+
+def test_save_replaces_payload(vectors, tmp_path):
+    matrix, queries = vectors
+    stem = tmp_path / "index"
+    first = HNSWIndex(DIM)
+    first.build(matrix)
+    save_vector_index(first, stem)
+    loaded, _ = load_vector_index(stem)
+    expected = loaded.search(queries[0], 5)[0]
+
+    second = ExactIndex(DIM)
+    second.build(matrix[:100])
+    manifest = save_vector_index(second, stem)
+
+    files = {path.name for path in tmp_path.iterdir()}
+    assert files == {"index.index.json", f"{manifest['payload']}.ids.npy", f"{manifest['payload']}.vectors.npy"}
+    assert len(load_vector_index(stem)[0]) == 100
+    # Readers of the superseded index keep their mapped payload
+    np.testing.assert_array_equal(loaded.search(queries[0], 5)[0], expected)
+
+
+def test_load_missing_index(tmp_path):
+    assert load_vector_index(tmp_path / "missing") is None
+
+
+@pytest.mark.parametrize("index", [
+    ExactIndex(DIM), AnnoyVectorIndex(DIM), HNSWIndex(DIM), PQIndex(DIM, m=8)
+])
+def test_filtered_search_returns_only_allowed_ids(vectors, index):
+    matrix, queries = vectors
+    index.build(matrix)
+    allowed = np.zeros(len(matrix), dtype=bool)
+    allowed[::7] = True
+
+    for query in queries[:10]:
+        ids, scores = index.search_filtered(query, 10, allowed)
+        assert len(ids) == 10
+        assert allowed[ids].all()
+        assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_filtered_search_with_few_matches(vectors, exact):
+    matrix, queries = vectors
+    allowed = np.zeros(len(matrix), dtype=bool)
+    allowed[[3, 500]] = True
+
+    ids, _ = exact.search_filtered(queries[0], 10, allowed)
+    assert sorted(ids) == [3, 500]
+    assert len(exact.search_filtered(queries[0], 10, np.zeros(len(matrix), dtype=bool))[0]) == 0